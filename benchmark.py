@@ -0,0 +1,344 @@
+"""
+Benchmark de ponta a ponta do extrator de comprovantes.
+
+Gera PDFs sintéticos de comprovantes ("Dados da Conta Creditada") e a planilha de
+funcionários correspondente em várias escalas, executa o pipeline completo pelo modo
+linha de comando (get_proof.py run) e mede páginas/s, comprovantes/s e o pico de memória.
+Os resultados são salvos em JSON para comparar versões na mesma máquina:
+
+    python benchmark.py --escalas 500,2000,5000
+    python benchmark.py --escalas 5000 --workers 4 --comparar resultados_benchmark_ANTERIOR.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import tempfile
+import platform
+import subprocess
+
+import pandas as pd
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+GET_PROOF = os.path.join(SCRIPT_DIR, "get_proof.py")
+
+SOBRENOMES = ["SILVA", "SANTOS", "OLIVEIRA", "SOUZA", "PEREIRA", "COSTA", "RODRIGUES", "ALMEIDA",
+              "NASCIMENTO", "LIMA", "ARAUJO", "FERREIRA", "CARVALHO", "GOMES", "MARTINS", "ROCHA"]
+PRENOMES = ["ANA", "JOAO", "MARIA", "JOSE", "PAULO", "CARLOS", "LUCAS", "JULIANA", "FERNANDA",
+            "MARCOS", "PATRICIA", "RAFAEL", "BRUNA", "DIEGO", "CAMILA", "RENATO"]
+
+
+# ==================== GERAÇÃO DE PDFS ====================
+
+def _pdf_text(texto):
+    """Texto como string literal de PDF (WinAnsi)"""
+    texto = texto.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return "(" + texto + ")"
+
+
+def write_pdf(path, paginas):
+    """
+    Grava um PDF simples (Helvetica, uma stream de texto por página) sem dependências.
+    paginas: lista de páginas, cada uma uma lista de (x, y, texto).
+    """
+    objetos = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    filhos = []
+    for linhas in paginas:
+        conteudo = " ".join(f"BT /F1 10 Tf {x} {y} Td {_pdf_text(texto)} Tj ET" for x, y, texto in linhas)
+        dados = conteudo.encode("cp1252", "replace")
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(dados) + dados + b"\nendstream")
+        objetos.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objetos))
+        filhos.append(len(objetos))
+    objetos[1] = (b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % f for f in filhos) +
+                  b"] /Count %d >>" % len(filhos))
+
+    saida = bytearray(b"%PDF-1.4\n")
+    posicoes = []
+    for numero, objeto in enumerate(objetos, 1):
+        posicoes.append(len(saida))
+        saida += b"%d 0 obj\n" % numero + objeto + b"\nendobj\n"
+    xref = len(saida)
+    saida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    for posicao in posicoes:
+        saida += b"%010d 00000 n \n" % posicao
+    saida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(bytes(saida))
+
+
+def _blocos(y, blocos):
+    """Empilha linhas de texto (x fixo) a partir da altura y"""
+    linhas = []
+    for texto in blocos:
+        linhas.append((50, y, texto))
+        y -= 14
+    return linhas
+
+
+def layout_padrao(c):
+    """Pagador em cima e conta creditada logo abaixo, agência e conta em linhas separadas"""
+    return _blocos(780, [
+        "Comprovante de Transferencia",
+        "Dados do pagador", "Nome: EMPRESA EXEMPLO LTDA", "Agencia: 0001 Conta: 99999-9",
+        "Dados da conta creditada", f"Nome: {c['nome']}", f"Agencia: {c['agencia']}",
+        f"Conta corrente: {c['conta']}",
+        "Dados da transferencia", f"Valor: R$ {c['valor']}", "Data da operacao: 05/10/2026",
+    ])
+
+
+def layout_favorecido(c):
+    """Seção 'Favorecido' com agência e conta na mesma linha"""
+    return _blocos(760, [
+        "COMPROVANTE DE PAGAMENTO - TED",
+        "Favorecido", f"Nome do favorecido: {c['nome']}",
+        f"Agencia/Conta: {c['agencia']} / {c['conta']}",
+        f"Valor: R$ {c['valor']}",
+        "Dados do pagador", "EMPRESA EXEMPLO LTDA - Agencia 0001 Conta 99999-9",
+        "Autenticacao: " + c['autenticacao'],
+    ])
+
+
+def layout_rodape(c):
+    """Conta creditada na metade de baixo da página, depois de um bloco longo de outros dados"""
+    linhas = _blocos(800, ["Comprovante de Transferencia entre Contas", "Dados do pagador",
+                           "Nome: EMPRESA EXEMPLO LTDA", "Agencia: 0001 Conta: 99999-9"] +
+                     [f"Informacao complementar {i}: {c['autenticacao'][:12]}" for i in range(12)])
+    linhas += _blocos(360, [
+        "Dados da conta creditada", f"Nome: {c['nome']}",
+        f"Agencia: {c['agencia']}   Conta: {c['conta']}",
+        "Dados da transferencia", f"Valor: R$ {c['valor']}",
+    ])
+    return linhas
+
+
+def layout_sem_secao(c):
+    """Página que não é um comprovante (capa, aviso, página em branco com rodapé)"""
+    return _blocos(780, ["Relatorio de pagamentos do periodo", f"Pagina de controle {c['autenticacao'][:8]}"])
+
+
+LAYOUTS = {
+    'padrao': layout_padrao,
+    'favorecido': layout_favorecido,
+    'rodape': layout_rodape,
+}
+
+
+def generate_scenario(pasta, paginas, paginas_por_pdf=500, layouts=tuple(LAYOUTS), taxa_invertida=0.1,
+                      taxa_sem_dv=0.1, taxa_sem_match=0.05, seed=1):
+    """
+    Gera pasta/pdfs/*.pdf e pasta/planilha.xlsx com cerca de `paginas` páginas.
+
+    Cada funcionário da planilha tem um comprovante em um dos layouts. Uma fração das linhas
+    da planilha tem agência e conta invertidas (taxa_invertida) ou a conta sem dígito
+    verificador (taxa_sem_dv), e uma fração das páginas não casa com a planilha
+    (taxa_sem_match: comprovantes de quem não está na planilha e páginas sem seção).
+    Retorna {'pdfs', 'paginas', 'funcionarios', 'pasta_pdfs', 'planilha'}.
+    """
+    rnd = random.Random(seed)
+    pasta_pdfs = os.path.join(pasta, "pdfs")
+    os.makedirs(pasta_pdfs, exist_ok=True)
+
+    sem_match = int(paginas * taxa_sem_match)
+    n_funcionarios = max(1, paginas - sem_match)
+    linhas_planilha = []
+    paginas_pdf = []
+    for i in range(paginas):
+        comprovante = {
+            'nome': f"{rnd.choice(PRENOMES)} {i:05d} {rnd.choice(SOBRENOMES)}",
+            'agencia': f"{rnd.randint(1, 9999):04d}",
+            'conta': f"{rnd.randint(10000, 9999999)}-{rnd.randint(0, 9)}",
+            'valor': f"{rnd.randint(1000, 9999)},{rnd.randint(0, 99):02d}",
+            'autenticacao': "".join(rnd.choice("0123456789ABCDEF") for _ in range(32)),
+        }
+        if i >= n_funcionarios:
+            # Sem funcionário na planilha: comprovante de terceiro ou página sem seção
+            layout = layout_sem_secao if i % 2 else LAYOUTS[rnd.choice(layouts)]
+            paginas_pdf.append(layout(comprovante))
+            continue
+        paginas_pdf.append(LAYOUTS[rnd.choice(layouts)](comprovante))
+        agencia, conta = comprovante['agencia'], comprovante['conta']
+        if rnd.random() < taxa_sem_dv:
+            conta = conta.split("-")[0]
+        if rnd.random() < taxa_invertida:
+            agencia, conta = conta, agencia
+        linhas_planilha.append({
+            'Nome': comprovante['nome'],
+            'Agencia': agencia,
+            'Conta': conta,
+            'Descrição Ccusto': f"CC{i % 20:02d}",
+        })
+
+    rnd.shuffle(paginas_pdf)
+    n_pdfs = 0
+    for inicio in range(0, len(paginas_pdf), paginas_por_pdf):
+        write_pdf(os.path.join(pasta_pdfs, f"lote_{n_pdfs:03d}.pdf"), paginas_pdf[inicio:inicio + paginas_por_pdf])
+        n_pdfs += 1
+
+    planilha = os.path.join(pasta, "planilha.xlsx")
+    pd.DataFrame(linhas_planilha).to_excel(planilha, index=False)
+    return {'pdfs': n_pdfs, 'paginas': paginas, 'funcionarios': len(linhas_planilha),
+            'pasta_pdfs': pasta_pdfs, 'planilha': planilha}
+
+
+# ==================== EXECUÇÃO ====================
+
+def _run_and_measure(cmd):
+    """
+    Executa o comando e retorna (código, stdout, pico_rss_bytes).
+    O pico de memória do processo filho vem de os.wait4 (Linux/macOS); no Windows é None.
+    """
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    if not hasattr(os, "wait4"):
+        saida, _ = proc.communicate()
+        return proc.returncode, saida, None
+    saida = proc.stdout.read()
+    proc.stdout.close()
+    _, status, uso = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status
+    # ru_maxrss: kilobytes no Linux, bytes no macOS
+    pico = uso.ru_maxrss if sys.platform == "darwin" else uso.ru_maxrss * 1024
+    return proc.returncode, saida, pico
+
+
+def run_scenario(cenario, pasta, workers=1, extrator='auto'):
+    """Processa o cenário com get_proof.py run (caches e histórico novos) e retorna as medidas"""
+    estado = os.path.join(pasta, "estado")
+    os.makedirs(estado, exist_ok=True)
+    saida = os.path.join(pasta, "saida")
+    cmd = [sys.executable, GET_PROOF, "run",
+           "--pdfs", cenario['pasta_pdfs'], "--roster", cenario['planilha'], "--out", saida,
+           "--workers", str(workers), "--extrator", extrator, "--force",
+           "--history", os.path.join(estado, "historico.json"),
+           "--cache", os.path.join(estado, "cache_paginas.sqlite"),
+           "--roster-cache", os.path.join(estado, "cache_planilhas"),
+           "--templates", os.path.join(estado, "modelos_layout.json")]
+
+    t0 = time.perf_counter()
+    codigo, stdout, pico_rss = _run_and_measure(cmd)
+    segundos = time.perf_counter() - t0
+
+    resumo = {}
+    for linha in stdout.decode("utf-8", "replace").splitlines():
+        try:
+            evento = json.loads(linha)
+        except ValueError:
+            continue
+        if evento.get('evento') == 'resumo':
+            resumo = evento
+    arquivos = sum(1 for _, _, nomes in os.walk(saida) for nome in nomes if nome.lower().endswith(".pdf"))
+    paginas = resumo.get('paginas', 0)
+    return {
+        'codigo_saida': codigo,
+        'segundos': round(segundos, 3),
+        'paginas': paginas,
+        'comprovantes': arquivos,
+        'paginas_com_match': resumo.get('extraidos', 0),
+        'sem_funcionario': resumo.get('sem_funcionario', 0),
+        'paginas_por_segundo': round(paginas / segundos, 2) if segundos else 0.0,
+        'comprovantes_por_segundo': round(arquivos / segundos, 2) if segundos else 0.0,
+        'pico_rss_mb': round(pico_rss / (1024 * 1024), 1) if pico_rss else None,
+        'tempos': resumo.get('tempos', {}),
+    }
+
+
+def git_version():
+    """Commit atual do repositório (para identificar a versão medida), ou None"""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPT_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(resultados, anterior_path):
+    """Imprime a variação de páginas/s e memória em relação a um resultado salvo antes"""
+    with open(anterior_path, 'r', encoding='utf-8') as f:
+        anterior = {r['escala']: r for r in json.load(f).get('resultados', [])}
+    print(f"\nComparação com {os.path.basename(anterior_path)}:")
+    for r in resultados:
+        a = anterior.get(r['escala'])
+        if not a or not a.get('paginas_por_segundo'):
+            print(f"  {r['escala']:>6} páginas: sem referência")
+            continue
+        variacao = (r['paginas_por_segundo'] / a['paginas_por_segundo'] - 1) * 100
+        memoria = ""
+        if r.get('pico_rss_mb') and a.get('pico_rss_mb'):
+            memoria = f", memória {r['pico_rss_mb'] - a['pico_rss_mb']:+.1f} MB"
+        print(f"  {r['escala']:>6} páginas: {a['paginas_por_segundo']} -> {r['paginas_por_segundo']} pág/s "
+              f"({variacao:+.1f}%){memoria}")
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark de ponta a ponta do extrator de comprovantes")
+    parser.add_argument('--escalas', default='500,2000,5000', help='Total de páginas de cada cenário (separados por vírgula)')
+    parser.add_argument('--paginas-por-pdf', type=int, default=500, help='Páginas em cada PDF gerado')
+    parser.add_argument('--layouts', default=','.join(LAYOUTS), help=f"Layouts dos comprovantes ({', '.join(LAYOUTS)})")
+    parser.add_argument('--invertidas', type=float, default=0.1, help='Fração da planilha com agência/conta invertidas')
+    parser.add_argument('--sem-dv', type=float, default=0.1, help='Fração da planilha com conta sem dígito verificador')
+    parser.add_argument('--sem-match', type=float, default=0.05, help='Fração das páginas sem funcionário na planilha')
+    parser.add_argument('--workers', type=int, default=1, help='Processos de extração (get_proof.py run --workers)')
+    parser.add_argument('--extrator', default='auto', help='Modo de extração (get_proof.py run --extrator)')
+    parser.add_argument('--seed', type=int, default=1, help='Semente dos dados sintéticos')
+    parser.add_argument('--pasta', default=None, help='Pasta de trabalho (padrão: temporária, apagada no fim)')
+    parser.add_argument('--saida', default=None, help='Arquivo JSON dos resultados (padrão: resultados_benchmark_AAAAMMDD_HHMMSS.json)')
+    parser.add_argument('--comparar', default=None, help='JSON de um benchmark anterior para comparar')
+    args = parser.parse_args(argv)
+
+    escalas = [int(e) for e in args.escalas.split(',') if e.strip()]
+    layouts = [l.strip() for l in args.layouts.split(',') if l.strip()]
+    desconhecidos = [l for l in layouts if l not in LAYOUTS]
+    if desconhecidos:
+        parser.error(f"layouts desconhecidos: {', '.join(desconhecidos)}")
+
+    raiz = args.pasta or tempfile.mkdtemp(prefix="benchmark_comprovantes_")
+    resultados = []
+    try:
+        for escala in escalas:
+            pasta = os.path.join(raiz, f"escala_{escala}")
+            if os.path.exists(pasta):
+                shutil.rmtree(pasta)
+            t0 = time.perf_counter()
+            cenario = generate_scenario(pasta, escala, args.paginas_por_pdf, layouts, args.invertidas,
+                                        args.sem_dv, args.sem_match, args.seed)
+            geracao = time.perf_counter() - t0
+            print(f"📄 {escala} páginas: {cenario['pdfs']} PDFs, {cenario['funcionarios']} funcionários "
+                  f"(gerado em {geracao:.1f}s)")
+            medida = run_scenario(cenario, pasta, args.workers, args.extrator)
+            medida.update({'escala': escala, 'pdfs': cenario['pdfs'], 'funcionarios': cenario['funcionarios']})
+            resultados.append(medida)
+            rss = f"{medida['pico_rss_mb']} MB" if medida['pico_rss_mb'] is not None else "n/d"
+            print(f"   ⏱️ {medida['segundos']}s | {medida['paginas_por_segundo']} pág/s | "
+                  f"{medida['comprovantes_por_segundo']} comprovantes/s | pico RSS {rss}"
+                  + ("" if medida['codigo_saida'] == 0 else f" | ❌ código {medida['codigo_saida']}"))
+    finally:
+        if not args.pasta:
+            shutil.rmtree(raiz, ignore_errors=True)
+
+    relatorio = {
+        'data': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'versao': git_version(),
+        'maquina': {'plataforma': platform.platform(), 'python': platform.python_version(),
+                    'cpus': os.cpu_count()},
+        'parametros': {'paginas_por_pdf': args.paginas_por_pdf, 'layouts': layouts,
+                       'invertidas': args.invertidas, 'sem_dv': args.sem_dv, 'sem_match': args.sem_match,
+                       'workers': args.workers, 'extrator': args.extrator, 'seed': args.seed},
+        'resultados': resultados,
+    }
+    saida = args.saida or f"resultados_benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Resultados salvos em {saida}")
+
+    if args.comparar:
+        compare(resultados, args.comparar)
+    return 0 if all(r['codigo_saida'] == 0 for r in resultados) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
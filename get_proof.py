@@ -10,6 +10,18 @@ import shutil
 import subprocess
 import platform
 import unicodedata
+import hashlib
+import sqlite3
+import zlib
+import io
+import pickle
+import multiprocessing
+import queue
+import contextlib
+import difflib
+import tracemalloc
+from collections import Counter, OrderedDict, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 try:
     import pandas as pd
@@ -29,20 +41,28 @@ except ImportError:
     os.system("pip install pdfplumber")
     import pdfplumber
 
-try:
-    import tkinter as tk
-    from tkinter import ttk, filedialog, messagebox, scrolledtext
-    from PIL import Image, ImageTk
-except ImportError:
+# Comandos do modo linha de comando: não carregam a interface gráfica (tkinter/PIL)
+CLI_COMMANDS = ('run',)
+HEADLESS = len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS
+
+tk = ttk = filedialog = messagebox = scrolledtext = None
+Image = None
+ImageTk = None
+if not HEADLESS:
     try:
         import tkinter as tk
         from tkinter import ttk, filedialog, messagebox, scrolledtext
-        # PIL not available, will work without logo
-        Image = None
-        ImageTk = None
+        from PIL import Image, ImageTk
     except ImportError:
-        print("Erro: tkinter não instalado")
-        sys.exit(1)
+        try:
+            import tkinter as tk
+            from tkinter import ttk, filedialog, messagebox, scrolledtext
+            # PIL not available, will work without logo
+            Image = None
+            ImageTk = None
+        except ImportError:
+            # Sem tkinter: apenas o modo linha de comando funciona
+            tk = None
 
 
 # ==================== RESOURCE PATH HELPER ====================
@@ -591,6 +611,668 @@ class UploadCompleteDialog:
             messagebox.showerror("Erro", f"Erro ao salvar relatório: {e}")
 
 
+# ==================== CACHE DE PÁGINAS ====================
+
+# Modos de extração de texto (ver iter_page_records):
+#   auto       -> backend rápido (PyPDF2) e pdfplumber só nas páginas em que o rápido não basta
+#   rapido     -> só PyPDF2
+#   pdfplumber -> só pdfplumber (análise de layout completa, mais lento)
+EXTRACTION_MODES = ('auto', 'rapido', 'pdfplumber')
+DEFAULT_EXTRACTOR = 'auto'
+
+# Versão do extrator: incrementar sempre que mudar a extração ou os campos derivados
+# de cada página, para invalidar automaticamente o cache gravado por versões anteriores
+EXTRACTOR_VERSION = 4
+
+
+class PageCache:
+    """
+    Cache persistente (SQLite) das páginas extraídas de cada PDF.
+    
+    A chave é o hash do CONTEÚDO do PDF + versão do extrator + modo de extração, então o
+    mesmo arquivo renomeado/copiado aproveita o cache e um arquivo editado é extraído de novo.
+    Cada documento é gravado como um único registro (JSON comprimido com zlib).
+    """
+    
+    def __init__(self, db_path="cache_paginas.sqlite"):
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self.pages_hit = 0
+        self.pages_miss = 0
+        self._lock = threading.Lock()
+        self.enabled = True
+        try:
+            with self._connect() as conn:
+                # Cache de versões antigas (sem o modo de extração na chave) é descartado
+                colunas = [row[1] for row in conn.execute("PRAGMA table_info(paginas)")]
+                if colunas and 'extrator' not in colunas:
+                    conn.execute("DROP TABLE paginas")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS paginas (
+                        doc_hash TEXT NOT NULL,
+                        versao INTEGER NOT NULL,
+                        extrator TEXT NOT NULL,
+                        total_paginas INTEGER NOT NULL,
+                        dados BLOB NOT NULL,
+                        criado_em TEXT,
+                        PRIMARY KEY (doc_hash, versao, extrator)
+                    )
+                """)
+        except Exception as e:
+            print(f"Cache de páginas desativado: {e}")
+            self.enabled = False
+    
+    def _connect(self):
+        # Uma conexão por operação: seguro entre threads (worker, busca assistida)
+        return sqlite3.connect(self.db_path, timeout=30)
+    
+    def content_hash(self, pdf_path):
+        """Hash SHA-256 do conteúdo do PDF (o mesmo do histórico; ver cached_full_pdf_hash)"""
+        try:
+            return cached_full_pdf_hash(pdf_path)
+        except OSError:
+            return None
+    
+    def get(self, pdf_path, extrator=DEFAULT_EXTRACTOR):
+        """Retorna o dicionário de páginas do cache ou None (contabiliza acerto/falha)"""
+        if not self.enabled:
+            return None
+        doc_hash = self.content_hash(pdf_path)
+        row = None
+        if doc_hash:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT dados FROM paginas WHERE doc_hash = ? AND versao = ? AND extrator = ?",
+                        (doc_hash, EXTRACTOR_VERSION, extrator)).fetchone()
+            except Exception as e:
+                print(f"Erro ao ler cache de páginas: {e}")
+                row = None
+        
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        
+        try:
+            page_list = json.loads(zlib.decompress(row[0]).decode('utf-8'))
+        except Exception:
+            with self._lock:
+                self.misses += 1
+            return None
+        
+        pages = {i: PageRecord.from_cache(data) for i, data in enumerate(page_list)}
+        with self._lock:
+            self.hits += 1
+            self.pages_hit += len(pages)
+        return pages
+    
+    def has(self, pdf_path, extrator=DEFAULT_EXTRACTOR):
+        """
+        Indica se o PDF já está no cache, sem ler os dados.
+        Um PDF ausente conta como falha (vai ser extraído); o acerto é contado no get().
+        """
+        if not self.enabled:
+            return False
+        found = False
+        doc_hash = self.content_hash(pdf_path)
+        if doc_hash:
+            try:
+                with self._connect() as conn:
+                    found = conn.execute(
+                        "SELECT 1 FROM paginas WHERE doc_hash = ? AND versao = ? AND extrator = ?",
+                        (doc_hash, EXTRACTOR_VERSION, extrator)).fetchone() is not None
+            except Exception:
+                found = False
+        if not found:
+            with self._lock:
+                self.misses += 1
+        return found
+    
+    def put(self, pdf_path, pages, extrator=DEFAULT_EXTRACTOR):
+        """Grava as páginas extraídas de um PDF no cache"""
+        if not self.enabled:
+            return
+        doc_hash = self.content_hash(pdf_path)
+        if not doc_hash:
+            return
+        with self._lock:
+            self.pages_miss += len(pages)
+        try:
+            page_list = [pages[i].to_cache() for i in sorted(pages)]
+            blob = zlib.compress(json.dumps(page_list, ensure_ascii=False).encode('utf-8'), 6)
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO paginas (doc_hash, versao, extrator, total_paginas, dados, criado_em) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (doc_hash, EXTRACTOR_VERSION, extrator, len(page_list), sqlite3.Binary(blob),
+                     time.strftime('%d/%m/%Y %H:%M:%S')))
+        except Exception as e:
+            print(f"Erro ao gravar cache de páginas: {e}")
+    
+    def reset_stats(self):
+        """Zera os contadores de acerto/falha (início de cada processamento)"""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.pages_hit = 0
+            self.pages_miss = 0
+    
+    def stats_text(self):
+        """Resumo legível dos acertos/falhas do cache"""
+        with self._lock:
+            return (f"{self.hits} acerto(s) ({self.pages_hit} págs) | "
+                    f"{self.misses} falha(s) ({self.pages_miss} págs extraídas)")
+
+
+# ==================== ÍNDICE DE BUSCA ====================
+
+# Incrementar quando mudar o que é indexado de cada página
+SEARCH_INDEX_VERSION = 3
+# Consultas recentes memorizadas (a memória é descartada sempre que o índice muda)
+SEARCH_MEMO_SIZE = 256
+# O tokenizador de trigramas do FTS5 só consulta termos com 3+ caracteres
+SEARCH_MIN_TERM = 3
+# Busca aproximada de nomes: semelhança mínima de uma palavra e da média do nome inteiro
+FUZZY_TERM_MIN_SIMILARITY = 0.75
+FUZZY_NAME_MIN_SCORE = 0.75
+# Palavras candidatas por parte do nome (as de maior sobreposição de trigramas)
+FUZZY_MAX_TERMS = 200
+
+_NAME_TOKEN_RE = re.compile(r'\b[A-Z]{3,}\b')
+
+
+def name_trigrams(termo):
+    """Trigramas de uma palavra, com espaço nas pontas (' SI', 'SIL', ..., 'VA ')"""
+    padded = f" {termo} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def name_tokens(page_data):
+    """Palavras (3+ letras) da seção creditada da página, ou do texto inteiro se não houver seção"""
+    return set(_NAME_TOKEN_RE.findall(page_data.credited_norm_text or page_data.norm_text))
+
+
+def search_row(page_num, page_data):
+    """
+    Linha do índice de busca para uma página: (página, texto, texto normalizado, dígitos, palavras).
+    Registros sem o texto inteiro (PageRecord com texto_completo=False) entram pela seção creditada.
+    """
+    if page_data.text is not None:
+        return page_num, page_data.text, page_data.norm_text, page_data.numbers, name_tokens(page_data)
+    return (page_num, page_data.credited_section, page_data.credited_norm_text, page_data.credited_numbers,
+            name_tokens(page_data))
+
+
+def search_row_is_full(page_data, modelos=None):
+    """
+    Indica se a linha do índice (search_row) cobre a página inteira: o registro guarda o texto
+    completo e não veio do pdfplumber recortado pelos modelos de layout (só a seção creditada).
+    """
+    return page_data.text is not None and (modelos is None or page_data.extrator != 'pdfplumber')
+
+
+class SearchIndex:
+    """
+    Índice de texto completo (SQLite FTS5) das páginas dos PDFs, usado pela busca assistida.
+    
+    Cada página guarda o texto original (para o trecho exibido), o texto normalizado e os dígitos;
+    os dois últimos ficam no FTS5 com tokenizador de trigramas, que busca por trecho como o `in`.
+    As palavras da seção creditada também entram num índice invertido de trigramas (termos ->
+    trigramas -> páginas), usado para achar nomes com erro de digitação sem varrer as páginas.
+    Um PDF só é (re)indexado quando é novo ou mudou (tamanho/data e, se preciso, hash do conteúdo),
+    e as consultas recentes ficam memorizadas até o índice mudar. Um PDF indexado pelo
+    processamento só com parte do texto (completo=0, ex: páginas recortadas pelos modelos de
+    layout) é indexado de novo, com as páginas inteiras, na próxima update().
+    """
+    
+    def __init__(self, db_path="indice_busca.sqlite", page_cache=None):
+        self.db_path = db_path
+        self.page_cache = page_cache
+        self.generation = 0
+        self._lock = threading.Lock()  # uma atualização por vez
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+        self.enabled = True
+        try:
+            with self._connect() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS documentos (
+                        caminho TEXT PRIMARY KEY,
+                        tamanho INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL,
+                        doc_hash TEXT,
+                        versao INTEGER NOT NULL,
+                        extrator TEXT NOT NULL,
+                        total_paginas INTEGER NOT NULL,
+                        indexado_em TEXT,
+                        completo INTEGER NOT NULL DEFAULT 1
+                    )
+                """)
+                colunas = [row[1] for row in conn.execute("PRAGMA table_info(documentos)")]
+                if 'completo' not in colunas:
+                    conn.execute("ALTER TABLE documentos ADD COLUMN completo INTEGER NOT NULL DEFAULT 1")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS paginas (
+                        id INTEGER PRIMARY KEY,
+                        caminho TEXT NOT NULL,
+                        pagina INTEGER NOT NULL,
+                        texto TEXT,
+                        texto_norm TEXT,
+                        numeros TEXT
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS paginas_caminho ON paginas (caminho)")
+                conn.execute("CREATE TABLE IF NOT EXISTS termos (id INTEGER PRIMARY KEY, termo TEXT UNIQUE NOT NULL)")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS termo_trigramas (
+                        trigrama TEXT NOT NULL,
+                        termo_id INTEGER NOT NULL,
+                        PRIMARY KEY (trigrama, termo_id)
+                    ) WITHOUT ROWID
+                """)
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS termo_paginas (
+                        termo_id INTEGER NOT NULL,
+                        pagina_id INTEGER NOT NULL,
+                        PRIMARY KEY (termo_id, pagina_id)
+                    ) WITHOUT ROWID
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS termo_paginas_pagina ON termo_paginas (pagina_id)")
+                conn.execute("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS paginas_fts USING fts5(
+                        texto_norm, numeros, content='paginas', content_rowid='id', tokenize='trigram'
+                    )
+                """)
+                # Mantém o FTS5 em dia com a tabela de conteúdo
+                conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS paginas_ai AFTER INSERT ON paginas BEGIN
+                        INSERT INTO paginas_fts (rowid, texto_norm, numeros)
+                        VALUES (new.id, new.texto_norm, new.numeros);
+                    END
+                """)
+                conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS paginas_ad AFTER DELETE ON paginas BEGIN
+                        INSERT INTO paginas_fts (paginas_fts, rowid, texto_norm, numeros)
+                        VALUES ('delete', old.id, old.texto_norm, old.numeros);
+                    END
+                """)
+                conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS paginas_ad_termos AFTER DELETE ON paginas BEGIN
+                        DELETE FROM termo_paginas WHERE pagina_id = old.id;
+                    END
+                """)
+        except Exception as e:
+            print(f"Índice de busca desativado: {e}")
+            self.enabled = False
+    
+    def _connect(self):
+        # Uma conexão por operação: seguro entre threads (pré-indexação e buscas)
+        return sqlite3.connect(self.db_path, timeout=30)
+    
+    @staticmethod
+    def _content_hash(pdf_path):
+        try:
+            return cached_full_pdf_hash(pdf_path)
+        except OSError:
+            return None
+    
+    def _invalidate(self):
+        with self._memo_lock:
+            self.generation += 1
+            self._memo.clear()
+    
+    def update(self, pdf_paths, extrator=DEFAULT_EXTRACTOR, log=print):
+        """
+        Indexa os PDFs novos ou alterados da lista (os demais só custam um os.stat).
+        Os PDFs processados já chegam indexados pelo pipeline (add_document); aqui só entram os
+        que nunca passaram pelo processamento, mudaram depois dele ou foram indexados só com
+        parte do texto (páginas recortadas pelos modelos de layout). Cada PDF é gravado numa
+        transação própria, assim que termina de ser lido. Retorna quantos PDFs foram (re)indexados.
+        """
+        if not self.enabled:
+            return 0
+        atualizados = 0
+        with self._lock:
+            for pdf_path in pdf_paths:
+                caminho = os.path.abspath(pdf_path)
+                try:
+                    stat = os.stat(caminho)
+                except OSError:
+                    continue
+                try:
+                    atual, doc_hash = self._is_current(caminho, stat, extrator)
+                    if atual:
+                        continue
+                    linhas = [search_row(page_num, page_data) for page_num, page_data
+                              in iter_pdf_pages(caminho, cache=self.page_cache, extrator=extrator)]
+                    self._write_document(caminho, stat, doc_hash, extrator, linhas)
+                    atualizados += 1
+                    self._invalidate()
+                except Exception as e:
+                    log(f"⚠️ Erro ao indexar {os.path.basename(caminho)}: {e}")
+        return atualizados
+    
+    def _is_current(self, caminho, stat, extrator, completo=True):
+        """
+        (já indexado com este conteúdo?, hash do conteúdo ou None se não foi preciso calcular)
+        completo=True só aceita documentos indexados com as páginas inteiras.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT tamanho, mtime_ns, doc_hash, versao, extrator, completo FROM documentos WHERE caminho = ?",
+                (caminho,)).fetchone()
+        mesmo_modo = (row is not None and row[3] == SEARCH_INDEX_VERSION and row[4] == extrator and
+                      (row[5] or not completo))
+        if mesmo_modo and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return True, row[2]
+        
+        doc_hash = self._content_hash(caminho)
+        if mesmo_modo and doc_hash and row[2] == doc_hash:
+            # Só a data mudou (arquivo copiado/tocado): o conteúdo indexado continua valendo
+            with self._connect() as conn:
+                conn.execute("UPDATE documentos SET tamanho = ?, mtime_ns = ? WHERE caminho = ?",
+                             (stat.st_size, stat.st_mtime_ns, caminho))
+            return True, doc_hash
+        return False, doc_hash
+    
+    def needs_update(self, pdf_path, extrator=DEFAULT_EXTRACTOR, completo=True):
+        """
+        Indica se o PDF ainda não está no índice (ou mudou desde que foi indexado).
+        completo=False: quem pergunta só teria parte do texto, e um documento já indexado com
+        parte do texto também serve.
+        """
+        if not self.enabled:
+            return False
+        try:
+            return not self._is_current(os.path.abspath(pdf_path), os.stat(pdf_path), extrator, completo)[0]
+        except Exception:
+            return False
+    
+    def add_document(self, pdf_path, linhas, extrator=DEFAULT_EXTRACTOR, log=print, completo=True):
+        """
+        Grava no índice as páginas de um PDF que acabou de ser processado (linhas de search_row),
+        sem ler o PDF de novo. Substitui o que havia do mesmo arquivo.
+        completo=False se alguma linha tem só a seção creditada (ver search_row_is_full).
+        """
+        if not self.enabled:
+            return
+        caminho = os.path.abspath(pdf_path)
+        with self._lock:
+            try:
+                self._write_document(caminho, os.stat(caminho), self._content_hash(caminho), extrator, linhas,
+                                     completo)
+            except Exception as e:
+                log(f"⚠️ Erro ao indexar {os.path.basename(caminho)}: {e}")
+                return
+        self._invalidate()
+    
+    def _write_document(self, caminho, stat, doc_hash, extrator, linhas, completo=True):
+        with self._connect() as conn:
+            antigos = self._remove_pages(conn, caminho)
+            termo_ids = {}
+            for page_num, texto, texto_norm, numeros, tokens in linhas:
+                pagina_id = conn.execute(
+                    "INSERT INTO paginas (caminho, pagina, texto, texto_norm, numeros) VALUES (?, ?, ?, ?, ?)",
+                    (caminho, page_num, texto, texto_norm, numeros)).lastrowid
+                for termo in tokens:
+                    if termo not in termo_ids:
+                        termo_ids[termo] = self._term_id(conn, termo)
+                    conn.execute("INSERT OR IGNORE INTO termo_paginas (termo_id, pagina_id) VALUES (?, ?)",
+                                 (termo_ids[termo], pagina_id))
+            conn.execute(
+                "INSERT OR REPLACE INTO documentos "
+                "(caminho, tamanho, mtime_ns, doc_hash, versao, extrator, total_paginas, indexado_em, completo) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (caminho, stat.st_size, stat.st_mtime_ns, doc_hash, SEARCH_INDEX_VERSION, extrator, len(linhas),
+                 time.strftime('%d/%m/%Y %H:%M:%S'), int(completo)))
+            self._prune_terms(conn, antigos)
+    
+    @staticmethod
+    def _remove_pages(conn, caminho):
+        """Apaga as páginas de um PDF e devolve os termos que elas usavam (para _prune_terms)"""
+        termos = [termo_id for (termo_id,) in conn.execute(
+            "SELECT DISTINCT tp.termo_id FROM paginas p JOIN termo_paginas tp ON tp.pagina_id = p.id "
+            "WHERE p.caminho = ?", (caminho,))]
+        conn.execute("DELETE FROM paginas WHERE caminho = ?", (caminho,))
+        return termos
+    
+    @staticmethod
+    def _prune_terms(conn, termo_ids):
+        """Remove os termos (e seus trigramas) que não aparecem mais em nenhuma página"""
+        for termo_id in termo_ids:
+            if conn.execute("SELECT 1 FROM termo_paginas WHERE termo_id = ? LIMIT 1", (termo_id,)).fetchone():
+                continue
+            row = conn.execute("SELECT termo FROM termos WHERE id = ?", (termo_id,)).fetchone()
+            if row is None:
+                continue
+            conn.executemany("DELETE FROM termo_trigramas WHERE trigrama = ? AND termo_id = ?",
+                             [(trigrama, termo_id) for trigrama in name_trigrams(row[0])])
+            conn.execute("DELETE FROM termos WHERE id = ?", (termo_id,))
+    
+    @staticmethod
+    def _term_id(conn, termo):
+        row = conn.execute("SELECT id FROM termos WHERE termo = ?", (termo,)).fetchone()
+        if row:
+            return row[0]
+        termo_id = conn.execute("INSERT INTO termos (termo) VALUES (?)", (termo,)).lastrowid
+        conn.executemany("INSERT INTO termo_trigramas (trigrama, termo_id) VALUES (?, ?)",
+                         [(trigrama, termo_id) for trigrama in name_trigrams(termo)])
+        return termo_id
+    
+    def prune(self, pdf_folder, pdf_paths):
+        """Remove do índice os PDFs da pasta que não existem mais (retorna quantos saíram)"""
+        if not self.enabled:
+            return 0
+        pasta = os.path.abspath(pdf_folder)
+        presentes = {os.path.abspath(p) for p in pdf_paths}
+        with self._lock:
+            try:
+                with self._connect() as conn:
+                    antigos = [c for (c,) in conn.execute("SELECT caminho FROM documentos")
+                               if os.path.dirname(c) == pasta and c not in presentes]
+                    for caminho in antigos:
+                        self._prune_terms(conn, self._remove_pages(conn, caminho))
+                        conn.execute("DELETE FROM documentos WHERE caminho = ?", (caminho,))
+            except Exception as e:
+                print(f"Erro ao limpar índice de busca: {e}")
+                return 0
+        if antigos:
+            self._invalidate()
+        return len(antigos)
+    
+    @staticmethod
+    def _fts_term(termo):
+        return '"' + termo.replace('"', '""') + '"'
+    
+    def fuzzy_terms(self, conn, parte):
+        """
+        Palavras do índice parecidas com `parte`: candidatas pela sobreposição de trigramas
+        (uma letra trocada derruba no máximo 3) e confirmadas pela semelhança do difflib.
+        Retorna {termo_id: semelhança}.
+        """
+        trigramas = sorted(name_trigrams(parte))
+        minimo = max(1, len(trigramas) - 3)
+        marcadores = ",".join("?" * len(trigramas))
+        rows = conn.execute(
+            f"SELECT t.id, t.termo FROM termos t JOIN ("
+            f"  SELECT termo_id, COUNT(*) AS comuns FROM termo_trigramas WHERE trigrama IN ({marcadores})"
+            f"  GROUP BY termo_id HAVING comuns >= ? ORDER BY comuns DESC LIMIT ?"
+            f") c ON c.termo_id = t.id",
+            (*trigramas, minimo, FUZZY_MAX_TERMS)).fetchall()
+        semelhantes = {}
+        for termo_id, termo in rows:
+            semelhanca = 1.0 if termo == parte else difflib.SequenceMatcher(None, parte, termo).ratio()
+            if semelhanca >= FUZZY_TERM_MIN_SIMILARITY:
+                semelhantes[termo_id] = semelhanca
+        return semelhantes
+    
+    def fuzzy_pages(self, conn, nome_parts):
+        """
+        Nota aproximada do nome em cada página: média, entre as partes do nome, da melhor
+        semelhança de uma palavra da seção creditada. Retorna {pagina_id: nota} (só notas altas).
+        Só as partes com letras contam (o índice de nomes não guarda números).
+        """
+        partes = [p for p in nome_parts if p.isalpha()]
+        if not partes:
+            return {}
+        melhores = {}
+        for i, parte in enumerate(partes):
+            for termo_id, semelhanca in self.fuzzy_terms(conn, parte).items():
+                for (pagina_id,) in conn.execute("SELECT pagina_id FROM termo_paginas WHERE termo_id = ?",
+                                                 (termo_id,)):
+                    notas = melhores.setdefault(pagina_id, [0.0] * len(partes))
+                    notas[i] = max(notas[i], semelhanca)
+        notas_paginas = {pagina_id: sum(notas) / len(notas) for pagina_id, notas in melhores.items()}
+        return {pagina_id: nota for pagina_id, nota in notas_paginas.items() if nota >= FUZZY_NAME_MIN_SCORE}
+    
+    def search(self, pdf_paths, conta_norm, nome_norm, nome_parts):
+        """
+        Páginas candidatas dos PDFs informados: as que contêm a conta (nos dígitos) ou o nome ou
+        alguma parte dele (no texto normalizado), em ordem de relevância (bm25), seguidas das que
+        só têm o nome aproximado (índice de trigramas dos nomes).
+        Termos com menos de SEARCH_MIN_TERM caracteres não filtram candidatas; se só houver
+        termos curtos, todas as páginas dos PDFs informados são candidatas.
+        Retorna tuplas (caminho, página, texto, texto_norm, numeros, nota_nome_aproximado);
+        a nota é 0.0 quando o nome não aparece nem aproximado. O resultado fica memorizado.
+        """
+        if not self.enabled:
+            return []
+        caminhos = frozenset(os.path.abspath(p) for p in pdf_paths)
+        chave = (caminhos, conta_norm, nome_norm, tuple(nome_parts))
+        with self._memo_lock:
+            if chave in self._memo:
+                self._memo.move_to_end(chave)
+                return self._memo[chave]
+            generation = self.generation
+        
+        # O tokenizador de trigramas não consulta termos curtos ("DA", conta de 2 dígitos)
+        conta_busca = conta_norm if len(conta_norm) >= SEARCH_MIN_TERM else ""
+        termos_nome = list(dict.fromkeys(t for t in [nome_norm] + list(nome_parts) if len(t) >= SEARCH_MIN_TERM))
+        colunas = "p.id, p.caminho, p.pagina, p.texto, p.texto_norm, p.numeros"
+        try:
+            with self._connect() as conn:
+                aproximados = self.fuzzy_pages(conn, nome_parts)
+                if conta_busca or termos_nome:
+                    clausulas = ([f"numeros : {self._fts_term(conta_busca)}"] if conta_busca else [])
+                    clausulas += [f"texto_norm : {self._fts_term(t)}" for t in termos_nome]
+                    rows = conn.execute(
+                        f"SELECT {colunas} FROM paginas_fts JOIN paginas p ON p.id = paginas_fts.rowid "
+                        "WHERE paginas_fts MATCH ? ORDER BY paginas_fts.rank",
+                        (" OR ".join(clausulas),)).fetchall()
+                elif conta_norm or nome_norm:
+                    # Só termos curtos: as páginas dos PDFs pedidos (índice por caminho)
+                    rows = []
+                    for caminho in sorted(caminhos):
+                        rows += conn.execute(f"SELECT {colunas} FROM paginas p WHERE p.caminho = ? ORDER BY p.pagina",
+                                             (caminho,)).fetchall()
+                else:
+                    rows = []
+                
+                # Páginas que só o nome aproximado encontrou (melhor nota primeiro)
+                vistos = {row[0] for row in rows}
+                extras = sorted((pid for pid in aproximados if pid not in vistos), key=lambda pid: -aproximados[pid])
+                for pagina_id in extras:
+                    row = conn.execute(f"SELECT {colunas} FROM paginas p WHERE p.id = ?", (pagina_id,)).fetchone()
+                    if row:
+                        rows.append(row)
+        except Exception as e:
+            print(f"Erro ao consultar índice de busca: {e}")
+            return []
+        
+        resultado = [(*row[1:], aproximados.get(row[0], 0.0)) for row in rows if row[1] in caminhos]
+        with self._memo_lock:
+            if generation == self.generation:
+                self._memo[chave] = resultado
+                if len(self._memo) > SEARCH_MEMO_SIZE:
+                    self._memo.popitem(last=False)
+        return resultado
+
+
+# ==================== CACHE DE PLANILHAS ====================
+
+# Incrementar quando mudar a leitura/detecção de colunas da planilha
+ROSTER_CACHE_VERSION = 1
+
+
+class RosterCache:
+    """
+    Cache da planilha já lida e tipada (DataFrame + colunas detectadas), em pickle.
+    
+    Um arquivo por planilha (chave: caminho absoluto), com o tamanho e a data de modificação
+    guardados dentro: reabrir a mesma planilha não passa pelo pd.read_excel; qualquer alteração
+    no arquivo gera uma nova leitura, que substitui a entrada anterior.
+    """
+    
+    PREFIX = "planilha_"
+    
+    def __init__(self, cache_dir="cache_planilhas"):
+        self.cache_dir = cache_dir
+    
+    def _entry_path(self, path):
+        key = os.path.normcase(os.path.abspath(path))
+        return os.path.join(self.cache_dir, self.PREFIX + hashlib.sha1(key.encode('utf-8')).hexdigest() + ".pkl")
+    
+    @staticmethod
+    def _signature(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+    
+    def get(self, path):
+        """Retorna (df, colunas) do cache ou None"""
+        entry = self._entry_path(path)
+        assinatura = self._signature(path)
+        if assinatura is None or not os.path.exists(entry):
+            return None
+        try:
+            with open(entry, 'rb') as f:
+                dados = pickle.load(f)
+            if dados.get('versao') != ROSTER_CACHE_VERSION or dados.get('pandas') != pd.__version__:
+                return None
+            if (dados.get('tamanho'), dados.get('mtime_ns')) != assinatura:
+                return None
+            return dados['df'], dados['colunas']
+        except Exception as e:
+            print(f"Erro ao ler cache da planilha: {e}")
+            return None
+    
+    def put(self, path, df, colunas):
+        """Grava a planilha lida no cache (substitui a entrada de uma versão anterior do arquivo)"""
+        entry = self._entry_path(path)
+        assinatura = self._signature(path)
+        if assinatura is None:
+            return
+        try:
+            Path(self.cache_dir).mkdir(parents=True, exist_ok=True)
+            temp_path = entry + ".tmp"
+            with open(temp_path, 'wb') as f:
+                pickle.dump({'versao': ROSTER_CACHE_VERSION, 'pandas': pd.__version__,
+                             'tamanho': assinatura[0], 'mtime_ns': assinatura[1],
+                             'df': df, 'colunas': colunas}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, entry)
+        except Exception as e:
+            print(f"Erro ao gravar cache da planilha: {e}")
+            return
+        self._remove_legacy_entries()
+    
+    def _remove_legacy_entries(self):
+        """Apaga as entradas do formato antigo (uma por versão de cada planilha, nunca reaproveitadas)"""
+        try:
+            nomes = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for nome in nomes:
+            if nome.endswith(".pkl") and not nome.startswith(self.PREFIX):
+                try:
+                    os.remove(os.path.join(self.cache_dir, nome))
+                except OSError:
+                    pass
+
+
 # ==================== FUNÇÕES AUXILIARES ====================
 
 def normalize_account(conta):
@@ -666,284 +1348,3126 @@ def extract_credited_account_section(text):
     return section_text
 
 
-def extract_pdf_pages(pdf_path):
-    """Extrai texto de cada página do PDF"""
-    pages = {}
-    with pdfplumber.open(pdf_path) as pdf:
-        for i, page in enumerate(pdf.pages):
-            text = page.extract_text() or ""
-            # Texto normalizado para busca: remove acentos, converte para maiúsculas e colapsa espaços
-            def normalize_search_text(s):
-                if not s:
-                    return ""
-                nf = unicodedata.normalize('NFKD', s)
-                ascii_s = nf.encode('ascii', 'ignore').decode('ascii')
-                # manter apenas letras, dígitos e espaços
-                cleaned = re.sub(r'[^A-Za-z0-9\s]', ' ', ascii_s)
-                cleaned = re.sub(r'\s+', ' ', cleaned).strip().upper()
-                return cleaned
-
-            # Extrair seção específica "Dados da Conta Creditada"
+_SEARCH_JUNK_RE = re.compile(r'[^A-Za-z0-9\s]')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_search_text(s):
+    """Texto normalizado para busca: remove acentos, converte para maiúsculas e colapsa espaços"""
+    if not s:
+        return ""
+    nf = unicodedata.normalize('NFKD', str(s))
+    ascii_s = nf.encode('ascii', 'ignore').decode('ascii')
+    # manter apenas letras, dígitos e espaços
+    cleaned = _SEARCH_JUNK_RE.sub(' ', ascii_s)
+    return _SPACES_RE.sub(' ', cleaned).strip().upper()
+
+
+class PageRecord:
+    """
+    Registro de uma página extraída: texto bruto, seção "Dados da Conta Creditada" e backend
+    que produziu o texto ('rapido' ou 'pdfplumber').
+    
+    Os campos derivados usados nas buscas (dígitos e texto normalizado da página e da seção)
+    são calculados no primeiro acesso e memorizados. Com texto_completo=False só a seção é
+    guardada: o match e a análise de páginas sem match não usam o resto da página, e os
+    campos da página inteira ficam vazios. Páginas sem seção utilizável guardam o texto
+    inteiro mesmo assim (é nelas que a busca assistida precisa procurar o nome e a conta).
+    """
+    __slots__ = ('text', 'credited_section', 'extrator',
+                 '_numbers', '_norm_text', '_credited_numbers', '_credited_norm_text')
+    
+    def __init__(self, text, extrator=None, credited_section=None, texto_completo=True):
+        if credited_section is None:
             credited_section = extract_credited_account_section(text)
-            
-            pages[i] = {
-                'text': text,
-                'numbers': normalize_account(text),
-                'norm_text': normalize_search_text(text),
-                # Novos campos para busca na seção específica
-                'credited_section': credited_section,
-                'credited_numbers': normalize_account(credited_section),
-                'credited_norm_text': normalize_search_text(credited_section)
-            }
-    return pages
+        if not texto_completo and len(credited_section or "") >= AccountMatcher.MIN_SECTION_LEN:
+            text = None
+        elif text is None:
+            text = ""
+        self.text = text
+        self.credited_section = credited_section or ""
+        self.extrator = extrator
+        self._numbers = None
+        self._norm_text = None
+        self._credited_numbers = None
+        self._credited_norm_text = None
+    
+    @property
+    def numbers(self):
+        if self._numbers is None:
+            self._numbers = normalize_account(self.text or "")
+        return self._numbers
+    
+    @property
+    def norm_text(self):
+        if self._norm_text is None:
+            self._norm_text = normalize_search_text(self.text)
+        return self._norm_text
+    
+    @property
+    def credited_numbers(self):
+        if self._credited_numbers is None:
+            self._credited_numbers = normalize_account(self.credited_section)
+        return self._credited_numbers
+    
+    @property
+    def credited_norm_text(self):
+        if self._credited_norm_text is None:
+            self._credited_norm_text = normalize_search_text(self.credited_section)
+        return self._credited_norm_text
+    
+    def to_cache(self):
+        """Dados gravados no PageCache (os campos derivados são recalculados ao ler)"""
+        return {'text': self.text, 'credited_section': self.credited_section, 'extrator': self.extrator}
+    
+    @classmethod
+    def from_cache(cls, dados):
+        return cls(dados.get('text'), dados.get('extrator'), dados.get('credited_section', ''),
+                   texto_completo=dados.get('text') is not None)
+    
+    def __reduce__(self):
+        # Entre processos (pool de extração) vão só os dados brutos
+        return (self.__class__, (self.text, self.extrator, self.credited_section, self.text is not None))
 
 
-def find_account_pages(conta, agencia, pages):
+def build_page_record(text, extrator=None, texto_completo=True):
     """
-    Busca páginas onde TANTO a conta QUANTO a agência aparecem juntos NA SEÇÃO 'DADOS DA CONTA CREDITADA'.
-    Se não encontrar, tenta com os valores invertidos (conta<->agência) caso estejam trocados na planilha.
-    Como último recurso, faz busca ampla procurando qualquer um dos valores.
-    Retorna tupla: (lista_de_páginas, invertido) onde invertido=True se usou valores trocados.
+    Monta o registro de uma página (PageRecord) a partir do texto extraído.
+    extrator: backend que produziu o texto ('rapido' ou 'pdfplumber').
+    texto_completo: False para guardar só a seção creditada (menos memória e cache menor).
+    """
+    return PageRecord(text, extrator, texto_completo=texto_completo)
+
+
+# ==================== MODELOS DE LAYOUT ====================
+
+# Incrementar quando mudar o aprendizado ou o formato dos modelos gravados
+LAYOUT_TEMPLATE_VERSION = 1
+# A cada N páginas recortadas com um modelo, uma é conferida com a página inteira
+TEMPLATE_CHECK_INTERVAL = 50
+# Falhas seguidas (recorte sem a seção) antes de descartar o modelo
+TEMPLATE_MAX_FAILURES = 3
+# Folga (pt) acima e abaixo da faixa aprendida
+TEMPLATE_MARGIN = 1.0
+
+
+def layout_signature(metadata, page):
+    """Assinatura de layout de uma página: gerador do PDF + tamanho e rotação da página"""
+    metadata = metadata or {}
+    chave = "|".join([
+        str(metadata.get('Producer', '')),
+        str(metadata.get('Creator', '')),
+        f"{round(float(page.width))}x{round(float(page.height))}",
+        str(page.rotation or 0),
+    ])
+    return hashlib.sha1(chave.encode('utf-8', 'replace')).hexdigest()[:16]
+
+
+class LayoutTemplates:
     """
-    found = []
-    conta_norm = normalize_account(conta)
-    agencia_norm = normalize_account(agencia)
+    Modelos de layout aprendidos para a extração com pdfplumber.
     
-    if not conta_norm or len(conta_norm) < 3:
-        return found, False
+    Comprovantes de um mesmo lote têm layout idêntico: na primeira página de cada assinatura
+    de layout (layout_signature) o modelo aprende a faixa vertical da seção "Dados da Conta
+    Creditada" (do cabeçalho até a linha do marcador de fim) e, nas páginas seguintes, só essa
+    faixa é extraída. O recorte só é aceito se trouxer a seção completa; caso contrário a página
+    é extraída inteira. A primeira página depois do aprendizado e uma a cada
+    TEMPLATE_CHECK_INTERVAL são conferidas com a página inteira, e o modelo é descartado quando
+    deixa de bater. Os modelos ficam gravados em JSON (path) para as próximas execuções.
+    """
     
-    if not agencia_norm or len(agencia_norm) < 3:
-        return found, False
+    def __init__(self, path=None, modelos=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self.modelos = {}     # assinatura -> [top, bottom]
+        self.novos = {}       # aprendidos nesta execução
+        self.removidos = set()
+        self._usos = Counter()
+        self._falhas = Counter()
+        self.recortadas = 0
+        self.conferidas = 0
+        if path:
+            self._load()
+        if modelos:
+            self.modelos.update(modelos)
     
-    # Função auxiliar para buscar número exato com delimitadores
-    def find_exact_number(number, text):
-        """
-        Busca número exato no texto, garantindo que não é parte de outro número.
-        O número deve ser exatamente igual ao que está na planilha.
-        """
-        if not number or not text:
-            return False
-        
-        # Criar padrão que permite separadores entre dígitos mas exige delimitadores nas bordas
-        digits = list(number)
-        # Padrão: início ou não-dígito, depois os dígitos (com possíveis separadores), depois fim ou não-dígito  
-        # (?:[\s\-\.]*\d)? permite um dígito verificador opcional no final
-        pattern = r'(?<!\d)' + r'[\s\-\.]*'.join(digits) + r'(?:[\s\-\.]*\d)?(?!\d)'
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
         try:
-            if re.search(pattern, text):
-                return True
-        except re.error:
-            pass
-        return False
+            with open(self.path, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+            if dados.get('versao') == LAYOUT_TEMPLATE_VERSION:
+                self.modelos.update(dados.get('modelos', {}))
+        except Exception as e:
+            print(f"Erro ao carregar modelos de layout: {e}")
     
-    def buscar_com_valores(val_conta, val_agencia):
-        """Busca páginas com os valores de conta e agência fornecidos"""
-        resultados = []
-        
-        for num, data in pages.items():
-            # Usar dados da seção "Dados da Conta Creditada" (se existir)
-            credited_section = data.get('credited_section', '')
-            
-            # Se não encontrou a seção, pular esta página
-            if not credited_section or len(credited_section) < 20:
-                continue
-            
-            tem_conta = False
-            tem_agencia = False
-            
-            # Verifica se tem a conta NA SEÇÃO CREDITADA (busca exata)
-            if val_conta and find_exact_number(val_conta, credited_section):
-                tem_conta = True
-            
-            # Busca alternativa: sem dígito verificador (último recurso)
-            if not tem_conta and len(val_conta) > 4:
-                conta_sem_dv = val_conta[:-1]
-                if len(conta_sem_dv) >= 4 and find_exact_number(conta_sem_dv, credited_section):
-                    tem_conta = True
-            
-            # Verifica se tem a agência NA SEÇÃO CREDITADA (busca exata)
-            if val_agencia and find_exact_number(val_agencia, credited_section):
-                tem_agencia = True
-            
-            # SÓ adiciona se encontrou AMBOS: conta E agência
-            # Adiciona se encontrou ao menos a conta (agência é opcional)
-            if tem_conta:
-                if num not in resultados:
-                    resultados.append(num)
-        
-        return resultados
+    def save(self):
+        """Grava os modelos aprendidos/descartados nesta execução (mescla com o arquivo atual)"""
+        if not self.path or not (self.novos or self.removidos):
+            return
+        try:
+            gravados = LayoutTemplates(self.path).modelos
+            with self._lock:
+                for assinatura in self.removidos:
+                    gravados.pop(assinatura, None)
+                gravados.update(self.novos)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'versao': LAYOUT_TEMPLATE_VERSION, 'modelos': gravados}, f, indent=2)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print(f"Erro ao salvar modelos de layout: {e}")
     
-    # Primeira tentativa: valores originais (conta na coluna conta, agência na coluna agência)
-    found = buscar_com_valores(conta_norm, agencia_norm)
+    def snapshot(self):
+        """Cópia dos modelos atuais (enviada às tarefas do pool de extração)"""
+        with self._lock:
+            return dict(self.modelos)
     
-    if found:
-        return found, False  # Encontrou com valores originais
+    def changes(self):
+        """Mudanças desta instância, no formato aceito por merge_changes"""
+        with self._lock:
+            return {'novos': dict(self.novos), 'removidos': set(self.removidos),
+                    'recortadas': self.recortadas, 'conferidas': self.conferidas}
     
-    # Segunda tentativa: valores INVERTIDOS (conta<->agência trocados na planilha)
-    # Só tenta se os valores forem diferentes entre si
-    if conta_norm != agencia_norm:
-        found_invertido = buscar_com_valores(agencia_norm, conta_norm)
-        if found_invertido:
-            return found_invertido, True  # Encontrou com valores invertidos
+    def merge_changes(self, mudancas):
+        """Incorpora os modelos aprendidos/descartados por outro processo"""
+        with self._lock:
+            for assinatura in mudancas['removidos']:
+                self.modelos.pop(assinatura, None)
+                self.novos.pop(assinatura, None)
+                self.removidos.add(assinatura)
+            for assinatura, faixa in mudancas['novos'].items():
+                self.modelos.setdefault(assinatura, faixa)
+                self.novos.setdefault(assinatura, faixa)
+                self.removidos.discard(assinatura)
+            self.recortadas += mudancas['recortadas']
+            self.conferidas += mudancas['conferidas']
     
-    # Terceira tentativa: BUSCA TEXTUAL AMPLA (qualquer um dos valores em qualquer lugar)
-    # Para casos onde os dados estão em colunas erradas ou em branco
-    found_ampla = []
-    for num, data in pages.items():
-        credited_section = data.get('credited_section', '')
-        
-        if not credited_section or len(credited_section) < 20:
-            continue
-        
-        # Buscar QUALQUER UM dos valores (conta OU agência) em QUALQUER LUGAR da seção
-        encontrou_algum = False
-        
-        # Tentar encontrar conta
-        if conta_norm and find_exact_number(conta_norm, credited_section):
-            encontrou_algum = True
-        
-        # Tentar encontrar agência
-        if not encontrou_algum and agencia_norm and find_exact_number(agencia_norm, credited_section):
-            encontrou_algum = True
-        
-        # Busca sem dígito verificador (último recurso)
-        if not encontrou_algum:
-            if len(conta_norm) > 4:
-                conta_sem_dv = conta_norm[:-1]
-                if len(conta_sem_dv) >= 4 and find_exact_number(conta_sem_dv, credited_section):
-                    encontrou_algum = True
-            
-            if not encontrou_algum and len(agencia_norm) > 4:
-                agencia_sem_dv = agencia_norm[:-1]
-                if len(agencia_sem_dv) >= 4 and find_exact_number(agencia_sem_dv, credited_section):
-                    encontrou_algum = True
-        
-        if encontrou_algum and num not in found_ampla:
-            found_ampla.append(num)
+    def stats_text(self):
+        return (f"{len(self.modelos)} modelo(s) | {self.recortadas} pág(s) recortada(s) | "
+                f"{self.conferidas} conferida(s) | {len(self.removidos)} descartado(s)")
     
-    if found_ampla:
-        return found_ampla, False  # Encontrou com busca ampla
+    @staticmethod
+    def _crop_text(page, faixa):
+        x0, top, x1, bottom = page.bbox
+        area = (x0, max(top, faixa[0]), x1, min(bottom, faixa[1]))
+        return page.within_bbox(area, strict=False).extract_text() or ""
     
-    return found, False
-
+    @staticmethod
+    def _complete_section(texto):
+        """Seção do texto, se ela termina antes do fim do texto (marcador de fim encontrado)"""
+        secao = extract_credited_account_section(texto)
+        if len(secao) < AccountMatcher.MIN_SECTION_LEN:
+            return None
+        fim = texto.find(secao) + len(secao)
+        return secao if fim < len(texto.rstrip()) else None
+    
+    def _fail(self, assinatura, descartar=False):
+        with self._lock:
+            self._falhas[assinatura] += 1
+            if descartar or self._falhas[assinatura] >= TEMPLATE_MAX_FAILURES:
+                if assinatura not in self.modelos:
+                    return
+                del self.modelos[assinatura]
+                self.novos.pop(assinatura, None)
+                self.removidos.add(assinatura)
+                self._usos.pop(assinatura, None)
+                self._falhas.pop(assinatura, None)
+    
+    def _learn(self, page, texto, assinatura):
+        secao = self._complete_section(texto)
+        if secao is None:
+            return
+        linhas = page.extract_text_lines()
+        if "\n".join(linha['text'] for linha in linhas) != texto:
+            return  # linhas não correspondem ao texto extraído: não arriscar um modelo
+        inicio = texto.find(secao)
+        primeira = texto.count("\n", 0, inicio)
+        ultima = texto.count("\n", 0, inicio + len(secao))  # linha do marcador de fim
+        faixa = [float(linhas[primeira]['top']) - TEMPLATE_MARGIN,
+                 float(linhas[ultima]['bottom']) + TEMPLATE_MARGIN]
+        with self._lock:
+            if assinatura not in self.modelos:
+                self.modelos[assinatura] = faixa
+                self.novos[assinatura] = faixa
+                self.removidos.discard(assinatura)
+    
+    def extract_text(self, page, assinatura):
+        """Texto da página (pdfplumber): só a faixa do modelo quando houver um que sirva"""
+        with self._lock:
+            faixa = self.modelos.get(assinatura)
+            if faixa is not None:
+                conferir = self._usos[assinatura] % TEMPLATE_CHECK_INTERVAL == 0
+                self._usos[assinatura] += 1
+        
+        if faixa is not None and not conferir:
+            recorte = self._crop_text(page, faixa)
+            if self._complete_section(recorte) is not None:
+                with self._lock:
+                    self.recortadas += 1
+                    self._falhas.pop(assinatura, None)
+                return recorte
+            self._fail(assinatura)
+        
+        texto = page.extract_text() or ""
+        if faixa is None:
+            self._learn(page, texto, assinatura)
+        elif conferir:
+            secao_recorte = self._complete_section(self._crop_text(page, faixa))
+            secao_pagina = extract_credited_account_section(texto)
+            if secao_recorte is not None and secao_recorte.strip() == secao_pagina.strip():
+                with self._lock:
+                    self.conferidas += 1
+                    self._falhas.pop(assinatura, None)
+            elif secao_recorte is not None or secao_pagina:
+                # Recorte diferente da página inteira: o layout mudou
+                self._fail(assinatura, descartar=True)
+        return texto
 
-def create_pdf(pdf_path, page_numbers, output_path):
-    """Cria PDF com páginas específicas"""
-    if not page_numbers:
-        return 0
 
-    reader = None
-    writer = None
+# ==================== BACKENDS DE EXTRAÇÃO ====================
 
-    try:
-        # Abrir o arquivo PDF fonte
-        reader = PyPDF2.PdfReader(pdf_path)
-
-        # Criar um novo writer para cada arquivo
-        writer = PyPDF2.PdfWriter()
-
-        # Adicionar apenas as páginas especificadas
-        pages_added = 0
-        for num in page_numbers:
-            if 0 <= num < len(reader.pages):
-                page = reader.pages[num]
-                writer.add_page(page)
-                pages_added += 1
-
-        # Verificar se há páginas e salvar
-        if pages_added > 0:
-            # Garantir que NÃO sobrescrevemos arquivos já existentes
-            target = output_path
-            if os.path.exists(target):
-                base, ext = os.path.splitext(target)
-                # tentar com sufixo timestamp
-                stamp = str(int(time.time() * 1000))
-                candidate = f"{base}_{stamp}{ext}"
-                # em casos raros de colisão, iterar
-                i = 1
-                while os.path.exists(candidate):
-                    candidate = f"{base}_{stamp}_{i}{ext}"
-                    i += 1
-                target = candidate
+class PyPDF2Document:
+    """Backend rápido: texto bruto do fluxo de conteúdo de cada página (PyPDF2)"""
+    
+    name = 'rapido'
+    
+    def __init__(self, pdf_path, pages=None, modelos=None):
+        """pages: números (a partir de 0) das páginas a extrair; None = todas (modelos: não usado)"""
+        self._reader = PyPDF2.PdfReader(pdf_path)
+        total = len(self._reader.pages)
+        self._numbers = list(range(total)) if pages is None else [p for p in pages if 0 <= p < total]
+    
+    def page_numbers(self):
+        return self._numbers
+    
+    def text(self, page_num):
+        return self._reader.pages[page_num].extract_text() or ""
+    
+    def close(self):
+        self._reader = None
 
-            # Salvar diretamente no arquivo de destino
-            try:
-                with open(target, 'wb') as out:
-                    writer.write(out)
-            except Exception as e:
-                print(f"Erro ao salvar PDF {target}: {e}")
-                return 0
 
-            # Retornar número de páginas efetivamente escritas
-            return pages_added
+class PdfplumberDocument:
+    """Backend pdfplumber: análise de layout completa (mais lento, texto na ordem visual)"""
+    
+    name = 'pdfplumber'
+    
+    def __init__(self, pdf_path, pages=None, modelos=None):
+        """
+        pages: números (a partir de 0) das páginas a extrair; None = todas
+        modelos: LayoutTemplates para extrair só a faixa da seção creditada (None = página inteira)
+        """
+        self._pdf = pdfplumber.open(pdf_path, pages=None if pages is None else [p + 1 for p in pages])
+        self._pages = {page.page_number - 1: page for page in self._pdf.pages}
+        self._modelos = modelos
+    
+    def page_numbers(self):
+        return sorted(self._pages)
+    
+    def text(self, page_num):
+        page = self._pages[page_num]
+        try:
+            if self._modelos is not None:
+                return self._modelos.extract_text(page, layout_signature(self._pdf.metadata, page))
+            return page.extract_text() or ""
+        finally:
+            release_pdfplumber_page(page)
+    
+    def close(self):
+        self._pdf.close()
 
-        # Nenhuma página válida para escrever
-        return 0
 
-    except Exception as e:
-        print(f"Erro criar PDF: {e}")
-        return 0
+def release_pdfplumber_page(page):
+    """
+    Libera os objetos de layout que o pdfplumber guarda em cada página já lida (sem isso a
+    memória cresce com o número de páginas do PDF enquanto ele estiver aberto).
+    """
+    try:
+        if hasattr(page, 'close'):
+            page.close()
+        else:
+            page.flush_cache()
+    except Exception:
+        pass
+
+
+EXTRACTION_BACKENDS = {
+    PyPDF2Document.name: PyPDF2Document,
+    PdfplumberDocument.name: PdfplumberDocument,
+}
+
+
+def add_extraction_stat(stats, backend, seconds):
+    """Acumula em stats {backend: [páginas, segundos]} o tempo de uma página"""
+    if stats is None:
+        return
+    entry = stats.setdefault(backend, [0, 0.0])
+    entry[0] += 1
+    entry[1] += seconds
+
+
+def merge_extraction_stats(target, stats):
+    """Soma as estatísticas de extração de stats em target"""
+    for backend, (paginas, segundos) in stats.items():
+        entry = target.setdefault(backend, [0, 0.0])
+        entry[0] += paginas
+        entry[1] += segundos
+
+
+def format_extraction_stats(stats):
+    """Resumo legível do tempo gasto por backend"""
+    if not stats:
+        return "nenhuma página extraída"
+    return " | ".join(f"{backend}: {paginas} págs em {segundos:.2f}s"
+                      for backend, (paginas, segundos) in sorted(stats.items()))
+
+
+def cache_mode(extrator, modelos=None, texto_completo=True):
+    """
+    Modo gravado no PageCache: páginas recortadas por modelos de layout ou guardadas sem o texto
+    completo só têm a seção creditada, então ficam separadas das extraídas inteiras (usadas
+    pela busca assistida).
+    """
+    modo = extrator
+    if modelos is not None and extrator != 'rapido':
+        modo += "+modelos"
+    if not texto_completo:
+        modo += "+secao"
+    return modo
+
+
+def has_credited_section(page_data):
+    """Indica se a página tem uma seção 'Dados da Conta Creditada' utilizável pelo match"""
+    return len(page_data.credited_section) >= AccountMatcher.MIN_SECTION_LEN
+
+
+def needs_refinement(page_data, matcher=None):
+    """
+    No modo 'auto', indica se uma página extraída pelo backend rápido deve ser extraída de
+    novo com o pdfplumber: não tem seção creditada utilizável ou, com a planilha (matcher),
+    nenhuma linha casou ou mais de uma casou com a conta.
+    """
+    if page_data.extrator == 'pdfplumber':
+        return False
+    if not has_credited_section(page_data):
+        return True
+    if matcher is None:
+        return False
+    claims_conta, claims_invertido = matcher.page_claims(page_data)
+    return len(claims_conta) > 1 or not (claims_conta or claims_invertido)
+
+
+def iter_page_records(pdf_path, start=0, end=None, extrator=DEFAULT_EXTRACTOR, stats=None, modelos=None,
+                      texto_completo=True, matcher=None):
+    """
+    Extrai as páginas [start, end) do PDF uma a uma, gerando (número_da_página, registro).
+    
+    No modo 'auto' o texto vem do backend rápido e a página só é extraída de novo com o
+    pdfplumber quando precisa (needs_refinement: sem a seção "Dados da Conta Creditada" ou,
+    com o AccountMatcher da planilha, sem match ou com match ambíguo) ou quando o backend
+    rápido falha. stats recebe o tempo gasto por backend (add_extraction_stat).
+    modelos: LayoutTemplates usados pelo pdfplumber para recortar a seção creditada.
+    texto_completo: False para registros só com a seção creditada (PageRecord).
+    """
+    pages = None if end is None else list(range(start, end))
+    principal_name = 'pdfplumber' if extrator == 'pdfplumber' else 'rapido'
+    try:
+        principal = EXTRACTION_BACKENDS[principal_name](pdf_path, pages, modelos)
+    except Exception:
+        if extrator != 'auto':
+            raise
+        principal = PdfplumberDocument(pdf_path, pages, modelos)
+    
+    reserva = None
+    try:
+        for page_num in principal.page_numbers():
+            t0 = time.time()
+            try:
+                record = build_page_record(principal.text(page_num), principal.name, texto_completo)
+            except Exception:
+                if extrator != 'auto':
+                    raise
+                record = None
+            add_extraction_stat(stats, principal.name, time.time() - t0)
+            
+            if extrator == 'auto' and principal.name != 'pdfplumber' and (record is None or needs_refinement(record, matcher)):
+                if reserva is None:
+                    reserva = PdfplumberDocument(pdf_path, pages, modelos)
+                t0 = time.time()
+                record = build_page_record(reserva.text(page_num), reserva.name, texto_completo)
+                add_extraction_stat(stats, reserva.name, time.time() - t0)
+            
+            yield page_num, record
+    finally:
+        principal.close()
+        if reserva is not None:
+            reserva.close()
+
+
+def refine_cached_pages(pdf_path, pages, matcher, stats=None, modelos=None, texto_completo=True):
+    """
+    Modo 'auto' com páginas do cache: extrai de novo com o pdfplumber só as páginas rápidas que
+    a planilha atual deixa sem match ou ambíguas (ex: planilha alterada depois da gravação).
+    Altera pages no lugar e retorna quantas páginas foram refeitas.
+    """
+    refazer = [page_num for page_num, page_data in sorted(pages.items()) if needs_refinement(page_data, matcher)]
+    if not refazer:
+        return 0
+    with contextlib.closing(PdfplumberDocument(pdf_path, refazer, modelos)) as reserva:
+        for page_num in refazer:
+            t0 = time.time()
+            pages[page_num] = build_page_record(reserva.text(page_num), reserva.name, texto_completo)
+            add_extraction_stat(stats, reserva.name, time.time() - t0)
+    return len(refazer)
+
+
+def iter_pdf_pages(pdf_path, cache=None, extrator=DEFAULT_EXTRACTOR, stats=None, modelos=None, texto_completo=True,
+                   matcher=None):
+    """
+    Páginas do PDF uma a uma, (número_da_página, PageRecord), do PageCache ou extraídas na hora.
+    
+    Na extração cada página é entregue assim que sai do backend; só os registros ficam guardados
+    até o fim do PDF, para gravar o cache (um PDF interrompido no meio não é gravado).
+    matcher: AccountMatcher da planilha para o refinamento do modo 'auto' (needs_refinement);
+    as páginas refeitas com o pdfplumber ficam no cache e a próxima execução só as lê.
+    """
+    modo = cache_mode(extrator, modelos, texto_completo)
+    if cache is not None:
+        cached = cache.get(pdf_path, modo)
+        if cached is not None:
+            if extrator == 'auto' and matcher is not None and \
+                    refine_cached_pages(pdf_path, cached, matcher, stats, modelos, texto_completo):
+                cache.put(pdf_path, cached, modo)
+            yield from cached.items()
+            return
+    
+    pages = {} if cache is not None else None
+    for page_num, page_data in iter_page_records(pdf_path, extrator=extrator, stats=stats, modelos=modelos,
+                                                 texto_completo=texto_completo, matcher=matcher):
+        if pages is not None:
+            pages[page_num] = page_data
+        yield page_num, page_data
+    
+    if cache is not None:
+        cache.put(pdf_path, pages, modo)
+
+
+def extract_pdf_pages(pdf_path, cache=None, extrator=DEFAULT_EXTRACTOR, modelos=None, texto_completo=True):
+    """
+    Extrai texto de cada página do PDF (dicionário número -> PageRecord).
+    Se um PageCache for informado, consulta o cache antes de abrir o PDF e grava o resultado depois.
+    Para percorrer as páginas sem guardar o PDF inteiro em memória, use iter_pdf_pages.
+    """
+    return dict(iter_pdf_pages(pdf_path, cache, extrator, modelos=modelos, texto_completo=texto_completo))
+
+
+# AccountMatcher da planilha em cada processo do pool de extração (init_extraction_worker)
+_worker_matcher = None
+
+
+def init_extraction_worker(matcher):
+    """Inicializador do pool: recebe o AccountMatcher UMA vez por processo, não a cada faixa"""
+    global _worker_matcher
+    _worker_matcher = matcher
+
+
+def extract_page_range(pdf_path, start, end, extrator=DEFAULT_EXTRACTOR, modelos=None, texto_completo=True):
+    """
+    Extrai apenas as páginas [start, end) do PDF (numeração a partir de 0).
+    modelos: cópia dos modelos de layout (LayoutTemplates.snapshot) ou None para não recortar.
+    No pool, o refinamento do modo 'auto' usa o AccountMatcher de init_extraction_worker.
+    Retorna (páginas, estatísticas_por_backend, mudanças_nos_modelos); usado pelas tarefas do pool.
+    """
+    stats = {}
+    modelos = LayoutTemplates(modelos=modelos) if modelos is not None else None
+    pages = dict(iter_page_records(pdf_path, start, end, extrator=extrator, stats=stats, modelos=modelos,
+                                   texto_completo=texto_completo, matcher=_worker_matcher))
+    return pages, stats, (modelos.changes() if modelos is not None else None)
+
+
+def count_pdf_pages(pdf_path):
+    """Conta as páginas do PDF sem extrair texto (leitura rápida da árvore de páginas)"""
+    try:
+        return len(PyPDF2.PdfReader(pdf_path).pages)
+    except Exception:
+        with pdfplumber.open(pdf_path) as pdf:
+            return len(pdf.pages)
+
+
+def find_account_pages(conta, agencia, pages):
+    """
+    Busca páginas onde TANTO a conta QUANTO a agência aparecem juntos NA SEÇÃO 'DADOS DA CONTA CREDITADA'.
+    Se não encontrar, tenta com os valores invertidos (conta<->agência) caso estejam trocados na planilha.
+    Retorna tupla: (lista_de_páginas, invertido) onde invertido=True se usou valores trocados.
+    
+    Atalho para um único registro; o processamento em lote usa AccountMatcher diretamente.
+    """
+    matcher = AccountMatcher([(conta, agencia)])
+    return matcher.match(pages).get(0, ([], False))
+
+
+# ==================== MOTOR DE MATCH (ÍNDICE HASH) ====================
+
+# Separadores aceitos entre os dígitos de um número (ex: "94894 - 2", "1.234.567-8")
+_NUMBER_GAP_RE = re.compile(r'[\s\-\.]*')
+_DIGIT_RUN_RE = re.compile(r'\d+')
+
+
+def extract_number_keys(text, max_len=None):
+    """
+    Retorna o conjunto de números (só dígitos) que aparecem no texto com delimitadores válidos.
+    
+    Equivale a testar cada número com a busca exata por regex usada antes (número isolado
+    por não-dígitos, com espaço/hífen/ponto entre os dígitos e dígito verificador opcional),
+    mas percorre o texto UMA vez: sequências de dígitos ligadas só por espaço/hífen/ponto formam
+    uma cadeia, e cada prefixo da cadeia que termina no fim de um bloco de dígitos é uma chave
+    (com e sem o último dígito, que faz o papel de dígito verificador opcional).
+    max_len limita o tamanho das chaves geradas (chaves maiores que qualquer conta são inúteis).
+    """
+    keys = set()
+    if not text:
+        return keys
+    
+    # Agrupar blocos de dígitos em cadeias
+    chains = []
+    current = []
+    last_end = None
+    for m in _DIGIT_RUN_RE.finditer(text):
+        if current and _NUMBER_GAP_RE.fullmatch(text, last_end, m.start()):
+            current.append(m.group())
+        else:
+            if current:
+                chains.append(current)
+            current = [m.group()]
+        last_end = m.end()
+    if current:
+        chains.append(current)
+    
+    for chain in chains:
+        for i in range(len(chain)):
+            prefix = ""
+            for run in chain[i:]:
+                prefix += run
+                if max_len is not None and len(prefix) - 1 > max_len:
+                    break
+                keys.add(prefix)
+                if len(prefix) > 1:
+                    keys.add(prefix[:-1])
+    return keys
+
+
+class AccountMatcher:
+    """
+    Casa a planilha inteira contra as páginas de um PDF usando índices hash.
+    
+    Em vez de rodar regex para cada (linha x página), cada seção "Dados da Conta Creditada"
+    é decomposta uma vez em chaves numéricas (extract_number_keys) e as chaves são procuradas
+    em dicionários montados a partir das contas/agências normalizadas da planilha
+    (incluindo variantes sem dígito verificador e a variante invertida conta<->agência).
+    
+    Regras (mesmas da busca por regex):
+      1. Conta (ou conta sem DV) na seção creditada -> match normal
+      2. Se nenhuma página casou e conta != agência: agência (ou agência sem DV) -> match invertido
+    Uma terceira "busca ampla" (conta OU agência) não é necessária: ela só repetiria 1 e 2.
+    """
+    
+    MIN_SECTION_LEN = 20
+    
+    def __init__(self, entries):
+        """entries: lista de tuplas (conta, agencia) na ordem da planilha"""
+        self.size = len(entries)
+        self.conta_index = {}      # chave -> [índices] (tentativa com valores originais)
+        self.invertido_index = {}  # chave -> [índices] (tentativa com conta<->agência trocados)
+        self.max_key_len = 0
+        
+        for idx, (conta, agencia) in enumerate(entries):
+            conta_norm = normalize_account(conta)
+            agencia_norm = normalize_account(agencia)
+            if len(conta_norm) < 3 or len(agencia_norm) < 3:
+                continue
+            
+            for key in self._variants(conta_norm):
+                self.conta_index.setdefault(key, []).append(idx)
+            if conta_norm != agencia_norm:
+                for key in self._variants(agencia_norm):
+                    self.invertido_index.setdefault(key, []).append(idx)
+            
+            self.max_key_len = max(self.max_key_len, len(conta_norm), len(agencia_norm))
+    
+    @staticmethod
+    def _variants(number):
+        """Número exato e, se tiver mais de 4 dígitos, o número sem o dígito verificador"""
+        variants = {number}
+        if len(number) > 4:
+            variants.add(number[:-1])
+        return variants
+    
+    def new_hits(self):
+        """Acumulador de ocorrências: (originais, invertidos), cada um índice -> páginas"""
+        return ({}, {})
+    
+    def page_claims(self, page_data):
+        """Linhas da planilha encontradas em uma página: (linhas_conta, linhas_invertido)"""
+        claims_conta = set()
+        claims_invertido = set()
+        credited_section = page_data.credited_section
+        if not credited_section or len(credited_section) < self.MIN_SECTION_LEN:
+            return claims_conta, claims_invertido
+        
+        for key in extract_number_keys(credited_section, self.max_key_len):
+            claims_conta.update(self.conta_index.get(key, ()))
+            claims_invertido.update(self.invertido_index.get(key, ()))
+        return claims_conta, claims_invertido
+    
+    def add_page(self, hits, page_num, page_data):
+        """
+        Registra no acumulador as linhas da planilha encontradas em uma página.
+        Retorna (linhas_conta, linhas_invertido) encontradas nesta página.
+        """
+        claims_conta, claims_invertido = self.page_claims(page_data)
+        hits_conta, hits_invertido = hits
+        for idx in claims_conta:
+            hits_conta.setdefault(idx, set()).add(page_num)
+        for idx in claims_invertido:
+            hits_invertido.setdefault(idx, set()).add(page_num)
+        return claims_conta, claims_invertido
+    
+    def resolve(self, hits):
+        """Converte o acumulador em {índice: (páginas_ordenadas, invertido)}"""
+        hits_conta, hits_invertido = hits
+        results = {}
+        for idx, paginas in hits_conta.items():
+            results[idx] = (sorted(paginas), False)
+        for idx, paginas in hits_invertido.items():
+            if idx not in results:
+                results[idx] = (sorted(paginas), True)
+        return results
+    
+    def match(self, pages):
+        """Casa todas as páginas de um PDF: retorna {índice: (páginas, invertido)}"""
+        hits = self.new_hits()
+        for page_num, page_data in pages.items():
+            self.add_page(hits, page_num, page_data)
+        return self.resolve(hits)
+
+
+class PageAssigner:
+    """
+    Distribui as páginas de UM PDF entre as linhas da planilha à medida que são extraídas.
+    
+    O resultado final é o mesmo da atribuição feita com o PDF inteiro: cada página vai para a
+    primeira linha (ordem da planilha) cujo resultado em AccountMatcher.resolve a contém.
+    Uma página já fica decidida ao chegar quando tem match normal e nenhuma linha anterior a
+    disputa pelo match invertido (o invertido só vale para linhas SEM match normal no PDF, o que
+    só se sabe no fim). As demais ficam pendentes até finish().
+    """
+    
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.hits = matcher.new_hits()
+        self.assigned = {}  # índice -> páginas já decididas
+    
+    def add_page(self, page_num, page_data):
+        """Registra uma página; retorna o índice da linha que ficou com ela (None se pendente)"""
+        claims_conta, claims_invertido = self.matcher.add_page(self.hits, page_num, page_data)
+        if not claims_conta:
+            return None
+        owner = min(claims_conta)
+        if any(idx < owner for idx in claims_invertido):
+            return None
+        self.assigned.setdefault(owner, []).append(page_num)
+        return owner
+    
+    def finish(self):
+        """Atribuição final do PDF: {índice: páginas_ordenadas} (sem repetir páginas entre linhas)"""
+        taken = set()
+        final = {}
+        for idx, (paginas, _) in sorted(self.matcher.resolve(self.hits).items()):
+            novas = [p for p in paginas if p not in taken]
+            if novas:
+                taken.update(novas)
+                final[idx] = novas
+        return final
+
+
+class SplitSession:
+    """
+    Sessão de divisão de UM PDF de origem: o arquivo é aberto (e sua tabela xref lida) uma vez
+    e atende todos os subconjuntos de páginas pedidos para ele, até close().
+    
+    Pode ser usada por várias threads: a montagem do PDF (que lê o arquivo de origem) é
+    serializada e só a gravação em disco acontece em paralelo.
+    
+    Uso:
+        with SplitSession(pdf_path) as sessao:
+            sessao.write([0, 1], "saida.pdf")
+    """
+    
+    def __init__(self, pdf_path):
+        self.pdf_path = pdf_path
+        self._reader = None
+        self._lock = threading.Lock()
+    
+    def _get_reader(self):
+        if self._reader is None:
+            self._reader = PyPDF2.PdfReader(self.pdf_path)
+        return self._reader
+    
+    def _render(self, page_numbers):
+        """Monta o PDF com as páginas indicadas: retorna (bytes, páginas_adicionadas)"""
+        with self._lock:
+            reader = self._get_reader()
+            
+            # Criar um novo writer para cada arquivo
+            writer = PyPDF2.PdfWriter()
+            
+            # Adicionar apenas as páginas especificadas
+            pages_added = 0
+            for num in page_numbers:
+                if 0 <= num < len(reader.pages):
+                    page = reader.pages[num]
+                    writer.add_page(page)
+                    pages_added += 1
+            
+            # Nenhuma página válida para escrever
+            if pages_added == 0:
+                return None, 0
+            
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            return buffer.getvalue(), pages_added
+    
+    def write(self, page_numbers, output_path, overwrite=False):
+        """
+        Cria PDF com as páginas indicadas; retorna o número de páginas gravadas (0 em caso de erro).
+        overwrite=True substitui output_path (usado para completar um comprovante já gravado).
+        """
+        return self.write_file(page_numbers, output_path, overwrite)[0]
+    
+    def write_file(self, page_numbers, output_path, overwrite=False):
+        """
+        Igual a write(), mas retorna (páginas_gravadas, caminho_gravado): se output_path já
+        existir (e overwrite=False) o arquivo é criado com sufixo de timestamp.
+        """
+        pages_added, target, _, _ = self.write_output(page_numbers, output_path, overwrite)
+        return pages_added, target
+    
+    @staticmethod
+    def _has_digest(path, digest):
+        """O arquivo existe e o conteúdo tem o hash informado"""
+        try:
+            return full_pdf_hash(path) == digest
+        except OSError:
+            return False
+    
+    def write_output(self, page_numbers, output_path, overwrite=False, current_digest=None):
+        """
+        Igual a write_file(), retornando (páginas, caminho, sha256_do_arquivo, gravou).
+        Com overwrite=True e current_digest igual ao hash do PDF montado, o arquivo existente
+        não é regravado (gravou=False) se ainda tiver esse conteúdo (pode ter sido editado).
+        """
+        if not page_numbers:
+            return 0, None, None, False
+        
+        try:
+            data, pages_added = self._render(page_numbers)
+        except Exception as e:
+            print(f"Erro criar PDF: {e}")
+            return 0, None, None, False
+        if not pages_added:
+            return 0, None, None, False
+        digest = hashlib.sha256(data).hexdigest()
+        
+        if overwrite:
+            if current_digest == digest and self._has_digest(output_path, digest):
+                return pages_added, output_path, digest, False
+            # Gravar em arquivo temporário e trocar de uma vez (nunca deixa o comprovante pela metade)
+            temp_path = f"{output_path}.tmp"
+            try:
+                with open(temp_path, 'wb') as out:
+                    out.write(data)
+                os.replace(temp_path, output_path)
+            except Exception as e:
+                print(f"Erro ao salvar PDF {output_path}: {e}")
+                return 0, None, None, False
+            return pages_added, output_path, digest, True
+        
+        # Criar o arquivo de forma exclusiva: NUNCA sobrescreve um arquivo já existente
+        target = output_path
+        try:
+            try:
+                out = open(target, 'xb')
+            except FileExistsError:
+                base, ext = os.path.splitext(target)
+                # tentar com sufixo timestamp
+                stamp = str(int(time.time() * 1000))
+                target = f"{base}_{stamp}{ext}"
+                # em casos raros de colisão, iterar
+                i = 1
+                while os.path.exists(target):
+                    target = f"{base}_{stamp}_{i}{ext}"
+                    i += 1
+                out = open(target, 'xb')
+            with out:
+                out.write(data)
+        except Exception as e:
+            print(f"Erro ao salvar PDF {target}: {e}")
+            return 0, None, None, False
+        
+        # Retornar número de páginas efetivamente escritas
+        return pages_added, target, digest, True
+    
+    def close(self):
+        """Libera o PDF de origem"""
+        with self._lock:
+            self._reader = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class OutputNameRegistry:
+    """
+    Reserva em memória os nomes dos arquivos de saída, por pasta de centro de custo.
+    
+    Cada pasta é criada e listada UMA vez; a partir daí os nomes livres (base, base_1, base_2...)
+    são escolhidos sem consultar o disco a cada arquivo, o que evita milhares de consultas em
+    pastas de rede/OneDrive. Nomes são comparados como o sistema operacional compara
+    (sem diferenciar maiúsculas no Windows).
+    """
+    
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self._folders = {}  # pasta -> nomes já usados (normalizados)
+        self._lock = threading.Lock()
+    
+    def _names_in(self, folder):
+        names = self._folders.get(folder)
+        if names is None:
+            Path(folder).mkdir(parents=True, exist_ok=True)
+            try:
+                names = {os.path.normcase(n) for n in os.listdir(folder)}
+            except OSError:
+                names = set()
+            self._folders[folder] = names
+        return names
+    
+    def reserve(self, subfolder, base_name, ext='.pdf'):
+        """Reserva e retorna o caminho livre para base_name dentro de out_dir/subfolder"""
+        folder = os.path.join(self.out_dir, subfolder)
+        with self._lock:
+            names = self._names_in(folder)
+            name = f"{base_name}{ext}"
+            i = 1
+            while os.path.normcase(name) in names:
+                name = f"{base_name}_{i}{ext}"
+                i += 1
+            names.add(os.path.normcase(name))
+        return os.path.join(folder, name)
+
+
+# Manifesto da pasta de saída (JSON Lines, uma linha por comprovante gravado)
+OUTPUT_MANIFEST_NAME = "manifesto_comprovantes.jsonl"
+
+
+class OutputManifest:
+    """
+    Manifesto da pasta de saída: para cada comprovante gravado, o PDF de origem (hash do
+    conteúdo), o nome de saída, as páginas e o hash/tamanho/data do arquivo gerado.
+    
+    Consultado antes de gravar: um comprovante com a mesma origem, nome e páginas de um
+    arquivo intacto da pasta não é gravado de novo, e um comprovante da mesma origem e nome
+    com outras páginas substitui o arquivo anterior (troca atômica) em vez de gerar _1, _2.
+    Comprovantes que a origem deixou de gerar (ex: linha retirada da planilha) saem do
+    manifesto, mas o arquivo fica na pasta.
+    O arquivo só recebe acréscimos (a última linha de cada comprovante vale) e é compactado
+    em close() quando acumula muitas linhas substituídas.
+    """
+    
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.path = os.path.join(out_dir, OUTPUT_MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._entradas = {}  # arquivo (relativo) -> entrada
+        self._linhas = 0
+        self._load()
+    
+    @staticmethod
+    def _key(arquivo):
+        return os.path.normcase(os.path.normpath(arquivo))
+    
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for linha in f:
+                    try:
+                        entrada = json.loads(linha)
+                    except ValueError:
+                        continue  # linha incompleta de uma gravação interrompida
+                    self._linhas += 1
+                    if entrada.get('removido'):
+                        self._entradas.pop(self._key(entrada['arquivo']), None)
+                    else:
+                        self._entradas[self._key(entrada['arquivo'])] = entrada
+        except Exception as e:
+            print(f"Erro ao ler manifesto de saída: {e}")
+    
+    def has_source(self, origem):
+        """Indica se algum comprovante desta pasta veio do PDF de origem informado"""
+        with self._lock:
+            return any(e['origem'] == origem for e in self._entradas.values())
+    
+    def outputs_for(self, origem):
+        """Entradas {'arquivo' (absoluto), 'nome', 'paginas', 'sha256', ...} geradas do PDF de origem"""
+        with self._lock:
+            entradas = [dict(e) for e in self._entradas.values() if e['origem'] == origem]
+        for entrada in entradas:
+            entrada['arquivo'] = os.path.join(self.out_dir, entrada['arquivo'])
+        return entradas
+    
+    @staticmethod
+    def is_intact(entrada):
+        """O arquivo continua como foi gravado (mesmo tamanho e data de modificação)"""
+        try:
+            stat = os.stat(entrada['arquivo'])
+        except OSError:
+            return False
+        return stat.st_size == entrada['tamanho'] and stat.st_mtime_ns == entrada['mtime_ns']
+    
+    def add(self, arquivo, origem, nome, paginas, digest):
+        """Registra o comprovante gravado em arquivo (caminho absoluto)"""
+        try:
+            stat = os.stat(arquivo)
+        except OSError:
+            return
+        entrada = {
+            'arquivo': os.path.relpath(arquivo, self.out_dir),
+            'origem': origem,
+            'nome': nome,
+            'paginas': list(paginas),
+            'sha256': digest,
+            'tamanho': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+        }
+        with self._lock:
+            if self._append(entrada):
+                self._entradas[self._key(entrada['arquivo'])] = entrada
+    
+    def forget(self, arquivo):
+        """Retira do manifesto um comprovante (caminho absoluto) sem apagar o arquivo"""
+        relativo = os.path.relpath(arquivo, self.out_dir)
+        with self._lock:
+            if not self._append({'arquivo': relativo, 'removido': True}):
+                return False
+            self._entradas.pop(self._key(relativo), None)
+        return True
+    
+    def _append(self, entrada):
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"Erro ao gravar manifesto de saída: {e}")
+            return False
+        self._linhas += 1
+        return True
+    
+    def close(self):
+        """Reescreve o manifesto só com as entradas atuais se houver muitas linhas obsoletas"""
+        with self._lock:
+            if self._linhas <= 2 * len(self._entradas) + 100:
+                return
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    for entrada in self._entradas.values():
+                        f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+                os.replace(temp_path, self.path)
+                self._linhas = len(self._entradas)
+            except Exception as e:
+                print(f"Erro ao compactar manifesto de saída: {e}")
+
+
+def create_pdf(pdf_path, page_numbers, output_path, overwrite=False):
+    """
+    Cria PDF com páginas específicas (abre o PDF de origem só para este arquivo).
+    Para gerar vários arquivos do mesmo PDF, use uma SplitSession.
+    """
+    with SplitSession(pdf_path) as sessao:
+        return sessao.write(page_numbers, output_path, overwrite=overwrite)
+
+
+def normalize_path(path):
+    """Normaliza path garantindo encoding correto para Windows/OneDrive/Google Drive"""
+    if not path:
+        return path
+    
+    try:
+        # Converter para string se necessário
+        if isinstance(path, bytes):
+            path = path.decode('utf-8', errors='replace')
+        
+        path = str(path).strip()
+        
+        # Normalizar barras para o sistema operacional
+        if platform.system() == 'Windows':
+            path = path.replace('/', '\\')
+        
+        # Resolver Path para garantir formato correto
+        path_obj = Path(path)
+        # Usar resolve() para expandir caminhos relativos e normalizar
+        try:
+            resolved = path_obj.resolve()
+            return str(resolved)
+        except (OSError, RuntimeError):
+            # Se resolve() falhar, retornar path normalizado básico
+            return os.path.normpath(path)
+    except Exception:
+        # Fallback: retornar path original
+        return path
+
+
+def clean_filename(name):
+    """Remove caracteres inválidos"""
+    if not name or str(name).lower() == 'nan':
+        return "sem_nome"
+    name = str(name)
+    for c in '<>:"/\\|?*\n\r\t':
+        name = name.replace(c, '_')
+    return ' '.join(name.split())[:100].strip()
+
+
+def find_column(df, names):
+    """Encontra coluna pelo nome - busca exata primeiro, depois parcial"""
+    # Primeira passada: busca exata
+    for col in df.columns:
+        for name in names:
+            if str(col).lower().strip() == name.lower().strip():
+                return col
+    
+    # Segunda passada: busca parcial
+    for col in df.columns:
+        for name in names:
+            if name.lower() in str(col).lower():
+                return col
+    return None
+
+
+# ==================== PROCESSAMENTO PARALELO ====================
+
+# Limites do tamanho das faixas de páginas enviadas ao pool
+MIN_PAGE_CHUNK = 10
+MAX_PAGE_CHUNK = 200
+# Faixas em andamento por processo do pool (limita a memória das páginas já extraídas)
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+
+def plan_page_chunks(docs, workers):
+    """
+    Divide documentos em faixas de páginas para distribuir entre os processos.
+    
+    docs: lista de (doc_id, total_de_páginas). O tamanho da faixa é escolhido para gerar
+    algumas tarefas por processo. As faixas saem na ordem dos documentos (e das páginas),
+    que é a ordem em que o pipeline as consome.
+    Retorna lista de (doc_id, inicio, fim).
+    """
+    total = sum(n for _, n in docs)
+    if total <= 0:
+        return []
+    chunk = -(-total // (max(1, workers) * 4))
+    chunk = min(MAX_PAGE_CHUNK, max(MIN_PAGE_CHUNK, chunk))
+    
+    chunks = []
+    for doc_id, n in docs:
+        for start in range(0, n, chunk):
+            chunks.append((doc_id, start, min(n, start + chunk)))
+    return chunks
+
+
+def head_start_chunks(docs, chunks, limit):
+    """
+    Faixas que saem na frente da ordem dos documentos: as primeiras dos MAIORES documentos
+    (mais páginas primeiro), até `limit` faixas. Assim um PDF enorme no fim da pasta começa
+    logo e não vira a cauda do lote; o restante segue na ordem em que é consumido.
+    Retorna lista de (doc_id, inicio, fim).
+    """
+    por_doc = {}
+    for chunk in chunks:
+        por_doc.setdefault(chunk[0], []).append(chunk)
+    escolhidas = []
+    for doc_id, _ in sorted(docs, key=lambda d: -d[1]):
+        for chunk in por_doc.get(doc_id, []):
+            if len(escolhidas) >= limit:
+                return escolhidas
+            escolhidas.append(chunk)
+    return escolhidas
+
+
+def _iter_document_pages(doc_id, pdf_path, cache=None, extrator=DEFAULT_EXTRACTOR, stats=None, modelos=None,
+                        texto_completo=True, matcher=None):
+    """Páginas de um PDF (cache ou extração serial) no formato do fluxo de iter_page_stream"""
+    total = 0
+    try:
+        for page_num, page_data in iter_pdf_pages(pdf_path, cache, extrator, stats, modelos, texto_completo,
+                                                  matcher):
+            total += 1
+            yield ('pagina', doc_id, page_num, page_data)
+    except Exception as e:
+        yield ('fim_pdf', doc_id, total, e)
+        return
+    yield ('fim_pdf', doc_id, total, None)
+
+
+def iter_page_stream(pdf_paths, cache=None, workers=1, extrator=DEFAULT_EXTRACTOR, stats=None, modelos=None,
+                     texto_completo=True, matcher=None):
+    """
+    Fluxo contínuo das páginas de todos os PDFs, NA ORDEM de pdf_paths e das páginas.
+    
+    Gera ('pagina', doc_id, número, registro) para cada página assim que ela é extraída e,
+    ao final de cada PDF, ('fim_pdf', doc_id, total_de_páginas, erro).
+    Com workers > 1 as páginas dos PDFs fora do cache são divididas em faixas (plan_page_chunks)
+    extraídas por um ProcessPoolExecutor; no máximo workers * CHUNKS_IN_FLIGHT_PER_WORKER faixas
+    ficam em andamento, então a memória não cresce com o tamanho do lote. Além delas, as
+    primeiras faixas dos maiores PDFs (até workers, head_start_chunks) começam antes de todas.
+    extrator: modo de extração (EXTRACTION_MODES); stats acumula o tempo por backend.
+    modelos: LayoutTemplates; as tarefas do pool recebem uma cópia e devolvem o que aprenderam.
+    texto_completo: False para guardar só a seção creditada de cada página (PageRecord).
+    matcher: AccountMatcher da planilha; no modo 'auto' as páginas sem match ou ambíguas são
+    refeitas com o pdfplumber já na extração (nos processos do pool, que o recebem uma vez).
+    """
+    if workers <= 1:
+        for doc_id, pdf_path in enumerate(pdf_paths):
+            yield from _iter_document_pages(doc_id, pdf_path, cache, extrator, stats, modelos, texto_completo,
+                                            matcher)
+        return
+    
+    modo = cache_mode(extrator, modelos, texto_completo)
+    
+    # PDFs já no cache são lidos na vez deles; só os demais vão para o pool
+    errors = {}
+    docs = []
+    for doc_id, pdf_path in enumerate(pdf_paths):
+        if cache is not None and cache.has(pdf_path, modo):
+            continue
+        try:
+            docs.append((doc_id, count_pdf_pages(pdf_path)))
+        except Exception as e:
+            errors[doc_id] = e
+    
+    chunks = plan_page_chunks(docs, workers)
+    doc_chunks = {}
+    for chunk in chunks:
+        doc_chunks.setdefault(chunk[0], []).append(chunk)
+    planned = {doc_id for doc_id, _ in docs}
+    
+    adiantadas = head_start_chunks(docs, chunks, workers)
+    pending = deque(chunk for chunk in chunks if chunk not in adiantadas)
+    in_flight = {}
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_extraction_worker,
+                                   initargs=(matcher,)) if chunks else None
+    
+    def submit(doc_id, start, end):
+        in_flight[(doc_id, start)] = executor.submit(
+            extract_page_range, pdf_paths[doc_id], start, end, extrator,
+            modelos.snapshot() if modelos is not None else None, texto_completo)
+    
+    # As faixas adiantadas não contam na janela: a seguinte na ordem sempre pode ser enviada
+    adiantadas_pendentes = {(doc_id, start) for doc_id, start, _ in adiantadas}
+    
+    def fill():
+        while pending and len(in_flight) - len(adiantadas_pendentes) < workers * CHUNKS_IN_FLIGHT_PER_WORKER:
+            submit(*pending.popleft())
+    
+    for chunk in adiantadas:
+        submit(*chunk)
+    
+    try:
+        for doc_id, pdf_path in enumerate(pdf_paths):
+            if doc_id in errors:
+                yield ('fim_pdf', doc_id, 0, errors[doc_id])
+                continue
+            if doc_id not in planned:
+                yield from _iter_document_pages(doc_id, pdf_path, cache, extrator, stats, modelos, texto_completo,
+                                                matcher)
+                continue
+            
+            pages = {}
+            erro = None
+            for chunk_doc, start, _ in doc_chunks.get(doc_id, []):
+                fill()
+                future = in_flight.pop((chunk_doc, start))
+                adiantadas_pendentes.discard((chunk_doc, start))
+                if erro is not None:
+                    future.cancel()
+                    continue
+                try:
+                    chunk_pages, chunk_stats, chunk_modelos = future.result()
+                except Exception as e:
+                    erro = e
+                    continue
+                if stats is not None:
+                    merge_extraction_stats(stats, chunk_stats)
+                if chunk_modelos is not None:
+                    modelos.merge_changes(chunk_modelos)
+                for page_num in sorted(chunk_pages):
+                    pages[page_num] = chunk_pages[page_num]
+                    yield ('pagina', doc_id, page_num, chunk_pages[page_num])
+            
+            if erro is None and cache is not None:
+                cache.put(pdf_path, pages, modo)
+            yield ('fim_pdf', doc_id, len(pages), erro)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def default_worker_count():
+    """Número padrão de processos para a extração paralela (núcleos disponíveis)"""
+    return max(1, os.cpu_count() or 1)
+
+
+# ==================== PIPELINE DE PROCESSAMENTO ====================
+
+def slowest_pdfs(pdfs, n=3):
+    """Os n PDFs (itens de resumo['pdfs']) com menos páginas por segundo"""
+    medidos = [p for p in pdfs if p.get('paginas') and p.get('segundos')]
+    return sorted(medidos, key=lambda p: p['paginas_por_segundo'])[:n]
+
+
+def format_time(seconds):
+    """Formata segundos para formato legível com milissegundos"""
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, secs = divmod(remainder, 60)
+    milliseconds = int((seconds % 1) * 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{milliseconds:03d}"
+
+
+def get_pdf_fingerprint(pdf_path):
+    """Identificador antigo do PDF (nome + tamanho + data modificação); ver ProcessedHistory"""
+    try:
+        stat = os.stat(pdf_path)
+        return f"{os.path.basename(pdf_path)}_{stat.st_size}_{stat.st_mtime}"
+    except:
+        return None
+
+
+# Impressão digital por conteúdo: blocos lidos do início, meio e fim do arquivo
+FINGERPRINT_SAMPLE_SIZE = 64 * 1024
+
+
+def sample_pdf_hash(pdf_path, size):
+    """Hash rápido por amostragem: tamanho + blocos do início, meio e fim do arquivo"""
+    h = hashlib.blake2b(str(size).encode('ascii'), digest_size=16)
+    with open(pdf_path, 'rb') as f:
+        if size <= 3 * FINGERPRINT_SAMPLE_SIZE:
+            h.update(f.read())
+        else:
+            for offset in (0, size // 2, size - FINGERPRINT_SAMPLE_SIZE):
+                f.seek(offset)
+                h.update(f.read(FINGERPRINT_SAMPLE_SIZE))
+    return h.hexdigest()
+
+
+def full_pdf_hash(pdf_path):
+    """Hash SHA-256 de todo o conteúdo do arquivo (leitura em blocos)"""
+    h = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+# Hash completo já calculado por arquivo, compartilhado pelo histórico, pelo cache de páginas
+# e pelo índice de busca: cada PDF é lido e hasheado por inteiro uma vez
+_full_hash_memo = {}
+_full_hash_lock = threading.Lock()
+
+
+def file_identity(stat):
+    """Chave de um arquivo enquanto ele não mudar: (dispositivo, inode, tamanho, mtime)"""
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def remember_full_pdf_hash(chave, digest):
+    """Registra um hash completo já conhecido (ex.: lido do histórico) para a chave do arquivo"""
+    if digest:
+        with _full_hash_lock:
+            _full_hash_memo[chave] = digest
+
+
+def cached_full_pdf_hash(pdf_path):
+    """full_pdf_hash memorizado enquanto o arquivo não mudar (OSError se não puder ser lido)"""
+    chave = file_identity(os.stat(pdf_path))
+    with _full_hash_lock:
+        digest = _full_hash_memo.get(chave)
+    if digest is None:
+        digest = full_pdf_hash(pdf_path)
+        remember_full_pdf_hash(chave, digest)
+    return digest
+
+
+# Gravação do histórico em lotes: confirma a cada N PDFs ou após alguns segundos
+HISTORY_COMMIT_BATCH = 50
+HISTORY_COMMIT_INTERVAL = 2.0
+
+
+class ProcessedHistory:
+    """
+    Histórico de PDFs processados em SQLite (modo WAL), indexado pela impressão digital do PDF.
+    
+    Cada PDF processado é um INSERT (O(1)) em vez de regravar o JSON inteiro; as inserções são
+    confirmadas em lotes (HISTORY_COMMIT_BATCH / HISTORY_COMMIT_INTERVAL) e em flush(), e uma
+    interrupção no meio da gravação não corrompe o histórico já confirmado.
+    Na primeira abertura o pdfs_processados.json antigo (legacy_json) é importado e renomeado
+    para .migrado. Se o SQLite não puder ser usado, o histórico fica só em memória.
+    
+    Os PDFs são identificados pelo CONTEÚDO ("sha256:<hash>"): um export renomeado ou baixado
+    de novo continua reconhecido. A verificação usa primeiro o hash por amostragem
+    (sample_pdf_hash, coluna indexada) e só lê o arquivo inteiro quando a amostra coincide com a
+    de um PDF já processado. Os dois hashes ficam guardados por (dispositivo, inode, tamanho,
+    mtime), então um arquivo inalterado não é relido nas próximas execuções.
+    """
+    
+    def __init__(self, db_path="pdfs_processados.sqlite", legacy_json=None):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._pendentes = {}  # impressão digital -> dados ainda não confirmados
+        self._ultimo_commit = time.time()
+        self._memoria = {}    # usado só se o SQLite estiver indisponível
+        self._hashes = {}     # (dispositivo, inode, tamanho, mtime) -> [amostra, completo]
+        self._hashes_pendentes = {}
+        self._conn = None
+        try:
+            self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            with self._conn:
+                self._conn.execute("""
+                    CREATE TABLE IF NOT EXISTS processados (
+                        fingerprint TEXT PRIMARY KEY,
+                        nome TEXT,
+                        data TEXT,
+                        extraidos INTEGER,
+                        nao_encontrados INTEGER
+                    )
+                """)
+                colunas = [row[1] for row in self._conn.execute("PRAGMA table_info(processados)")]
+                if 'amostra' not in colunas:
+                    self._conn.execute("ALTER TABLE processados ADD COLUMN amostra TEXT")
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_processados_amostra ON processados (amostra)")
+                self._conn.execute("""
+                    CREATE TABLE IF NOT EXISTS arquivos (
+                        dispositivo INTEGER NOT NULL,
+                        inode INTEGER NOT NULL,
+                        tamanho INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL,
+                        amostra TEXT,
+                        completo TEXT,
+                        PRIMARY KEY (dispositivo, inode, tamanho, mtime_ns)
+                    )
+                """)
+        except Exception as e:
+            print(f"Histórico em SQLite indisponível, usando memória: {e}")
+            self._conn = None
+        if legacy_json:
+            self._migrate(legacy_json)
+    
+    @property
+    def enabled(self):
+        return self._conn is not None
+    
+    def _migrate(self, legacy_json):
+        """Importa o histórico JSON das versões anteriores (uma única vez)"""
+        if not os.path.exists(legacy_json):
+            return
+        try:
+            with open(legacy_json, 'r', encoding='utf-8') as f:
+                antigos = json.load(f)
+        except Exception as e:
+            print(f"Erro ao ler histórico antigo {legacy_json}: {e}")
+            return
+        if not self.enabled:
+            self._memoria.update(antigos)
+            return
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO processados (fingerprint, nome, data, extraidos, nao_encontrados, amostra) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [self._row(fingerprint, info) for fingerprint, info in antigos.items()]
+                )
+            os.replace(legacy_json, legacy_json + ".migrado")
+        except Exception as e:
+            print(f"Erro ao migrar histórico antigo: {e}")
+    
+    @staticmethod
+    def _row(fingerprint, info):
+        info = info or {}
+        return (fingerprint, info.get('nome'), info.get('data'),
+                info.get('extraidos'), info.get('nao_encontrados'), info.get('amostra'))
+    
+    def __contains__(self, fingerprint):
+        return self.get(fingerprint) is not None
+    
+    def __len__(self):
+        with self._lock:
+            if not self.enabled:
+                return len(self._memoria)
+            confirmados = self._conn.execute("SELECT COUNT(*) FROM processados").fetchone()[0]
+            return confirmados + len(self._pendentes)
+    
+    def get(self, fingerprint):
+        """Dados de um PDF processado ({'nome', 'data', 'extraidos', 'nao_encontrados', 'amostra'}) ou None"""
+        with self._lock:
+            if not self.enabled:
+                return self._memoria.get(fingerprint)
+            if fingerprint in self._pendentes:
+                return self._pendentes[fingerprint]
+            row = self._conn.execute(
+                "SELECT nome, data, extraidos, nao_encontrados, amostra FROM processados WHERE fingerprint = ?",
+                (fingerprint,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('nome', 'data', 'extraidos', 'nao_encontrados', 'amostra'), row))
+    
+    def _file_hashes(self, pdf_path):
+        """Entrada [amostra, completo] do cache de hashes do arquivo (criada se não existir)"""
+        stat = os.stat(pdf_path)
+        chave = file_identity(stat)
+        with self._lock:
+            entrada = self._hashes.get(chave)
+            if entrada is None and self.enabled:
+                row = self._conn.execute(
+                    "SELECT amostra, completo FROM arquivos WHERE dispositivo = ? AND inode = ? "
+                    "AND tamanho = ? AND mtime_ns = ?", chave
+                ).fetchone()
+                if row is not None:
+                    entrada = self._hashes[chave] = list(row)
+                    # O cache de páginas e o índice de busca aproveitam o hash já gravado
+                    remember_full_pdf_hash(chave, row[1])
+        if entrada is None:
+            entrada = [sample_pdf_hash(pdf_path, stat.st_size), None]
+            with self._lock:
+                entrada = self._hashes.setdefault(chave, entrada)
+                self._hashes_pendentes[chave] = entrada
+        return chave, entrada
+    
+    def sample_hash(self, pdf_path):
+        """Hash por amostragem do PDF (memorizado por inode/tamanho/mtime) ou None"""
+        try:
+            return self._file_hashes(pdf_path)[1][0]
+        except OSError:
+            return None
+    
+    def content_fingerprint(self, pdf_path):
+        """Impressão digital por conteúdo ("sha256:<hash>"), lendo o arquivo só uma vez"""
+        try:
+            chave, entrada = self._file_hashes(pdf_path)
+            if entrada[1] is None:
+                completo = cached_full_pdf_hash(pdf_path)
+                with self._lock:
+                    entrada[1] = completo
+                    self._hashes_pendentes[chave] = entrada
+        except OSError:
+            return None
+        return f"sha256:{entrada[1]}"
+    
+    def _has_sample(self, amostra):
+        with self._lock:
+            if any(info.get('amostra') == amostra for info in self._pendentes.values()):
+                return True
+            if not self.enabled:
+                return any((info or {}).get('amostra') == amostra for info in self._memoria.values())
+            return self._conn.execute(
+                "SELECT 1 FROM processados WHERE amostra = ? LIMIT 1", (amostra,)
+            ).fetchone() is not None
+    
+    def find_processed(self, pdf_path):
+        """
+        Impressão digital com que o PDF já consta no histórico, ou None se ele é novo.
+        Um PDF registrado com o identificador antigo (nome + tamanho + mtime, históricos
+        migrados) passa a ser registrado pelo conteúdo na primeira vez que é visto
+        (_rekey_legacy); daí em diante uma edição que preserve a data também é percebida.
+        """
+        legado = get_pdf_fingerprint(pdf_path)
+        if legado:
+            info = self.get(legado)
+            if info is not None:
+                return self._rekey_legacy(legado, info, pdf_path)
+        amostra = self.sample_hash(pdf_path)
+        if amostra is None or not self._has_sample(amostra):
+            return None
+        # Mesma amostra de um PDF já processado: confirmar pelo conteúdo completo
+        fingerprint = self.content_fingerprint(pdf_path)
+        return fingerprint if fingerprint and fingerprint in self else None
+    
+    def _rekey_legacy(self, legado, info, pdf_path):
+        """
+        Troca a entrada com o identificador antigo pela impressão digital do conteúdo (numa
+        transação só); retorna a impressão digital com que o PDF fica no histórico.
+        """
+        fingerprint = self.content_fingerprint(pdf_path)
+        if fingerprint is None:
+            return legado
+        info = dict(info, amostra=self.sample_hash(pdf_path))
+        with self._lock:
+            if not self.enabled:
+                self._memoria.pop(legado, None)
+                self._memoria[fingerprint] = info
+                return fingerprint
+            self._pendentes.pop(legado, None)
+            self._pendentes.pop(fingerprint, None)
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO processados (fingerprint, nome, data, extraidos, nao_encontrados, amostra) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", self._row(fingerprint, info))
+                    self._conn.execute("DELETE FROM processados WHERE fingerprint = ?", (legado,))
+            except Exception as e:
+                print(f"Erro ao atualizar histórico: {e}")
+                return legado
+        return fingerprint
+    
+    def record(self, fingerprint, info):
+        """Registra um PDF processado (confirmado no próximo lote)"""
+        with self._lock:
+            if not self.enabled:
+                self._memoria[fingerprint] = info
+                return
+            self._pendentes[fingerprint] = info
+            cheio = len(self._pendentes) >= HISTORY_COMMIT_BATCH
+            if cheio or time.time() - self._ultimo_commit >= HISTORY_COMMIT_INTERVAL:
+                self._commit()
+    
+    def _commit(self):
+        # Chamado com o lock já adquirido
+        if self._pendentes or self._hashes_pendentes:
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO processados (fingerprint, nome, data, extraidos, nao_encontrados, amostra) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        [self._row(fingerprint, info) for fingerprint, info in self._pendentes.items()]
+                    )
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO arquivos VALUES (?, ?, ?, ?, ?, ?)",
+                        [chave + tuple(entrada) for chave, entrada in self._hashes_pendentes.items()]
+                    )
+                self._pendentes.clear()
+                self._hashes_pendentes.clear()
+            except Exception as e:
+                print(f"Erro ao salvar histórico: {e}")
+        self._ultimo_commit = time.time()
+    
+    def flush(self):
+        """Confirma os registros pendentes"""
+        with self._lock:
+            if self.enabled:
+                self._commit()
+    
+    def compact(self):
+        """Compacta o arquivo: aplica o WAL ao banco e libera o espaço de registros apagados"""
+        with self._lock:
+            if not self.enabled:
+                return
+            try:
+                self._commit()
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self._conn.execute("VACUUM")
+            except Exception as e:
+                print(f"Erro ao compactar histórico: {e}")
+    
+    def clear(self):
+        """Apaga todo o histórico (o cache de hashes dos arquivos é mantido)"""
+        with self._lock:
+            self._pendentes.clear()
+            self._memoria.clear()
+            if self.enabled:
+                with self._conn:
+                    self._conn.execute("DELETE FROM processados")
+        self.compact()
+    
+    def close(self):
+        """Confirma os pendentes e aplica o WAL ao banco"""
+        with self._lock:
+            if not self.enabled:
+                return
+            self._commit()
+            try:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except Exception:
+                pass
+
+
+def open_processed_history(path):
+    """
+    Abre o histórico de PDFs processados.
+    Um caminho .json (formato antigo) usa o .sqlite de mesmo nome e migra o JSON, se existir.
+    """
+    if path.lower().endswith('.json'):
+        return ProcessedHistory(os.path.splitext(path)[0] + ".sqlite", legacy_json=path)
+    return ProcessedHistory(path)
+
+
+def detect_roster_columns(df):
+    """Auto-detecta as colunas conta/agência/nome/ccusto (nome da coluna ou None)"""
+    return {
+        'conta': find_column(df, ['conta', 'account', 'conta corrente']),
+        'agencia': find_column(df, ['agencia', 'agência', 'ag', 'agency']),
+        'nome': find_column(df, ['nome social', 'nome', 'funcionario']),
+        'ccusto': find_column(df, ['descrição ccusto', 'descricao ccusto', 'descrição de ccusto', 'descricao de ccusto', 'desc ccusto', 'ccusto', 'centro de custo', 'setor']),
+    }
+
+
+def load_roster(path, log=print, cache=None):
+    """
+    Lê a planilha de funcionários e detecta as colunas.
+    Retorna (df, colunas) onde colunas = {'conta', 'agencia', 'nome', 'ccusto'} -> nome da coluna (ou None).
+    
+    A planilha é lida UMA vez: os cabeçalhos vêm de uma leitura sem linhas (nrows=0) e a
+    leitura completa já força conta e agência como texto. Com um RosterCache, uma planilha
+    que não mudou é carregada direto do cache.
+    """
+    cached = cache.get(path) if cache is not None else None
+    if cached is not None:
+        df, colunas = cached
+        log(f"⚡ Planilha carregada do cache")
+    else:
+        # Leitura só dos cabeçalhos para detectar colunas
+        colunas = detect_roster_columns(pd.read_excel(path, nrows=0))
+        
+        # Ler o Excel forçando conta e agência como TEXTO para preservar zeros à esquerda
+        dtype_dict = {}
+        if colunas['conta']:
+            dtype_dict[colunas['conta']] = str
+        if colunas['agencia']:
+            dtype_dict[colunas['agencia']] = str
+        df = pd.read_excel(path, dtype=dtype_dict or None)
+        if cache is not None:
+            cache.put(path, df, colunas)
+    
+    if colunas['conta'] or colunas['agencia']:
+        log(f"ℹ️ Colunas Conta/Agência lidas como TEXTO (preserva zeros à esquerda)")
+    log(f"Colunas: {len(df.columns)} | Registros: {len(df)}")
+    log(f"✓ Detectadas: Conta={colunas['conta']}, Agência={colunas['agencia']}, Nome={colunas['nome']}, CCusto={colunas['ccusto']}")
+    return df, colunas
+
+
+def list_pdf_files(pdf_folder, log=print):
+    """Lista os PDFs da pasta usando múltiplos métodos (compatível com OneDrive)"""
+    pdf_files_set = set()
+    
+    # Método 1: os.listdir
+    try:
+        files_listdir = [f for f in os.listdir(pdf_folder) if f.lower().endswith('.pdf')]
+        pdf_files_set.update(files_listdir)
+        log(f"ℹ️ Método listdir: {len(files_listdir)} PDFs")
+    except Exception as e:
+        log(f"⚠️ Erro com listdir: {e}")
+    
+    # Método 2: Path.iterdir (confiável para OneDrive)
+    try:
+        path_obj = Path(pdf_folder)
+        files_iterdir = [f.name for f in path_obj.iterdir() if f.is_file() and f.suffix.lower() == '.pdf']
+        pdf_files_set.update(files_iterdir)
+        log(f"ℹ️ Método iterdir: {len(files_iterdir)} PDFs")
+    except Exception as e:
+        log(f"⚠️ Erro com iterdir: {e}")
+    
+    # Método 3: os.scandir (eficiente)
+    try:
+        with os.scandir(pdf_folder) as entries:
+            files_scandir = [e.name for e in entries if e.is_file() and e.name.lower().endswith('.pdf')]
+        pdf_files_set.update(files_scandir)
+        log(f"ℹ️ Método scandir: {len(files_scandir)} PDFs")
+    except Exception as e:
+        log(f"⚠️ Erro com scandir: {e}")
+    
+    return sorted(list(pdf_files_set))
+
+
+# Linha válida da planilha, já normalizada (imutável)
+RosterEntry = namedtuple('RosterEntry', [
+    'linha',            # índice da linha no DataFrame
+    'conta', 'agencia', 'nome', 'ccusto',  # valores como estão na planilha (texto)
+    'conta_norm', 'agencia_norm',          # só dígitos
+    'nome_arquivo', 'ccusto_arquivo',      # limpos para nome de arquivo/pasta
+    'nome_saida',                          # nome base do comprovante: CCUSTO_NOME
+    'busca_alternativa',                   # conta/agência vieram de outras colunas
+])
+
+
+class RosterTable:
+    """
+    Planilha compilada UMA vez (compile_roster) e reutilizada por todos os PDFs do
+    processamento, pela análise de páginas sem match e pela busca assistida.
+    
+    entries: tupla de RosterEntry na ordem da planilha (linhas válidas para extração).
+    search_items: registros com conta preenchida, no formato da busca assistida.
+    O índice de match e os conjuntos de contas são montados na primeira vez que são pedidos.
+    """
+    
+    def __init__(self, entries, search_items=()):
+        self.entries = tuple(entries)
+        self.search_items = tuple(search_items)
+        self._matcher = None
+        self._account_sets = None
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def __iter__(self):
+        return iter(self.entries)
+    
+    def __getitem__(self, idx):
+        return self.entries[idx]
+    
+    def matcher(self):
+        """AccountMatcher da planilha inteira (montado uma vez)"""
+        with self._lock:
+            if self._matcher is None:
+                self._matcher = AccountMatcher([(e.conta_norm, e.agencia_norm) for e in self.entries])
+            return self._matcher
+    
+    def account_sets(self):
+        """
+        Conjuntos para saber se uma conta do PDF está cadastrada:
+        (conta_agencia, agencia_conta, contas), com chaves "conta_agencia" normalizadas.
+        """
+        with self._lock:
+            if self._account_sets is None:
+                combinadas = set()
+                invertidas = set()  # Para detectar inversões conta<->agência na planilha
+                contas = set()      # Conta isolada
+                for e in self.entries:
+                    if e.conta_norm:
+                        contas.add(e.conta_norm)
+                    if e.conta_norm and e.agencia_norm:
+                        combinadas.add(f"{e.conta_norm}_{e.agencia_norm}")
+                        invertidas.add(f"{e.agencia_norm}_{e.conta_norm}")
+                self._account_sets = (combinadas, invertidas, contas)
+            return self._account_sets
+
+
+def _text_column(series):
+    """Coluna como texto sem espaços nas pontas; células vazias/NaN viram ''"""
+    present = series.notna()
+    text = series.where(present, '').astype(str).str.strip()
+    return text.where(present, '')
+
+
+def compile_roster(df, colunas):
+    """
+    Resolve as linhas válidas da planilha (nome/ccusto obrigatórios, conta/agência com
+    busca em outras colunas quando vazias) usando operações vetorizadas do pandas.
+    Retorna um RosterTable; deve ser chamado uma vez por planilha carregada.
+    """
+    conta_col = colunas['conta']
+    agencia_col = colunas['agencia']
+    nome_col = colunas['nome']
+    ccusto_col = colunas['ccusto']
+    
+    conta = _text_column(df[conta_col])
+    # Sem coluna de agência a planilha ainda serve para a busca assistida
+    agencia = _text_column(df[agencia_col]) if agencia_col else pd.Series('', index=df.index)
+    nome = _text_column(df[nome_col])
+    ccusto = _text_column(df[ccusto_col])
+    
+    # Registros para a busca assistida: qualquer linha com conta preenchida
+    search_items = [
+        {'conta': c, 'nome': n or 'N/A', 'ccusto': cc or 'N/A'}
+        for c, n, cc in zip(conta, nome, ccusto) if c
+    ]
+    
+    # Campos obrigatórios
+    valid = nome.ne('') & ccusto.ne('')
+    conta = conta.where(valid, '')
+    agencia = agencia.where(valid, '')
+    
+    # Para conta e agência vazias, buscar valores numéricos nas OUTRAS COLUNAS (exceto textos)
+    alternativa = valid & (conta.eq('') | agencia.eq(''))
+    if alternativa.any():
+        candidatos = []
+        for col_name in df.columns:
+            if col_name in [nome_col, ccusto_col]:  # Pular colunas de texto
+                continue
+            valores = _text_column(df.loc[alternativa, col_name])
+            # Valor numérico válido (pode ter hífen para DV) com pelo menos 3 dígitos
+            numerico = valores.str.match(r'^[\d\-\.]+$') & \
+                valores.str.replace(r'[^0-9]', '', regex=True).str.len().ge(3)
+            candidatos.append(valores.where(numerico, ''))
+        
+        for pos, row_idx in enumerate(alternativa[alternativa].index):
+            valores_encontrados = [col.iat[pos] for col in candidatos if col.iat[pos]]
+            if not valores_encontrados:
+                continue
+            # Usar os 2 primeiros; com 1 só valor ele serve de conta e de agência
+            if not conta.at[row_idx]:
+                conta.at[row_idx] = valores_encontrados[0]
+            if not agencia.at[row_idx]:
+                agencia.at[row_idx] = valores_encontrados[1] if len(valores_encontrados) > 1 else valores_encontrados[0]
+    
+    # Se ainda não tem conta E agência, a linha fica de fora
+    valid &= conta.ne('') & agencia.ne('')
+    conta = conta[valid]
+    agencia = agencia[valid]
+    nome = nome[valid]
+    ccusto = ccusto[valid]
+    conta_norm = conta.str.replace(r'[^0-9]', '', regex=True)
+    agencia_norm = agencia.str.replace(r'[^0-9]', '', regex=True)
+    nome_arquivo = nome.map(clean_filename)
+    ccusto_arquivo = ccusto.map(clean_filename)
+    nome_saida = ccusto_arquivo + '_' + nome_arquivo
+    
+    entries = [RosterEntry(*campos) for campos in zip(
+        conta.index, conta, agencia, nome, ccusto, conta_norm, agencia_norm,
+        nome_arquivo, ccusto_arquivo, nome_saida, alternativa[valid])]
+    return RosterTable(entries, search_items)
+
+
+# Tamanho das filas entre os estágios do pipeline (limita a memória em lotes grandes)
+PAGE_QUEUE_SIZE = 64
+WRITE_QUEUE_SIZE = 32
+# Threads gravando comprovantes ao mesmo tempo (sobrepõe a latência de disco/rede)
+WRITER_THREADS = 4
+
+
+def _queue_put(q, item, parar):
+    """Coloca um item na fila, desistindo se o pipeline for interrompido; retorna True se colocou"""
+    while not parar.is_set():
+        try:
+            q.put(item, timeout=0.2)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _queue_get(q, parar):
+    """Retira um item da fila; retorna None se o pipeline for interrompido"""
+    while not parar.is_set():
+        try:
+            return q.get(timeout=0.2)
+        except queue.Empty:
+            continue
+    return None
+
+
+# Intervalo mínimo entre eventos 'progresso' (segundos)
+PROGRESS_EVENT_INTERVAL = 0.5
+
+
+class ProgressTracker:
+    """
+    Andamento do processamento para os eventos 'progresso' do pipeline: etapa, páginas lidas
+    (e o total estimado), comprovantes gravados, bytes lidos, páginas por segundo e tempo restante.
+    
+    O avanço é medido em bytes dos PDFs: os PDFs concluídos contam inteiros e o PDF atual na
+    proporção das páginas já lidas. O total de páginas soma as contagens conhecidas e estima o
+    restante pela média de páginas por byte. Eventos de página são limitados a um a cada
+    PROGRESS_EVENT_INTERVAL segundos; os de fim de PDF e de etapa sempre saem.
+    """
+    
+    def __init__(self, tamanhos, emit, intervalo=PROGRESS_EVENT_INTERVAL):
+        self.tamanhos = list(tamanhos)  # bytes de cada PDF (na ordem do processamento)
+        self.total_bytes = sum(self.tamanhos)
+        self.emit = emit
+        self.intervalo = intervalo
+        self.inicio = time.time()
+        self.etapa = 'extracao'
+        self.paginas = 0
+        self.comprovantes = 0
+        self.bytes_concluidos = 0
+        self.paginas_concluidas = 0  # páginas dos PDFs concluídos
+        self.doc_atual = None
+        self.paginas_doc = 0
+        self.total_doc = None
+        self._ultimo = 0.0
+        self._lock = threading.Lock()
+    
+    def start_doc(self, doc_id, pdf_path):
+        """Início de um PDF: conta as páginas (leitura rápida) para medir o avanço dentro dele"""
+        self.doc_atual = doc_id
+        self.paginas_doc = 0
+        try:
+            self.total_doc = count_pdf_pages(pdf_path)
+        except Exception:
+            self.total_doc = None
+    
+    def page(self):
+        """Uma página do PDF atual foi lida e casada"""
+        self.paginas += 1
+        self.paginas_doc += 1
+        if time.time() - self._ultimo >= self.intervalo:
+            self.send()
+    
+    def output(self):
+        """Um comprovante foi gravado (ou mantido); chamado pelas threads de gravação"""
+        with self._lock:
+            self.comprovantes += 1
+    
+    def finish_doc(self, doc_id, total_paginas):
+        """Fim da leitura de um PDF"""
+        self.bytes_concluidos += self.tamanhos[doc_id]
+        self.paginas_concluidas += total_paginas
+        self.doc_atual = None
+        self.send()
+    
+    def set_stage(self, etapa):
+        """Muda a etapa ('extracao', 'analise', 'concluido') e informa"""
+        self.etapa = etapa
+        self.send()
+    
+    def snapshot(self):
+        """Dados do evento 'progresso'"""
+        lidos = self.bytes_concluidos
+        paginas_conhecidas = self.paginas_concluidas
+        bytes_conhecidos = self.bytes_concluidos
+        if self.doc_atual is not None:
+            if self.total_doc:
+                lidos += self.tamanhos[self.doc_atual] * min(1.0, self.paginas_doc / self.total_doc)
+                paginas_conhecidas += self.total_doc
+                bytes_conhecidos += self.tamanhos[self.doc_atual]
+        if self.etapa != 'extracao' or not self.total_bytes:
+            fracao = 1.0
+        else:
+            fracao = lidos / self.total_bytes
+        paginas_total = None
+        if bytes_conhecidos:
+            paginas_total = round(paginas_conhecidas * self.total_bytes / bytes_conhecidos)
+        decorrido = time.time() - self.inicio
+        eta = None
+        if 0 < fracao < 1:
+            eta = round(decorrido * (1 - fracao) / fracao, 1)
+        elif fracao >= 1:
+            eta = 0.0
+        return {
+            'etapa': self.etapa,
+            'paginas': self.paginas,
+            'paginas_total': paginas_total,
+            'comprovantes': self.comprovantes,
+            'bytes_lidos': int(lidos),
+            'bytes_total': self.total_bytes,
+            'fracao': round(fracao, 4),
+            'paginas_por_segundo': round(self.paginas / decorrido, 1) if decorrido > 0 else 0.0,
+            'segundos': round(decorrido, 3),
+            'eta_segundos': eta,
+        }
+    
+    def send(self):
+        self._ultimo = time.time()
+        self.emit('progresso', **self.snapshot())
+
+
+# Locais de alocação listados no perfil de memória
+PROFILE_TOP_ALLOCATIONS = 15
+
+
+class StageProfiler:
+    """
+    Instrumentação do processamento (ativada pelo modo debug): tempo de parede e número de
+    chamadas por etapa ('extracao', 'match', 'gravacao', 'historico', 'log',
+    'analise', 'indice') e por PDF, e memória Python via tracemalloc. Para cada etapa, guarda a maior
+    memória em uso ao fim de uma chamada. Para cada PDF, guarda o pico de memória enquanto ele
+    estava sendo lido. As etapas rodam em threads simultâneas, então os tempos se sobrepõem;
+    com workers > 1, 'extracao' é o tempo esperando as páginas dos processos do pool.
+    Desativado, measure() devolve um contexto vazio e nada é medido.
+    """
+    
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.etapas = {}  # etapa -> [segundos, chamadas, memória_máx]
+        self.pdfs = {}    # pdf -> {'etapas': {etapa -> [segundos, chamadas]}, 'pico_memoria': bytes}
+        self._inicio = None
+        self._tracemalloc = False
+        self._lock = threading.Lock()
+    
+    def start(self):
+        if not self.enabled:
+            return
+        self._inicio = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracemalloc = True
+    
+    def stop(self):
+        """Encerra o tracemalloc (se foi iniciado aqui); os dados medidos são mantidos"""
+        if self._tracemalloc:
+            tracemalloc.stop()
+            self._tracemalloc = False
+    
+    def measure(self, etapa, pdf=None):
+        """Contexto que soma o tempo do bloco à etapa (e ao PDF, se informado)"""
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return self._measure(etapa, pdf)
+    
+    @contextlib.contextmanager
+    def _measure(self, etapa, pdf):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(etapa, time.perf_counter() - t0, pdf)
+    
+    def wrap(self, etapa, func):
+        """Função que mede cada chamada de func na etapa (func sem alteração se desativado)"""
+        if not self.enabled:
+            return func
+        
+        def medida(*args, **kwargs):
+            with self._measure(etapa, None):
+                return func(*args, **kwargs)
+        return medida
+    
+    def add(self, etapa, segundos, pdf=None):
+        if not self.enabled:
+            return
+        memoria = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        with self._lock:
+            acumulado = self.etapas.setdefault(etapa, [0.0, 0, 0])
+            acumulado[0] += segundos
+            acumulado[1] += 1
+            acumulado[2] = max(acumulado[2], memoria)
+            if pdf is not None:
+                por_pdf = self.pdfs.setdefault(pdf, {'etapas': {}, 'pico_memoria': 0})
+                acumulado = por_pdf['etapas'].setdefault(etapa, [0.0, 0])
+                acumulado[0] += segundos
+                acumulado[1] += 1
+    
+    def pdf_start(self, pdf):
+        """Início da leitura de um PDF: zera o pico do tracemalloc"""
+        if self.enabled and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+    
+    def pdf_end(self, pdf):
+        if self.enabled and tracemalloc.is_tracing():
+            pico = tracemalloc.get_traced_memory()[1]
+            with self._lock:
+                self.pdfs.setdefault(pdf, {'etapas': {}, 'pico_memoria': 0})['pico_memoria'] = pico
+    
+    def report(self, tempos=None):
+        """Perfil em dicionário (formato do JSON salvo por save)"""
+        def etapas_dict(etapas):
+            return {etapa: {'segundos': round(v[0], 4), 'chamadas': v[1],
+                            **({'memoria_max': v[2]} if len(v) > 2 else {})}
+                    for etapa, v in sorted(etapas.items(), key=lambda item: -item[1][0])}
+        
+        perfil = {
+            'segundos_total': round(time.perf_counter() - self._inicio, 3) if self._inicio else None,
+            'tempos_pipeline': tempos or {},
+            'etapas': etapas_dict(self.etapas),
+            'pdfs': {pdf: {'etapas': etapas_dict(dados['etapas']), 'pico_memoria': dados['pico_memoria']}
+                     for pdf, dados in self.pdfs.items()},
+            'memoria': None,
+            'alocacoes': [],
+        }
+        if tracemalloc.is_tracing():
+            atual, pico = tracemalloc.get_traced_memory()
+            perfil['memoria'] = {'atual': atual, 'pico': pico}
+            estatisticas = tracemalloc.take_snapshot().statistics('lineno')[:PROFILE_TOP_ALLOCATIONS]
+            perfil['alocacoes'] = [{'local': str(est.traceback[0]), 'bytes': est.size, 'blocos': est.count}
+                                   for est in estatisticas]
+        return perfil
+    
+    def save(self, out_dir, tempos=None):
+        """Grava o perfil em JSON na pasta de saída, encerra a medição e retorna o caminho"""
+        path = os.path.join(out_dir, f"perfil_processamento_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        try:
+            perfil = self.report(tempos)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(perfil, f, ensure_ascii=False, indent=2)
+            return path
+        finally:
+            self.stop()
+
+
+class ProcessingPipeline:
+    """
+    Executa o processamento completo (listar PDFs, extrair, casar com a planilha, gravar
+    comprovantes, analisar páginas sem match e gerar relatório) sem depender da interface.
+    
+    Usado pela interface gráfica (App.process) e pelo modo linha de comando (run_cli).
+    Extração, match e gravação rodam em estágios simultâneos (ver stream_pdfs).
+    O andamento é informado por dois callbacks:
+      log(mensagem)              -> linhas de log legíveis
+      on_event(evento, **dados)  -> eventos estruturados ('inicio', 'pdf_inicio', 'progresso',
+                                    'pdf_fim', ...; ver ProgressTracker)
+    """
+    
+    def __init__(self, pdf_folder, out_dir, roster, history,
+                 page_cache=None, workers=1, force=False, debug=False, log=print, on_event=None,
+                 extrator=DEFAULT_EXTRACTOR, layout_templates=None, rematch=False, texto_completo=False,
+                 search_index=None):
+        self.pdf_folder = pdf_folder
+        self.out_dir = out_dir
+        self.roster = roster  # RosterTable (compile_roster)
+        self.history = history  # ProcessedHistory (open_processed_history)
+        self.page_cache = page_cache
+        self.workers = max(1, int(workers or 1))
+        self.force = force
+        # Reaplicar planilha: reprocessa PDFs já processados a partir do cache de páginas e só grava
+        # os comprovantes que mudaram em relação à última execução (ignorado com force)
+        self.rematch = rematch and not force
+        self.debug = debug
+        self.on_event = on_event
+        self.extrator = extrator if extrator in EXTRACTION_MODES else DEFAULT_EXTRACTOR
+        self.extraction_stats = {}  # backend -> [páginas, segundos]
+        self.layout_templates = layout_templates  # LayoutTemplates (recorte da seção no pdfplumber) ou None
+        # Índice da busca assistida (SearchIndex): cada PDF processado entra nele sem nova leitura
+        self.search_index = search_index
+        # O match só usa a seção creditada; o texto completo das páginas é opcional (PageRecord),
+        # mas o índice da busca assistida procura na página inteira
+        self.texto_completo = texto_completo or (search_index is not None and search_index.enabled)
+        # Perfil de tempo/memória por etapa no modo debug (salvo como JSON na pasta de saída)
+        self.profiler = StageProfiler(enabled=debug)
+        self.log = self.profiler.wrap('log', log)
+    
+    def emit(self, evento, **dados):
+        """Envia um evento estruturado de andamento (se houver consumidor)"""
+        if self.on_event:
+            try:
+                self.on_event(evento, **dados)
+            except Exception as e:
+                print(f"Erro no evento {evento}: {e}")
+    
+    def run(self):
+        """Executa o processamento e retorna um dicionário com o resumo"""
+        start_time = time.time()
+        tempos = {'extracao': 0.0, 'gravacao': 0.0, 'analise': 0.0}
+        pdf_folder = self.pdf_folder
+        out_dir = self.out_dir
+        resumo = {
+            'status': 'ok',
+            'pasta_pdfs': pdf_folder,
+            'pasta_saida': out_dir,
+            'pdfs_encontrados': 0,
+            'pdfs_ja_processados': 0,
+            'pdfs_duplicados': 0,
+            'pdfs_processados': 0,
+            'pdfs_reaplicados': 0,
+            'pdfs_inalterados': 0,
+            'pdfs_reextraidos': 0,
+            'paginas': 0,
+            'extraidos': 0,
+            'falhas_gravacao': 0,
+            'sem_funcionario': 0,
+            'outras': 0,
+            'relatorio_txt': None,
+            'nao_encontrados': [],
+            'pdfs': [],
+            'tempos': tempos,
+        }
+        
+        # Verificar se as pastas existem
+        if not os.path.exists(pdf_folder) or not os.path.isdir(pdf_folder):
+            self.log(f"❌ Pasta de PDFs não encontrada: {pdf_folder}")
+            resumo['status'] = 'pasta_invalida'
+            return resumo
+        
+        Path(out_dir).mkdir(parents=True, exist_ok=True)
+        
+        self.log("\n" + "="*50)
+        self.log("🚀 Iniciando processamento...")
+        self.log("="*50)
+        
+        pdf_files = list_pdf_files(pdf_folder, self.log)
+        resumo['pdfs_encontrados'] = len(pdf_files)
+        
+        if not pdf_files:
+            self.log("\n⚠️ Nenhum PDF encontrado na pasta!")
+            self.log("   💡 Dica: Se os arquivos estão no OneDrive, tente:")
+            self.log("      1. Verificar se os PDFs foram baixados localmente")
+            self.log("      2. Clicar com botão direito nos PDFs > 'Sempre manter neste dispositivo'")
+            self.log("      3. Ou mover os PDFs para uma pasta local fora do OneDrive")
+            resumo['status'] = 'sem_pdfs'
+            return resumo
+        
+        self.log(f"\n📊 Total de PDFs encontrados: {len(pdf_files)}")
+        
+        # Separar PDFs novos e já processados (ou forçar reprocessamento)
+        novos_pdfs = []
+        ja_processados = []
+        copias = []
+        amostras = {}  # hash por amostragem -> caminhos dos PDFs novos deste lote
+        # Reaplicar planilha: PDFs do histórico que entram de novo (ver stream_pdfs/_writer_stage)
+        self.reaplicados = set()
+        if self.force:
+            self.log("⚠️ Modo FORÇAR reprocessamento ativo: ignorando histórico e reprocessando todos os PDFs.")
+        elif self.rematch:
+            self.log("♻️ Modo REAPLICAR PLANILHA: PDFs já processados são casados de novo (páginas do cache) "
+                     "e só os comprovantes alterados são gravados.")
+
+        for pdf_name in pdf_files:
+            pdf_path = os.path.join(pdf_folder, pdf_name)
+
+            if not self.force and self.history.find_processed(pdf_path):
+                if not self.rematch:
+                    ja_processados.append(pdf_name)
+                    continue
+                self.reaplicados.add(pdf_path)
+            amostra = self.history.sample_hash(pdf_path)
+            if not self.force and amostra is not None and amostra in amostras:
+                # Mesma amostra de outro PDF deste lote: cópia se o conteúdo for idêntico
+                # (arquivo ilegível não tem hash e nunca é tratado como cópia)
+                conteudo = self.history.content_fingerprint(pdf_path)
+                if conteudo is not None and any(self.history.content_fingerprint(outro) == conteudo
+                                                for outro in amostras[amostra]):
+                    copias.append(pdf_name)
+                    continue
+            if amostra is not None:
+                amostras.setdefault(amostra, []).append(pdf_path)
+            novos_pdfs.append((pdf_name, pdf_path, amostra))
+        self.history.flush()
+        
+        resumo['pdfs_ja_processados'] = len(ja_processados)
+        resumo['pdfs_duplicados'] = len(copias)
+        if ja_processados:
+            self.log(f"⏭️ PDFs já processados anteriormente: {len(ja_processados)}")
+        if copias:
+            self.log(f"⏭️ Cópias de outros PDFs deste lote (ignoradas): {', '.join(copias)}")
+        
+        if not novos_pdfs:
+            self.log("\n✓ Todos os PDFs já foram processados!")
+            tempos['total'] = time.time() - start_time
+            self.log(f"⏱️ Tempo total: {format_time(tempos['total'])}")
+            resumo['status'] = 'nada_novo'
+            return resumo
+        
+        self.log(f"🆕 PDFs novos para processar: {len(novos_pdfs)}")
+        if self.reaplicados:
+            resumo['pdfs_reaplicados'] = len(self.reaplicados)
+            resumo['pdfs_reextraidos'] = self.warn_rematch_extraction(novos_pdfs)
+        if self.page_cache is not None:
+            self.page_cache.reset_stats()
+        
+        if self.workers > 1:
+            self.log(f"⚙️ Extração paralela: {self.workers} processos")
+        self.log(f"🧩 Modo de extração: {self.extrator}")
+        self.emit('inicio', pdfs=len(novos_pdfs))
+        self.progress = ProgressTracker([self.file_size(pdf_path) for _, pdf_path, _ in novos_pdfs], self.emit)
+        self.profiler.start()
+        
+        # Planilha já compilada (uma vez por carga); registrar valores vindos de outras colunas
+        if self.debug:
+            for conta_info in self.roster:
+                if conta_info.busca_alternativa:
+                    self.log(f"  📌 {conta_info.nome_arquivo}: Valores encontrados em colunas alternativas (Conta={conta_info.conta}, Ag={conta_info.agencia})")
+        
+        # Extração -> match -> gravação em fluxo contínuo
+        try:
+            estado = self.stream_pdfs(novos_pdfs, resumo, tempos)
+        except BaseException:
+            self.profiler.stop()
+            raise
+        finally:
+            with self.profiler.measure('historico'):
+                self.history.flush()
+        total_paginas_pdfs = estado['paginas']
+        total_ok = estado['ok']
+        total_nok = estado['nok']
+        total_duplicates = 0
+        paginas_com_match = estado['paginas_com_match']  # páginas que tiveram match (PDF + número da página)
+        
+        # Calcular quantas páginas dos PDFs ficaram SEM match com a planilha
+        paginas_sem_match = total_paginas_pdfs - len(paginas_com_match)
+        
+        # Comprovantes nos PDFs que NÃO têm funcionário correspondente na planilha
+        # (as páginas foram analisadas no mesmo passo da extração; aqui só se descartam as gravadas)
+        self.progress.set_stage('analise')
+        nao_encontrados = self.find_unmatched_pages(estado['candidatos'], paginas_com_match)
+
+        # Gerar arquivo TXT com comprovantes que NÃO têm funcionário na planilha
+        if nao_encontrados:
+            resumo['relatorio_txt'] = self.write_unmatched_report(nao_encontrados, len(pdf_files), total_ok)
+        
+        tempos['total'] = time.time() - start_time
+        time_str = format_time(tempos['total'])
+        
+        self.log("\n" + "="*50)
+        self.log("📊 RESUMO DO PROCESSAMENTO")
+        self.log("="*50)
+        self.log(f"📂 PDFs processados: {len(novos_pdfs)}")
+        self.log(f"📄 Total de páginas/comprovantes: {total_paginas_pdfs}")
+        self.log(f"")
+        self.log(f"✓ Comprovantes extraídos (com match): {total_ok} páginas")
+        self.log(f"✗ Comprovantes SEM cadastro: {len(nao_encontrados)} páginas")
+        self.log(f"❓ Outras páginas: {total_paginas_pdfs - total_ok - len(nao_encontrados)}")
+        self.log(f"")
+        if nao_encontrados:
+            self.log(f"📝 Relatório de páginas sem funcionário salvo em TXT")
+        if total_duplicates > 0:
+            self.log(f"⚠️ Comprovantes em múltiplas páginas: {total_duplicates}")
+        if estado['inalterados']:
+            self.log(f"♻️ Comprovantes inalterados (não regravados): {estado['inalterados']}")
+        if self.reaplicados:
+            self.log(f"♻️ PDFs reaplicados sem nenhuma alteração: {estado['pdfs_inalterados']} "
+                     f"de {len(self.reaplicados)}")
+        lentos = slowest_pdfs(resumo['pdfs'])
+        if len(resumo['pdfs']) > len(lentos) and lentos:
+            self.log("🐢 PDFs mais lentos: " + ", ".join(
+                f"{p['pdf']} ({p['segundos']:.1f}s, {p['paginas_por_segundo']} pág/s)" for p in lentos))
+        self.log(f"🧩 Extração: {format_extraction_stats(self.extraction_stats)}")
+        if self.layout_templates is not None:
+            self.layout_templates.save()
+            self.log(f"📐 Modelos de layout: {self.layout_templates.stats_text()}")
+        if self.page_cache is not None:
+            self.log(f"💾 Cache de páginas: {self.page_cache.stats_text()}")
+        self.log(f"⏱️ Tempo total: {time_str}")
+        self.log("="*50)
+        if self.profiler.enabled:
+            try:
+                resumo['arquivo_perfil'] = self.profiler.save(out_dir, dict(tempos))
+                self.log(f"🔬 Perfil de desempenho salvo: {os.path.basename(resumo['arquivo_perfil'])}")
+            except Exception as e:
+                self.log(f"⚠️ Erro ao salvar perfil de desempenho: {e}")
+        
+        resumo.update({
+            'pdfs_processados': len(novos_pdfs),
+            'paginas': total_paginas_pdfs,
+            'extraidos': total_ok,
+            'falhas_gravacao': total_nok,
+            'inalterados': estado['inalterados'],
+            'pdfs_inalterados': estado['pdfs_inalterados'],
+            'sem_funcionario': len(nao_encontrados),
+            'outras': total_paginas_pdfs - total_ok - len(nao_encontrados),
+            'nao_encontrados': nao_encontrados,
+            'extrator': self.extrator,
+            'extracao_por_backend': {backend: {'paginas': paginas, 'segundos': round(segundos, 3)}
+                                     for backend, (paginas, segundos) in self.extraction_stats.items()},
+        })
+        for key in tempos:
+            tempos[key] = round(tempos[key], 3)
+        self.progress.set_stage('concluido')
+        return resumo
+    
+    def warn_rematch_extraction(self, novos_pdfs):
+        """
+        Reaplicar planilha: avisa quais PDFs já processados não estão no cache de páginas (no
+        modo de extração atual) e por isso serão lidos de novo; retorna quantos são.
+        """
+        modo = cache_mode(self.extrator, self.layout_templates, self.texto_completo)
+        fora_do_cache = [pdf_name for pdf_name, pdf_path, _ in novos_pdfs
+                         if pdf_path in self.reaplicados and
+                         (self.page_cache is None or not self.page_cache.has(pdf_path, modo))]
+        for pdf_name in fora_do_cache:
+            self.log(f"⚠️ Reaplicar planilha: {pdf_name} não está no cache de páginas e será extraído de novo")
+        return len(fora_do_cache)
+    
+    @staticmethod
+    def file_size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+    
+    def stream_pdfs(self, novos_pdfs, resumo, tempos):
+        """
+        Extrai, casa e grava os PDFs novos em três estágios ligados por filas limitadas:
+        
+            extração (thread) --páginas--> atribuição (esta thread) --comprovantes--> gravação (thread)
+        
+        Cada página é casada assim que sai da extração e um comprovante já decidido vai para a
+        gravação enquanto o restante do PDF ainda está sendo lido, assim que chega uma página de
+        outro comprovante (as páginas seguidas do mesmo comprovante saem numa gravação só).
+        Se páginas posteriores completarem o mesmo comprovante, o arquivo é regravado com todas elas.
+        Linhas da planilha que gerariam o MESMO nome de arquivo só são gravadas no fim do PDF,
+        na ordem da planilha, para que os sufixos _1, _2 saiam como no processamento sequencial.
+        PDFs que já geraram comprovantes nesta pasta (OutputManifest) também só são gravados no
+        fim, quando as páginas finais de cada comprovante podem ser comparadas com o manifesto.
+        No mesmo passo, cada página é analisada em busca de contas fora da planilha
+        (check_unmatched_page), sem ler os PDFs de novo para o relatório, e, com um SearchIndex,
+        os PDFs ainda fora do índice da busca assistida entram nele ao terminar.
+        Retorna {'paginas', 'ok', 'nok', 'inalterados', 'pdfs_inalterados', 'paginas_com_match',
+        'candidatos'}.
+        """
+        matcher = self.roster.matcher()
+        chaves_saida = [c.nome_saida.lower() for c in self.roster]
+        nomes_saida = Counter(chaves_saida)
+        antecipar = [nomes_saida[chave] == 1 for chave in chaves_saida]
+        self.manifest = OutputManifest(self.out_dir)
+        
+        estado = {'paginas': 0, 'ok': 0, 'nok': 0, 'inalterados': 0, 'pdfs_inalterados': 0,
+                  'paginas_com_match': set(), 'candidatos': []}
+        contas_planilha = self.roster.account_sets()
+        paginas_q = queue.Queue(maxsize=PAGE_QUEUE_SIZE)
+        gravacao_q = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        parar = threading.Event()
+        falhas = []
+        
+        extrator = threading.Thread(
+            target=self._extraction_stage,
+            args=([pdf_path for _, pdf_path, _ in novos_pdfs], matcher, paginas_q, parar, tempos, falhas),
+            daemon=True)
+        gravador = threading.Thread(
+            target=self._writer_stage,
+            args=(novos_pdfs, gravacao_q, parar, estado, resumo, tempos, falhas),
+            daemon=True)
+        extrator.start()
+        gravador.start()
+        
+        try:
+            doc_atual = None
+            assigner = None
+            enviados = {}  # índice -> páginas já enviadas para gravação (PDF atual)
+            aberto = None  # comprovante antecipado ainda recebendo páginas seguidas (não enviado)
+            candidatos = []  # páginas do PDF atual com conta fora da planilha
+            adiar = False  # PDF já tem comprovantes no manifesto: gravar só no fim
+            linhas_busca = None  # linhas do índice de busca do PDF atual (None: já indexado)
+            busca_completa = True  # todas as linhas cobrem a página inteira (search_row_is_full)
+            # Com modelos de layout as páginas do pdfplumber vêm recortadas: um PDF já indexado
+            # com parte do texto não é regravado igual a cada execução
+            busca_pode_completar = self.texto_completo and self.layout_templates is None
+            while True:
+                item = _queue_get(paginas_q, parar)
+                if item is None:
+                    break
+                tipo, doc_id = item[0], item[1]
+                if doc_id != doc_atual:
+                    doc_atual = doc_id
+                    assigner = PageAssigner(matcher)
+                    enviados = {}
+                    aberto = None
+                    candidatos = []
+                    self.progress.start_doc(doc_id, novos_pdfs[doc_id][1])
+                    self.profiler.pdf_start(novos_pdfs[doc_id][0])
+                    origem = self.history.content_fingerprint(novos_pdfs[doc_id][1])
+                    adiar = origem is not None and self.manifest.has_source(origem)
+                    indexar = (self.search_index is not None and
+                               self.search_index.needs_update(novos_pdfs[doc_id][1], self.extrator,
+                                                              completo=busca_pode_completar))
+                    linhas_busca = [] if indexar else None
+                    busca_completa = True
+                    _queue_put(gravacao_q, ('inicio_pdf', doc_id, origem), parar)
+                
+                if tipo == 'pagina':
+                    page_num, page_data = item[2], item[3]
+                    with self.profiler.measure('match', novos_pdfs[doc_id][0]):
+                        conta_idx = assigner.add_page(page_num, page_data)
+                    self.progress.page()
+                    t0 = time.time()
+                    with self.profiler.measure('analise', novos_pdfs[doc_id][0]):
+                        candidato = self.check_unmatched_page(contas_planilha, novos_pdfs[doc_id][0],
+                                                              page_num, page_data)
+                    tempos['analise'] += time.time() - t0
+                    if candidato is not None:
+                        candidatos.append(candidato)
+                    if linhas_busca is not None:
+                        linhas_busca.append(search_row(page_num, page_data))
+                        busca_completa = busca_completa and search_row_is_full(page_data, self.layout_templates)
+                    if aberto is not None and aberto != conta_idx:
+                        paginas = sorted(assigner.assigned[aberto])
+                        if enviados.get(aberto) != paginas:
+                            enviados[aberto] = paginas
+                            _queue_put(gravacao_q, ('gravar', doc_id, aberto, paginas), parar)
+                        aberto = None
+                    if conta_idx is not None and antecipar[conta_idx] and not adiar:
+                        aberto = conta_idx
+                    continue
+                
+                # Fim do PDF: decidir as páginas pendentes e completar os comprovantes
+                _, _, total_paginas, erro = item
+                self.profiler.pdf_end(novos_pdfs[doc_id][0])
+                if erro is None:
+                    with self.profiler.measure('match', novos_pdfs[doc_id][0]):
+                        pendentes = assigner.finish()
+                    for conta_idx, paginas in sorted(pendentes.items()):
+                        if enviados.get(conta_idx) != paginas:
+                            _queue_put(gravacao_q, ('gravar', doc_id, conta_idx, paginas), parar)
+                    if linhas_busca is not None:
+                        with self.profiler.measure('indice', novos_pdfs[doc_id][0]):
+                            self.search_index.add_document(novos_pdfs[doc_id][1], linhas_busca, self.extrator,
+                                                           log=self.log, completo=busca_completa)
+                linhas_busca = None
+                _queue_put(gravacao_q, ('fim_pdf', doc_id, total_paginas, erro, candidatos), parar)
+                self.progress.finish_doc(doc_id, total_paginas)
+                doc_atual = None
+        except BaseException:
+            parar.set()
+            raise
+        finally:
+            if not parar.is_set():
+                gravacao_q.put(None)
+            gravador.join()
+            # Libera a extração caso ainda esteja esperando espaço na fila
+            parar.set()
+            extrator.join()
+            self.manifest.close()
+        
+        if falhas:
+            raise falhas[0]
+        return estado
+    
+    def _extraction_stage(self, pdf_paths, matcher, paginas_q, parar, tempos, falhas):
+        """
+        Estágio de extração: coloca as páginas de iter_page_stream na fila (thread própria).
+        No modo 'auto' as páginas sem match ou ambíguas já chegam refeitas com o pdfplumber
+        (nos processos do pool, com o AccountMatcher da planilha) e assim ficam no cache.
+        """
+        stream = iter_page_stream(pdf_paths, cache=self.page_cache, workers=self.workers,
+                                  extrator=self.extrator, stats=self.extraction_stats,
+                                  modelos=self.layout_templates, texto_completo=self.texto_completo,
+                                  matcher=matcher if self.extrator == 'auto' else None)
+        try:
+            while not parar.is_set():
+                t0 = time.time()
+                item = next(stream, None)
+                tempos['extracao'] += time.time() - t0
+                if item is not None:
+                    self.profiler.add('extracao', time.time() - t0, os.path.basename(pdf_paths[item[1]]))
+                if item is None or not _queue_put(paginas_q, item, parar):
+                    break
+        except Exception as e:
+            falhas.append(e)
+            parar.set()
+        finally:
+            stream.close()
+            _queue_put(paginas_q, None, parar)
+    
+    def _writer_stage(self, novos_pdfs, gravacao_q, parar, estado, resumo, tempos, falhas):
+        """
+        Estágio de gravação: reserva os nomes de saída (na ordem dos pedidos), grava os
+        comprovantes em um pool de threads e fecha cada PDF (log, histórico, relatório, eventos)
+        quando todas as suas gravações terminam.
+        Ao reaplicar a planilha, um PDF já processado cujos comprovantes saíram iguais aos do
+        manifesto (unchanged_rematch) não é registrado de novo no histórico nem volta ao relatório.
+        """
+        total = len(novos_pdfs)
+        nomes = OutputNameRegistry(self.out_dir)
+        doc = None
+        pool = ThreadPoolExecutor(max_workers=WRITER_THREADS)
+        try:
+            while True:
+                job = _queue_get(gravacao_q, parar)
+                if job is None:
+                    break
+                tipo, doc_id = job[0], job[1]
+                pdf_name, pdf_path, amostra = novos_pdfs[doc_id]
+                
+                if tipo == 'inicio_pdf':
+                    # saidas: índice -> arquivo reservado | futuros: índice -> última gravação
+                    # pendentes: índice -> páginas a regravar quando a gravação em andamento terminar
+                    # anteriores: comprovantes deste PDF no manifesto (ver previous_outputs)
+                    origem = job[2]
+                    doc = {'inicio': time.time(), 'sessao': SplitSession(pdf_path), 'origem': origem,
+                           'saidas': {}, 'futuros': {}, 'pendentes': {}, 'tarefas': [], 'inalterados': 0,
+                           'anteriores': self.previous_outputs(origem)}
+                    self.log(f"\n{'='*50}")
+                    self.log(f"📄 Processando PDF {doc_id + 1}/{total}: {pdf_name}")
+                    self.log(f"{'='*50}")
+                    self.emit('pdf_inicio', indice=doc_id + 1, total=total, pdf=pdf_name)
+                    if pdf_path in self.reaplicados and not doc['anteriores']['nomes']:
+                        self.log("⚠️ Reaplicar planilha: este PDF não tem comprovantes no manifesto desta pasta "
+                                 "(outra pasta de saída ou processado antes do manifesto); "
+                                 "os comprovantes encontrados serão gravados como novos")
+                
+                elif tipo == 'gravar':
+                    conta_idx, paginas = job[2], job[3]
+                    anterior = doc['futuros'].get(conta_idx)
+                    if anterior is not None and not anterior.done():
+                        # A gravação anterior deste comprovante ainda está em andamento: guardar só o
+                        # pedido mais recente (as páginas são cumulativas) em vez de esperar por ela
+                        doc['pendentes'][conta_idx] = paginas
+                    else:
+                        doc['pendentes'].pop(conta_idx, None)
+                        self._submit_receipt(doc, pool, nomes, pdf_name, conta_idx, paginas, estado)
+                    for pendente in [i for i in doc['pendentes'] if doc['futuros'][i].done()]:
+                        self._submit_receipt(doc, pool, nomes, pdf_name, pendente,
+                                             doc['pendentes'].pop(pendente), estado)
+                
+                else:
+                    _, _, total_paginas, erro, candidatos = job
+                    # Completar os comprovantes pendentes, esperar todas as gravações deste PDF e
+                    # liberar o arquivo de origem
+                    for conta_idx, paginas in sorted(doc['pendentes'].items()):
+                        doc['futuros'][conta_idx].result()
+                        self._submit_receipt(doc, pool, nomes, pdf_name, conta_idx, paginas, estado)
+                    doc['pendentes'].clear()
+                    ok = 0
+                    nok = 0
+                    for futuro in doc['futuros'].values():
+                        pages_written = futuro.result()[0]
+                        if pages_written > 0:
+                            ok += int(pages_written)
+                        else:
+                            nok += 1
+                    tempos['gravacao'] += sum(f.result()[2] for f in doc['tarefas'])
+                    doc['sessao'].close()
+                    estado['paginas'] += total_paginas
+                    estado['ok'] += ok
+                    estado['nok'] += nok
+                    estado['inalterados'] += doc['inalterados']
+                    segundos = time.time() - doc['inicio']
+                    
+                    if erro is not None:
+                        self.log(f"❌ Erro ao processar {pdf_name}: {erro}")
+                        resumo['pdfs'].append({'pdf': pdf_name, 'erro': str(erro)})
+                    elif self.unchanged_rematch(doc, pdf_path):
+                        estado['pdfs_inalterados'] += 1
+                        self.log(f"♻️ Nenhum comprovante deste PDF mudou com a planilha atual "
+                                 f"({doc['inalterados']} mantidos)")
+                        resumo['pdfs'].append({
+                            'pdf': pdf_name,
+                            'paginas': total_paginas,
+                            'extraidos': ok,
+                            'falhas_gravacao': nok,
+                            'inalterado': True,
+                            'bytes': self.progress.tamanhos[doc_id],
+                            'segundos': round(segundos, 3),
+                            'paginas_por_segundo': round(total_paginas / segundos, 1) if segundos > 0 else 0.0,
+                        })
+                    else:
+                        self.log(f"📄 Total de páginas neste PDF: {total_paginas}")
+                        estado['candidatos'].extend(candidatos)
+                        # Registrar PDF como processado
+                        fingerprint = self.history.content_fingerprint(pdf_path)
+                        if fingerprint:
+                            with self.profiler.measure('historico', pdf_name):
+                                self.history.record(fingerprint, {
+                                    'nome': pdf_name,
+                                    'data': time.strftime('%d/%m/%Y %H:%M:%S'),
+                                    'extraidos': ok,
+                                    'nao_encontrados': nok,
+                                    'amostra': amostra,
+                                })
+                        
+                        self.log(f"✓ Comprovantes extraídos deste PDF: {ok}")
+                        self.forget_obsolete_outputs(doc)
+                        if doc['inalterados']:
+                            self.log(f"♻️ Comprovantes inalterados (não regravados): {doc['inalterados']}")
+                        resumo['pdfs'].append({
+                            'pdf': pdf_name,
+                            'paginas': total_paginas,
+                            'extraidos': ok,
+                            'falhas_gravacao': nok,
+                            'bytes': self.progress.tamanhos[doc_id],
+                            'segundos': round(segundos, 3),
+                            'paginas_por_segundo': round(total_paginas / segundos, 1) if segundos > 0 else 0.0,
+                        })
+                    
+                    self.emit('pdf_fim', indice=doc_id + 1, total=total, pdf=pdf_name,
+                              paginas=total_paginas if erro is None else 0, extraidos=ok,
+                              bytes=self.progress.tamanhos[doc_id], segundos=round(segundos, 3))
+                    doc = None
+        except Exception as e:
+            falhas.append(e)
+            parar.set()
+        finally:
+            pool.shutdown(wait=True)
+            if doc is not None:
+                doc['sessao'].close()
+    
+    def _submit_receipt(self, doc, pool, nomes, pdf_name, conta_idx, paginas, estado):
+        """
+        Envia ao pool a gravação do comprovante de uma linha no PDF atual (ou o mantém, se já
+        está intacto na pasta). Para completar um comprovante já gravado neste PDF, a gravação
+        anterior dele precisa ter terminado (_writer_stage guarda o pedido até lá).
+        """
+        conta_info = self.roster[conta_idx]
+        anterior = doc['futuros'].get(conta_idx)
+        regravar = False
+        digest_atual = None
+        existente = self.reuse_previous_output(doc, conta_info, paginas) if anterior is None else None
+        if existente is not None and existente[1]:
+            # Mesmo comprovante já gravado e intacto na pasta: nada a gravar
+            doc['inalterados'] += 1
+            out = existente[0]['arquivo']
+            doc['saidas'][conta_idx] = out
+            futuro = pool.submit(self.keep_receipt, pdf_name, paginas, out, estado['paginas_com_match'])
+            doc['futuros'][conta_idx] = futuro
+            doc['tarefas'].append(futuro)
+            return
+        if existente is not None:
+            # Substituir o arquivo anterior deste comprovante (troca atômica)
+            out = existente[0]['arquivo']
+            regravar = True
+            digest_atual = existente[0]['sha256']
+        elif anterior is None:
+            # Salvar PDF na pasta do centro de custo (mantém prefixo de ccusto no nome)
+            out = nomes.reserve(conta_info.ccusto_arquivo, conta_info.nome_saida)
+        else:
+            # Completar um comprovante: regravar o arquivo da gravação anterior (já terminada)
+            pages_written, gravado, _ = anterior.result()
+            regravar = pages_written > 0
+            out = gravado if regravar else doc['saidas'][conta_idx]
+        doc['saidas'][conta_idx] = out
+        futuro = pool.submit(self.write_receipt, doc['sessao'], pdf_name, conta_info,
+                             paginas, out, regravar, estado['paginas_com_match'],
+                             doc['origem'], digest_atual)
+        doc['futuros'][conta_idx] = futuro
+        doc['tarefas'].append(futuro)
+    
+    def previous_outputs(self, origem):
+        """
+        Comprovantes que o PDF de origem já gerou nesta pasta (manifesto), para não regravá-los:
+        {'chaves': {(nome_saida, páginas): entrada}, 'nomes': {nome_saida: [entradas]}, 'usados': set()}
+        """
+        anteriores = {'chaves': {}, 'nomes': {}, 'usados': set()}
+        if origem is None:
+            return anteriores
+        for entrada in self.manifest.outputs_for(origem):
+            anteriores['chaves'][(entrada['nome'], tuple(entrada['paginas']))] = entrada
+            anteriores['nomes'].setdefault(entrada['nome'], []).append(entrada)
+        return anteriores
+    
+    def reuse_previous_output(self, doc, conta_info, paginas):
+        """
+        (entrada_do_manifesto, inalterado) de um comprovante que este PDF já gerou, ou None.
+        inalterado=True se o mesmo nome e as mesmas páginas já estão num arquivo intacto; caso
+        contrário o arquivo anterior com o mesmo nome (ex: conta corrigida na planilha, páginas
+        diferentes) deve ser substituído em vez de criar um novo _1, _2.
+        """
+        anteriores = doc['anteriores']
+        nome = conta_info.nome_saida.lower()
+        entrada = anteriores['chaves'].get((nome, tuple(paginas)))
+        if entrada is not None and entrada['arquivo'] not in anteriores['usados']:
+            anteriores['usados'].add(entrada['arquivo'])
+            return entrada, self.manifest.is_intact(entrada)
+        for entrada in anteriores['nomes'].get(nome, []):
+            if entrada['arquivo'] not in anteriores['usados']:
+                anteriores['usados'].add(entrada['arquivo'])
+                return entrada, False
+        return None
+    
+    @staticmethod
+    def unused_previous_outputs(doc):
+        """Entradas do manifesto deste PDF que nenhum comprovante desta execução aproveitou"""
+        anteriores = doc['anteriores']
+        return [entrada for entradas in anteriores['nomes'].values() for entrada in entradas
+                if entrada['arquivo'] not in anteriores['usados']]
+    
+    def unchanged_rematch(self, doc, pdf_path):
+        """
+        Reaplicar planilha: o PDF já estava no histórico e a nova planilha atribuiu a ele
+        exatamente os comprovantes do manifesto (mesmos nomes e páginas, arquivos intactos).
+        É a diferença entre a planilha anterior e a atual vista por este PDF: só as linhas
+        cujas páginas mudaram são gravadas, e um PDF sem nenhuma delas fica como estava.
+        """
+        return (pdf_path in self.reaplicados and doc['inalterados'] == len(doc['futuros']) and
+                not self.unused_previous_outputs(doc))
+    
+    def forget_obsolete_outputs(self, doc):
+        """
+        Retira do manifesto os comprovantes que este PDF gerou antes e não gerou nesta execução.
+        Os arquivos NÃO são apagados (podem estar em uso ou sincronizados com a nuvem).
+        """
+        for entrada in self.unused_previous_outputs(doc):
+            if self.manifest.forget(entrada['arquivo']) and os.path.exists(entrada['arquivo']):
+                rel = os.path.relpath(entrada['arquivo'], self.out_dir)
+                self.log(f"📌 Comprovante não gerado nesta execução (arquivo mantido): {rel}")
+    
+    def keep_receipt(self, pdf_name, paginas, out, paginas_com_match):
+        """Comprovante já gravado e intacto: mantém o arquivo (mesmo retorno de write_receipt)"""
+        for pag in paginas:
+            paginas_com_match.add(f"{pdf_name}|{pag}")
+        self.progress.output()
+        return len(paginas), out, 0.0
+    
+    def write_receipt(self, sessao, pdf_name, conta_info, paginas, out, regravar, paginas_com_match,
+                      origem=None, digest_atual=None):
+        """
+        Grava (ou regrava, se regravar=True) o comprovante de uma linha da planilha e o registra
+        no manifesto da pasta de saída. digest_atual: hash do arquivo que será substituído (não
+        regrava se o conteúdo for o mesmo).
+        Roda no pool de gravação; retorna (páginas_gravadas, caminho_gravado, segundos).
+        """
+        t0 = time.time()
+        nome_str = conta_info.nome_arquivo
+        ccusto_str = conta_info.ccusto_arquivo
+        
+        # Tentar criar o PDF com as páginas e obter quantas páginas foram gravadas
+        with self.profiler.measure('gravacao', pdf_name):
+            pages_written, gravado, digest, gravou = sessao.write_output(paginas, out, overwrite=regravar,
+                                                                         current_digest=digest_atual)
+        if pages_written and pages_written > 0:
+            # Registrar quais páginas tiveram match (apenas após gravação bem-sucedida)
+            for pag in paginas:
+                paginas_com_match.add(f"{pdf_name}|{pag}")
+            if origem is not None:
+                self.manifest.add(gravado, origem, conta_info.nome_saida.lower(), paginas, digest)
+            if not regravar or digest_atual is not None:
+                # (completar um comprovante já gravado neste PDF não conta um arquivo novo)
+                self.progress.output()
+            sufixo = " (atualizado)" if regravar else ""
+            if not gravou:
+                sufixo = " (inalterado)"
+            self.log(f"✓ {ccusto_str}/{ccusto_str}_{nome_str} (pág {[p+1 for p in paginas]}){sufixo}")
+        return pages_written, gravado, time.time() - t0
+    
+    def check_unmatched_page(self, contas_planilha, pdf_name, page_num, page_data):
+        """
+        Procura na seção creditada de uma página uma conta/agência que não está cadastrada na
+        planilha; retorna o item do relatório (pdf, pagina, conta, agencia, ...) ou None.
+        contas_planilha: RosterTable.account_sets() (normal, invertido e conta isolada).
+        """
+        contas_excel_set, contas_excel_invertido_set, contas_excel_conta_set = contas_planilha
+        
+        # BUSCAR APENAS NA SEÇÃO "DADOS DA CONTA CREDITADA"
+        credited_section = page_data.credited_section
+        
+        # Se não encontrou a seção, pular esta página
+        if not credited_section or len(credited_section) < 20:
+            return None
+        
+        # Buscar especificamente o campo "Conta corrente:" seguido do número
+        # Padrões possíveis: "Conta corrente: 94894 - 2", "Conta: 12345-6", "C/C: 12345-6"
+        conta_patterns = [
+            r'[Cc]onta\s*[Cc]orrente[:\s]+(\d{4,7}[\s\-]*\d?)',  # Conta corrente: 94894 - 2
+            r'[Cc]/[Cc][:\s]+(\d{4,7}[\s\-]*\d?)',               # C/C: 12345-6
+            r'[Cc]onta[:\s]+(\d{4,7}[\s\-]*\d?)',                # Conta: 12345-6
+        ]
+        
+        # Buscar agência também
+        agencia_patterns = [
+            r'[Aa]g[eê]ncia[:\s]+(\d{3,5})',  # Agência: 6677
+            r'[Aa]g[:\s]+(\d{3,5})',          # Ag: 6677
+        ]
+        
+        melhor_conta = None
+        for pattern in conta_patterns:
+            match = re.search(pattern, credited_section)
+            if match:
+                melhor_conta = match.group(1).strip()
+                break
+        
+        melhor_agencia = None
+        for pattern in agencia_patterns:
+            match = re.search(pattern, credited_section)
+            if match:
+                melhor_agencia = match.group(1).strip()
+                break
+        
+        # Se não encontrou conta ou agência, pular
+        if not melhor_conta or not melhor_agencia:
+            return None
+        
+        # Normalizar conta e agência encontradas
+        conta_norm = normalize_account(melhor_conta)
+        agencia_norm = normalize_account(melhor_agencia)
+        
+        # Filtrar contas válidas (5-7 dígitos após normalização - contas geralmente têm 5+ dígitos)
+        if not conta_norm or len(conta_norm) < 5 or len(conta_norm) > 7:
+            return None
+        
+        # Filtrar agências válidas (3-5 dígitos)
+        if not agencia_norm or len(agencia_norm) < 3 or len(agencia_norm) > 5:
+            return None
+        
+        # Criar chave combinada conta+agência
+        chave_pdf = f"{conta_norm}_{agencia_norm}"
+        # Também criar chave invertida (caso na planilha esteja conta<->agência trocados)
+        chave_pdf_invertida = f"{agencia_norm}_{conta_norm}"
+        
+        # Verificar se a combinação conta+agência está na planilha
+        # Considera: combinação normal, combinação invertida, ou conta isolada
+        esta_cadastrado = (
+            chave_pdf in contas_excel_set or 
+            chave_pdf_invertida in contas_excel_invertido_set or
+            conta_norm in contas_excel_conta_set
+        )
+        
+        if not esta_cadastrado:
+            # Extrair um trecho do texto ao redor DA SEÇÃO CREDITADA
+            pos = credited_section.find(melhor_conta)
+            if pos != -1:
+                start = max(0, pos - 80)
+                end = min(len(credited_section), pos + 150)
+                snippet = credited_section[start:end].replace('\n', ' ')
+                snippet = ' '.join(snippet.split())
+                if len(snippet) > 200:
+                    snippet = snippet[:200] + "..."
+            else:
+                snippet = ' '.join(credited_section.split())[:200] + "..."
+        
+            return {
+                'pdf': pdf_name,
+                'pagina': page_num + 1,
+                'conta': melhor_conta,
+                'agencia': melhor_agencia,
+                'conta_normalizada': conta_norm,
+                'agencia_normalizada': agencia_norm,
+                'trecho': snippet
+            }
+        return None
+    
+    def find_unmatched_pages(self, candidatos, paginas_com_match):
+        """
+        Comprovantes de contas não cadastradas: os candidatos encontrados durante o processamento
+        (check_unmatched_page) cujas páginas não foram gravadas para nenhum funcionário
+        """
+        self.log(f"\n🔍 Analisando páginas sem match para identificar contas não cadastradas...")
+        return [c for c in candidatos if f"{c['pdf']}|{c['pagina'] - 1}" not in paginas_com_match]
+    
+    def write_unmatched_report(self, nao_encontrados, total_pdfs, total_ok):
+        """Gera o TXT com comprovantes que NÃO têm funcionário na planilha; retorna o caminho"""
+        try:
+            txt_path = os.path.join(self.out_dir, f"comprovantes_sem_funcionario_{time.strftime('%Y%m%d_%H%M%S')}.txt")
+            with open(txt_path, 'w', encoding='utf-8') as f:
+                f.write("="*80 + "\n")
+                f.write("RELATÓRIO DE COMPROVANTES SEM FUNCIONÁRIO NA PLANILHA\n")
+                f.write("="*80 + "\n")
+                f.write(f"Data/Hora: {time.strftime('%d/%m/%Y %H:%M:%S')}\n")
+                f.write(f"PDFs processados: {total_pdfs}\n")
+                f.write(f"Comprovantes extraídos com sucesso: {total_ok}\n")
+                f.write(f"Comprovantes SEM funcionário na planilha: {len(nao_encontrados)}\n")
+                f.write("="*80 + "\n\n")
+                f.write("ESTES SÃO COMPROVANTES QUE EXISTEM NOS PDFs MAS NÃO TÊM\n")
+                f.write("FUNCIONÁRIO CORRESPONDENTE CADASTRADO NA PLANILHA:\n")
+                f.write("-"*80 + "\n\n")
+
+                for idx, item in enumerate(nao_encontrados, 1):
+                    f.write(f"{idx}. PDF: {item['pdf']}\n")
+                    f.write(f"   Página: {item['pagina']}\n")
+                    f.write(f"   Conta encontrada: {item['conta']}\n")
+                    f.write(f"   Agência encontrada: {item.get('agencia', 'N/A')}\n")
+                    f.write(f"   Status: Conta ou Agência NÃO cadastrada na planilha\n")
+                    f.write("-"*80 + "\n\n")
+                
+                f.write("\n" + "="*80 + "\n")
+                f.write("O QUE FAZER:\n")
+                f.write("="*80 + "\n")
+                f.write("1. Verifique se estas contas deveriam estar cadastradas na planilha\n")
+                f.write("2. Adicione os funcionários faltantes na planilha se necessário\n")
+                f.write("3. Ou ignore se forem contas inválidas/irrelevantes\n")
+                f.write("4. Reprocesse após atualizar a planilha\n")
+                f.write("="*80 + "\n")
+
+            self.log(f"📄 Relatório salvo: {os.path.basename(txt_path)}")
+            return txt_path
+        except Exception as e:
+            self.log(f"⚠️ Erro ao gerar relatório: {e}")
+            return None
 
-    finally:
-        # Limpar referências
-        writer = None
-        reader = None
 
+# ==================== MODO LINHA DE COMANDO ====================
 
-def normalize_path(path):
-    """Normaliza path garantindo encoding correto para Windows/OneDrive/Google Drive"""
-    if not path:
-        return path
+def run_cli(argv=None):
+    """
+    Modo sem interface gráfica, para servidores e agendamentos:
+    
+        python get_proof.py run --pdfs PASTA --roster PLANILHA --out PASTA [--workers N]
+    
+    Executa o mesmo pipeline da interface, escreve o andamento como linhas JSON no stdout
+    (um objeto por linha, campo "evento") e grava um resumo JSON na pasta de saída.
+    Retorna o código de saída do processo.
+    """
+    import argparse
+    
+    parser = argparse.ArgumentParser(prog='get_proof.py',
+                                     description='PD7Lab - Extrator de Comprovantes PDF (modo linha de comando)')
+    sub = parser.add_subparsers(dest='comando', required=True)
+    
+    run_p = sub.add_parser('run', help='Processa a pasta de PDFs sem interface gráfica')
+    run_p.add_argument('--pdfs', required=True, help='Pasta com os PDFs de comprovantes')
+    run_p.add_argument('--roster', required=True, help='Planilha Excel de funcionários')
+    run_p.add_argument('--out', default='comprovantes_extraidos', help='Pasta de saída')
+    run_p.add_argument('--workers', type=int, default=1, help='Processos para extração paralela (padrão: 1)')
+    run_p.add_argument('--extrator', choices=EXTRACTION_MODES, default=DEFAULT_EXTRACTOR,
+                       help='Modo de extração de texto (padrão: auto = rápido + pdfplumber quando necessário)')
+    run_p.add_argument('--force', action='store_true', help='Ignorar histórico e reprocessar todos os PDFs')
+    run_p.add_argument('--rematch', action='store_true',
+                       help='Reaplicar a planilha aos PDFs já processados (cache) e gravar só os comprovantes alterados')
+    run_p.add_argument('--debug', action='store_true', help='Log detalhado')
+    run_p.add_argument('--history', default='pdfs_processados.json', help='Histórico de PDFs processados (.sqlite; um .json antigo é migrado)')
+    run_p.add_argument('--cache', default='cache_paginas.sqlite', help='Arquivo do cache de páginas')
+    run_p.add_argument('--no-cache', action='store_true',
+                       help='Não usar os caches (páginas, planilha e índice da busca assistida)')
+    run_p.add_argument('--search-index', default='indice_busca.sqlite',
+                       help='Índice da busca assistida, atualizado com os PDFs processados')
+    run_p.add_argument('--roster-cache', default='cache_planilhas', help='Pasta do cache de planilhas lidas')
+    run_p.add_argument('--templates', default='modelos_layout.json', help='Arquivo dos modelos de layout aprendidos')
+    run_p.add_argument('--no-templates', action='store_true',
+                       help='Extrair sempre a página inteira (sem recorte por modelo de layout)')
+    run_p.add_argument('--texto-completo', action='store_true',
+                       help='Guardar o texto completo das páginas (padrão: só a seção da conta creditada, '
+                            'ou o texto completo quando o índice da busca assistida está ativo)')
+    run_p.add_argument('--summary', default=None, help='Arquivo do resumo JSON (padrão: na pasta de saída)')
+    args = parser.parse_args(argv)
+    
+    # stdout fica reservado para as linhas JSON; prints avulsos vão para o stderr
+    out_stream = sys.stdout
+    sys.stdout = sys.stderr
+    
+    def emit(evento, **dados):
+        out_stream.write(json.dumps(dict(evento=evento, **dados), ensure_ascii=False, default=str) + "\n")
+        out_stream.flush()
+    
+    def log(msg):
+        emit('log', mensagem=str(msg).strip('\n'))
     
     try:
-        # Converter para string se necessário
-        if isinstance(path, bytes):
-            path = path.decode('utf-8', errors='replace')
-        
-        path = str(path).strip()
+        try:
+            df, colunas = load_roster(normalize_path(args.roster), log,
+                                      cache=None if args.no_cache else RosterCache(args.roster_cache))
+        except Exception as e:
+            emit('erro', mensagem=f"Erro ao ler planilha: {e}")
+            return 2
+        
+        faltando = [nome for nome, col in colunas.items() if not col]
+        if faltando:
+            emit('erro', mensagem=f"Colunas não encontradas na planilha: {', '.join(faltando)}")
+            return 2
+        
+        out_dir = normalize_path(args.out)
+        history = open_processed_history(args.history)
+        pipeline = ProcessingPipeline(
+            pdf_folder=normalize_path(args.pdfs),
+            out_dir=out_dir,
+            roster=compile_roster(df, colunas),
+            history=history,
+            page_cache=None if args.no_cache else PageCache(args.cache),
+            workers=args.workers,
+            force=args.force,
+            debug=args.debug,
+            log=log,
+            on_event=emit,
+            extrator=args.extrator,
+            layout_templates=None if args.no_templates else LayoutTemplates(args.templates),
+            rematch=args.rematch,
+            texto_completo=args.texto_completo,
+            search_index=None if args.no_cache else SearchIndex(args.search_index),
+        )
+        try:
+            resumo = pipeline.run()
+        finally:
+            history.close()
         
-        # Normalizar barras para o sistema operacional
-        if platform.system() == 'Windows':
-            path = path.replace('/', '\\')
+        summary_path = args.summary
+        if not summary_path and os.path.isdir(out_dir):
+            summary_path = os.path.join(out_dir, f"resumo_processamento_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        if summary_path:
+            try:
+                with open(summary_path, 'w', encoding='utf-8') as f:
+                    json.dump(resumo, f, indent=2, ensure_ascii=False)
+                resumo['arquivo_resumo'] = summary_path
+            except Exception as e:
+                emit('erro', mensagem=f"Erro ao salvar resumo: {e}")
         
-        # Resolver Path para garantir formato correto
-        path_obj = Path(path)
-        # Usar resolve() para expandir caminhos relativos e normalizar
-        try:
-            resolved = path_obj.resolve()
-            return str(resolved)
-        except (OSError, RuntimeError):
-            # Se resolve() falhar, retornar path normalizado básico
-            return os.path.normpath(path)
-    except Exception:
-        # Fallback: retornar path original
-        return path
-
-
-def clean_filename(name):
-    """Remove caracteres inválidos"""
-    if not name or str(name).lower() == 'nan':
-        return "sem_nome"
-    name = str(name)
-    for c in '<>:"/\\|?*\n\r\t':
-        name = name.replace(c, '_')
-    return ' '.join(name.split())[:100].strip()
+        emit('resumo', **resumo)
+        return 0 if resumo['status'] in ('ok', 'nada_novo') else 1
+    
+    except Exception as e:
+        emit('erro', mensagem=str(e))
+        return 1
+    finally:
+        sys.stdout = out_stream
 
 
-def find_column(df, names):
-    """Encontra coluna pelo nome - busca exata primeiro, depois parcial"""
-    # Primeira passada: busca exata
-    for col in df.columns:
-        for name in names:
-            if str(col).lower().strip() == name.lower().strip():
-                return col
-    
-    # Segunda passada: busca parcial
-    for col in df.columns:
-        for name in names:
-            if name.lower() in str(col).lower():
-                return col
-    return None
+# Log da janela: as mensagens (de qualquer thread) entram numa fila que o Tk esvazia em lotes
+LOG_DRAIN_INTERVAL_MS = 100
+LOG_DRAIN_BATCH = 1000
+# Linhas mantidas na área de log (as mais antigas são descartadas)
+LOG_MAX_LINES = 5000
 
 
 class App:
@@ -991,6 +4515,10 @@ class App:
         self.excel_var = tk.StringVar()
         self.out_var = tk.StringVar(value="comprovantes_extraidos")
         self.df = None
+        self.roster = None  # planilha compilada (compile_roster), refeita a cada carga
+        self.roster_loading = False
+        self._roster_token = 0  # identifica a carga de planilha mais recente
+        self.roster_cache = RosterCache("cache_planilhas")
         self.conta_col = None
         self.agencia_col = None  # Nova coluna de agência
         self.nome_col = None
@@ -1000,14 +4528,24 @@ class App:
         # Option to force reprocess (ignore history)
         self.force_reprocess_var = tk.BooleanVar(value=False)
         
+        # Reaplicar planilha: casa de novo os PDFs já processados (cache) e grava só o que mudou
+        self.rematch_var = tk.BooleanVar(value=False)
+        
         # Debug mode - mostra detalhes de busca
         self.debug_mode_var = tk.BooleanVar(value=False)
         
+        # Número de processos para extração paralela (1 = serial)
+        self.workers_var = tk.IntVar(value=1)
+        self.extrator_var = tk.StringVar(value=DEFAULT_EXTRACTOR)
+        
         # Timer
         self.start_time = None
         self.timer_running = False
         self.timer_label = None
         
+        # Fila do log (write_log pode ser chamado de qualquer thread; ver drain_log)
+        self.log_queue = queue.SimpleQueue()
+        
         # Logo image
         self.logo_image = None
         self.logo_label = None
@@ -1045,10 +4583,19 @@ class App:
             }
         }
         
-        # Histórico de PDFs processados
+        # Histórico de PDFs processados (SQLite; o JSON antigo é migrado na primeira abertura)
         self.processed_pdfs_file = "pdfs_processados.json"
         self.processed_pdfs = self.load_processed_pdfs()
         
+        # Cache persistente de páginas extraídas (ao lado do histórico)
+        self.page_cache = PageCache("cache_paginas.sqlite")
+        
+        # Índice de texto completo da busca assistida (reaproveita o cache de páginas)
+        self.search_index = SearchIndex("indice_busca.sqlite", page_cache=self.page_cache)
+        
+        # Modelos de layout aprendidos (recorte da seção creditada no pdfplumber)
+        self.layout_templates_file = "modelos_layout.json"
+        
         # Controle de último processamento (para upload)
         self.last_output_folder = None
         self.last_process_stats = None
@@ -1056,30 +4603,16 @@ class App:
         self.setup_ui()
     
     def load_processed_pdfs(self):
-        """Carrega lista de PDFs já processados"""
-        try:
-            if os.path.exists(self.processed_pdfs_file):
-                with open(self.processed_pdfs_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception:
-            pass
-        return {}
+        """Abre o histórico de PDFs já processados"""
+        return open_processed_history(self.processed_pdfs_file)
     
     def save_processed_pdfs(self):
-        """Salva lista de PDFs processados"""
-        try:
-            with open(self.processed_pdfs_file, 'w', encoding='utf-8') as f:
-                json.dump(self.processed_pdfs, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"Erro ao salvar histórico: {e}")
+        """Confirma os registros pendentes do histórico"""
+        self.processed_pdfs.flush()
     
     def get_pdf_fingerprint(self, pdf_path):
         """Gera identificador único para PDF (nome + tamanho + data modificação)"""
-        try:
-            stat = os.stat(pdf_path)
-            return f"{os.path.basename(pdf_path)}_{stat.st_size}_{stat.st_mtime}"
-        except:
-            return None
+        return get_pdf_fingerprint(pdf_path)
     
     def toggle_theme(self):
         """Alterna entre tema claro e escuro"""
@@ -1296,10 +4829,22 @@ class App:
                                  variable=self.force_reprocess_var)
             chk.pack(side=tk.LEFT, padx=(4, 12))
             
+            chk_rematch = ttk.Checkbutton(options_frame, text="♻️ Reaplicar planilha (só alterações)",
+                                         variable=self.rematch_var)
+            chk_rematch.pack(side=tk.LEFT, padx=(0, 12))
+            
             chk_debug = ttk.Checkbutton(options_frame, text="🔧 Debug", 
                                        variable=self.debug_mode_var)
             chk_debug.pack(side=tk.LEFT, padx=(0, 12))
             
+            ttk.Label(options_frame, text="Processos:").pack(side=tk.LEFT, padx=(0, 4))
+            ttk.Spinbox(options_frame, from_=1, to=default_worker_count(), width=4,
+                        textvariable=self.workers_var).pack(side=tk.LEFT, padx=(0, 12))
+            
+            ttk.Label(options_frame, text="Extração:").pack(side=tk.LEFT, padx=(0, 4))
+            ttk.Combobox(options_frame, values=EXTRACTION_MODES, width=10, state='readonly',
+                         textvariable=self.extrator_var).pack(side=tk.LEFT, padx=(0, 12))
+            
             ttk.Button(options_frame, text="🗑️ Limpar Histórico", 
                       command=self.clear_processed_history, width=18).pack(side=tk.LEFT, padx=(0, 6))
             ttk.Button(options_frame, text="🔍 Buscar Não Encontrados", 
@@ -1354,6 +4899,7 @@ class App:
         self.log.tag_config('error', foreground=self.colors['error'], font=('Consolas', 9, 'bold'))
         self.log.tag_config('warning', foreground=self.colors['warning'], font=('Consolas', 9, 'bold'))
         self.log.tag_config('info', foreground=self.colors['primary_blue'], font=('Consolas', 9, 'bold'))
+        self.root.after(LOG_DRAIN_INTERVAL_MS, self.drain_log)
     
     def update_timer(self):
         """Atualiza o cronômetro a cada 100ms"""
@@ -1383,10 +4929,7 @@ class App:
     
     def format_time(self, seconds):
         """Formata segundos para formato legível com milissegundos"""
-        hours, remainder = divmod(int(seconds), 3600)
-        minutes, secs = divmod(remainder, 60)
-        milliseconds = int((seconds % 1) * 1000)
-        return f"{hours:02d}:{minutes:02d}:{secs:02d}.{milliseconds:03d}"
+        return format_time(seconds)
     
     def get_pdf_folder(self):
         """Seleciona pasta usando explorador nativo do SO"""
@@ -1479,32 +5022,45 @@ class App:
             messagebox.showerror("Erro", f"Erro ao selecionar Excel: {e}")
     
     def load_excel(self, path):
-        try:
-            # Primeira leitura para detectar colunas
-            self.df = pd.read_excel(path)
-            cols = list(self.df.columns)
-            
-            # Auto-detectar colunas (hardcoded)
-            self.conta_col = find_column(self.df, ['conta', 'account', 'conta corrente'])
-            self.agencia_col = find_column(self.df, ['agencia', 'agência', 'ag', 'agency'])
-            self.nome_col = find_column(self.df, ['nome social', 'nome', 'funcionario'])
-            self.ccusto_col = find_column(self.df, ['descrição ccusto', 'descricao ccusto', 'descrição de ccusto', 'descricao de ccusto', 'desc ccusto', 'ccusto', 'centro de custo', 'setor'])
-            
-            # Reler o Excel forçando conta e agência como TEXTO para preservar zeros à esquerda
-            dtype_dict = {}
-            if self.conta_col:
-                dtype_dict[self.conta_col] = str
-            if self.agencia_col:
-                dtype_dict[self.agencia_col] = str
-            
-            if dtype_dict:
-                self.df = pd.read_excel(path, dtype=dtype_dict)
-                self.write_log(f"ℹ️ Colunas Conta/Agência lidas como TEXTO (preserva zeros à esquerda)")
-            
-            self.write_log(f"Colunas: {len(cols)} | Registros: {len(self.df)}")
-            self.write_log(f"✓ Detectadas: Conta={self.conta_col}, Agência={self.agencia_col}, Nome={self.nome_col}, CCusto={self.ccusto_col}")
-        except Exception as e:
+        """Lê e compila a planilha em segundo plano (a janela continua respondendo)"""
+        self._roster_token += 1
+        token = self._roster_token
+        self.roster_loading = True
+        self.df = None
+        self.roster = None
+        self.write_log("⏳ Lendo planilha...")
+        
+        def apply(df, colunas, roster):
+            # Ignorar resultado de uma planilha que já foi trocada por outra
+            if token != self._roster_token:
+                return
+            self.df = df
+            self.conta_col = colunas['conta']
+            self.agencia_col = colunas['agencia']
+            self.nome_col = colunas['nome']
+            self.ccusto_col = colunas['ccusto']
+            self.roster = roster
+            self.roster_loading = False
+        
+        def fail(e):
+            if token != self._roster_token:
+                return
+            self.roster_loading = False
             self.write_log(f"Erro: {e}")
+        
+        def worker():
+            try:
+                df, colunas = load_roster(path, self.write_log, cache=self.roster_cache)
+                roster = None
+                if colunas['conta'] and colunas['nome'] and colunas['ccusto']:
+                    roster = compile_roster(df, colunas)
+                self.root.after(0, apply, df, colunas, roster)
+            except Exception as e:
+                self.root.after(0, fail, e)
+        
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        return thread
     
     def get_out(self):
         """Seleciona pasta de saída usando explorador nativo do SO"""
@@ -1565,24 +5121,46 @@ class App:
             self.write_log(f"✓ Pasta: {path}")
     
     def write_log(self, msg):
+        """Enfileira uma mensagem para o log (seguro em qualquer thread; exibida por drain_log)"""
+        self.log_queue.put(msg)
+    
+    def drain_log(self):
+        """
+        Esvazia a fila do log em lotes, numa única inserção por ciclo do Tk, e mantém só as
+        últimas LOG_MAX_LINES linhas para que a memória e o redesenho não cresçam com a execução.
+        """
+        mensagens = []
+        try:
+            while len(mensagens) < LOG_DRAIN_BATCH:
+                mensagens.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if mensagens:
+            try:
+                self.log.config(state='normal')
+                self.log.insert(tk.END, "\n".join(mensagens) + "\n")
+                excesso = int(self.log.index('end-1c').split('.')[0]) - 1 - LOG_MAX_LINES
+                if excesso > 0:
+                    self.log.delete('1.0', f"{excesso + 1}.0")
+                self.log.see(tk.END)
+                self.log.config(state='disabled')
+            except Exception:
+                # Fallback se a janela não estiver disponível
+                for msg in mensagens:
+                    print(msg)
+        # Fila ainda cheia: continuar logo no próximo ciclo
+        atraso = 1 if not self.log_queue.empty() else LOG_DRAIN_INTERVAL_MS
         try:
-            self.log.config(state='normal')
-            self.log.insert(tk.END, msg + "\n")
-            self.log.see(tk.END)
-            self.log.config(state='disabled')
-            self.root.update()
+            self.root.after(atraso, self.drain_log)
         except Exception:
-            # Fallback se a janela não estiver disponível
-            print(msg)
+            pass
 
     def clear_processed_history(self):
         """Apaga o histórico de PDFs processados (arquivo e memória)"""
         try:
             if messagebox.askyesno("Confirmar", "Tem certeza que deseja limpar o histórico de PDFs processados?"):
-                self.processed_pdfs = {}
                 try:
-                    if os.path.exists(self.processed_pdfs_file):
-                        os.remove(self.processed_pdfs_file)
+                    self.processed_pdfs.clear()
                 except Exception as e:
                     self.write_log(f"Erro ao limpar histórico: {e}")
                 else:
@@ -1687,25 +5265,8 @@ class App:
                     messagebox.showwarning("Aviso", "Excel não está carregado corretamente.\nVerifique as colunas necessárias.")
                     return
             
-            # Carregar todos os registros do Excel
-            missing_items = []
-            for row_idx, row in self.df.iterrows():
-                conta = row[self.conta_col]
-                nome = row[self.nome_col]
-                ccusto = row[self.ccusto_col]
-                
-                if pd.isna(conta) or str(conta).strip() == '':
-                    continue
-                
-                conta_str = str(conta).strip()
-                nome_str = str(nome).strip() if not pd.isna(nome) else 'N/A'
-                ccusto_str = str(ccusto).strip() if not pd.isna(ccusto) else 'N/A'
-                
-                missing_items.append({
-                    'conta': conta_str,
-                    'nome': nome_str,
-                    'ccusto': ccusto_str
-                })
+            # Todos os registros do Excel com conta (já compilados na carga da planilha)
+            missing_items = [dict(item) for item in self.roster.search_items] if self.roster else []
             
             if not missing_items:
                 messagebox.showinfo("Info", "Nenhum registro válido encontrado no Excel.")
@@ -1815,6 +5376,15 @@ class App:
         search_win.title("🔍 Busca Assistida - Comprovantes Não Encontrados")
         search_win.geometry("1000x700")
         
+        # Indexar em segundo plano os PDFs novos/alterados, para a primeira busca já sair do índice
+        pdf_folder = normalize_path(self.pdf_folder_var.get())
+        try:
+            pdf_paths = [os.path.join(pdf_folder, f) for f in os.listdir(pdf_folder) if f.lower().endswith('.pdf')]
+        except Exception:
+            pdf_paths = []
+        threading.Thread(target=self.search_index.update, args=(pdf_paths,),
+                         kwargs={'extrator': self.extrator_var.get(), 'log': self.write_log}, daemon=True).start()
+        
         # Frame principal
         main_frame = ttk.Frame(search_win, padding=10)
         main_frame.pack(fill=tk.BOTH, expand=True)
@@ -1971,27 +5541,27 @@ class App:
             pdf_folder = normalize_path(self.pdf_folder_var.get())
             
             success_count = 0
-            for match in current_results['matches']:
-                pdf_path = os.path.join(pdf_folder, match['pdf'])
-                nome_str = clean_filename(item['nome'])
-                ccusto_str = clean_filename(item['ccusto'])
-                
-                # Criar subpasta para o centro de custo
-                ccusto_folder = os.path.join(out_dir, ccusto_str)
-                Path(ccusto_folder).mkdir(parents=True, exist_ok=True)
+            nomes = OutputNameRegistry(out_dir)
+            sessoes = {}  # PDF de origem -> SplitSession (cada PDF é aberto uma vez)
+            try:
+                for match in current_results['matches']:
+                    pdf_path = os.path.join(pdf_folder, match['pdf'])
+                    nome_str = clean_filename(item['nome'])
+                    ccusto_str = clean_filename(item['ccusto'])
                 
-                # Salvar na pasta do ccusto (mantém prefixo de ccusto, com sufixo _manual)
-                out_path = os.path.join(ccusto_folder, f"{ccusto_str}_{nome_str}_manual.pdf")
-                i = 1
-                while os.path.exists(out_path):
-                    out_path = os.path.join(ccusto_folder, f"{ccusto_str}_{nome_str}_manual_{i}.pdf")
-                    i += 1
+                    # Salvar na pasta do ccusto (mantém prefixo de ccusto, com sufixo _manual)
+                    out_path = nomes.reserve(ccusto_str, f"{ccusto_str}_{nome_str}_manual")
                 
-                pages_written = create_pdf(pdf_path, [match['page']], out_path)
-                if pages_written and pages_written > 0:
-                    # Somar pelo número de páginas extraídas (normalmente 1 neste fluxo manual)
-                    success_count += pages_written
-                    self.write_log(f"✓ Extraído manualmente: {ccusto_str}/{ccusto_str}_{nome_str}_manual (pág {match['page'] + 1})")
+                    if pdf_path not in sessoes:
+                        sessoes[pdf_path] = SplitSession(pdf_path)
+                    pages_written = sessoes[pdf_path].write([match['page']], out_path)
+                    if pages_written and pages_written > 0:
+                        # Somar pelo número de páginas extraídas (normalmente 1 neste fluxo manual)
+                        success_count += pages_written
+                        self.write_log(f"✓ Extraído manualmente: {ccusto_str}/{ccusto_str}_{nome_str}_manual (pág {match['page'] + 1})")
+            finally:
+                for sessao in sessoes.values():
+                    sessao.close()
             
             messagebox.showinfo("Sucesso", f"{success_count} comprovante(s) extraído(s) com sucesso!")
             status_var.set(f"Extraídos {success_count} comprovantes")
@@ -2005,7 +5575,10 @@ class App:
         ttk.Button(button_frame, text="❌ Fechar", command=search_win.destroy, width=15).pack(side=tk.RIGHT)
     
     def flexible_search(self, conta, nome, ccusto):
-        """Busca flexível nos PDFs com múltiplos critérios relaxados"""
+        """
+        Busca flexível nos PDFs com múltiplos critérios relaxados.
+        As páginas candidatas vêm do índice de busca (só PDFs novos/alterados são lidos de novo).
+        """
         matches = []
         pdf_folder = normalize_path(self.pdf_folder_var.get())
         
@@ -2015,76 +5588,88 @@ class App:
             pdf_files = [f for f in os.listdir(pdf_folder) if f.lower().endswith('.pdf')]
         except Exception:
             return matches
+        pdf_paths = [os.path.join(pdf_folder, f) for f in pdf_files]
         
         # Normalizar termos de busca
-        def normalize_search_text(s):
-            if not s:
-                return ""
-            nf = unicodedata.normalize('NFKD', str(s))
-            ascii_s = nf.encode('ascii', 'ignore').decode('ascii')
-            cleaned = re.sub(r'[^A-Za-z0-9\s]', ' ', ascii_s)
-            cleaned = re.sub(r'\s+', ' ', cleaned).strip().upper()
-            return cleaned
-        
         conta_norm = normalize_account(conta)
         nome_norm = normalize_search_text(nome)
         nome_parts = [p for p in nome_norm.split() if len(p) >= 3]
         
-        # Buscar em cada PDF
-        for pdf_name in pdf_files:
-            pdf_path = os.path.join(pdf_folder, pdf_name)
+        if self.search_index.enabled:
+            # Atualizar o índice (PDFs novos/alterados) e tirar os que saíram da pasta
+            indexados = self.search_index.update(pdf_paths, extrator=self.extrator_var.get(), log=self.write_log)
+            if indexados:
+                self.write_log(f"🗂️ Índice de busca: {indexados} PDF(s) indexado(s)")
+            self.search_index.prune(pdf_folder, pdf_paths)
+            candidatas = self.search_index.search(pdf_paths, conta_norm, nome_norm, nome_parts)
+        else:
+            # SQLite sem FTS5: percorrer as páginas de cada PDF
+            candidatas = self.scan_search_pages(pdf_paths)
+        
+        # Conferir cada página candidata (em ordem de relevância do índice)
+        for caminho, page_num, text, text_norm, text_numbers, nota_aproximada in candidatas:
+            text_norm = text_norm or ""
+            text_numbers = text_numbers or ""
             
-            try:
-                pages = extract_pdf_pages(pdf_path)
-                
-                for page_num, page_data in pages.items():
-                    text = page_data['text']
-                    text_norm = page_data['norm_text']
-                    text_numbers = page_data['numbers']
-                    
-                    criteria_met = []
-                    
-                    # Critério 1: Conta encontrada
-                    if conta_norm and conta_norm in text_numbers:
-                        criteria_met.append("Conta exata")
-                    
-                    # Critério 2: Nome completo encontrado
-                    if nome_norm and nome_norm in text_norm:
-                        criteria_met.append("Nome completo")
-                    
-                    # Critério 3: Múltiplas partes do nome (flexível)
-                    if nome_parts:
-                        found_parts = sum(1 for part in nome_parts if part in text_norm)
-                        if found_parts >= max(2, len(nome_parts) // 2):
-                            criteria_met.append(f"{found_parts}/{len(nome_parts)} partes do nome")
-                    
-                    # Critério 4: Primeiro e último nome
-                    if len(nome_parts) >= 2:
-                        if nome_parts[0] in text_norm and nome_parts[-1] in text_norm:
-                            criteria_met.append("Primeiro + último nome")
-                    
-                    # Se encontrou pelo menos 1 critério, adicionar como candidato
-                    if criteria_met:
-                        # Extrair snippet (contexto)
-                        snippet = self.extract_snippet(text, nome, conta)
-                        
-                        matches.append({
-                            'pdf': pdf_name,
-                            'page': page_num,
-                            'criteria': ", ".join(criteria_met),
-                            'snippet': snippet,
-                            'score': len(criteria_met)
-                        })
+            criteria_met = []
             
-            except Exception as e:
-                self.write_log(f"⚠️ Erro ao processar {pdf_name}: {e}")
-                continue
+            # Critério 1: Conta encontrada
+            if conta_norm and conta_norm in text_numbers:
+                criteria_met.append("Conta exata")
+            
+            # Critério 2: Nome completo encontrado
+            if nome_norm and nome_norm in text_norm:
+                criteria_met.append("Nome completo")
+            
+            # Critério 3: Múltiplas partes do nome (flexível)
+            if nome_parts:
+                found_parts = sum(1 for part in nome_parts if part in text_norm)
+                if found_parts >= max(2, len(nome_parts) // 2):
+                    criteria_met.append(f"{found_parts}/{len(nome_parts)} partes do nome")
+            
+            # Critério 4: Primeiro e último nome
+            if len(nome_parts) >= 2:
+                if nome_parts[0] in text_norm and nome_parts[-1] in text_norm:
+                    criteria_met.append("Primeiro + último nome")
+            score = len(criteria_met)
+            
+            # Critério 5: Nome aproximado (erro de digitação), só quando falta alguma palavra do nome;
+            # vale a nota de semelhança (0.75 a 1.0) em vez de 1 ponto cheio
+            if nota_aproximada and any(p.isalpha() and p not in text_norm for p in nome_parts):
+                criteria_met.append(f"Nome aproximado ({nota_aproximada:.0%})")
+                score += round(nota_aproximada, 2)
+            
+            # Se encontrou pelo menos 1 critério, adicionar como candidato
+            if criteria_met:
+                # Extrair snippet (contexto)
+                snippet = self.extract_snippet(text, nome, conta)
+                
+                matches.append({
+                    'pdf': os.path.basename(caminho),
+                    'page': page_num,
+                    'criteria': ", ".join(criteria_met),
+                    'snippet': snippet,
+                    'score': score
+                })
         
-        # Ordenar por score (mais critérios primeiro)
+        # Ordenar por score (mais critérios primeiro; empates mantêm a relevância do índice)
         matches.sort(key=lambda x: x['score'], reverse=True)
         
         return matches
     
+    def scan_search_pages(self, pdf_paths):
+        """
+        Todas as páginas dos PDFs, no formato de SearchIndex.search, para quando o índice de
+        busca não está disponível (extraídas de novo ou lidas do cache de páginas)
+        """
+        for pdf_path in pdf_paths:
+            try:
+                pages = iter_pdf_pages(pdf_path, cache=self.page_cache, extrator=self.extrator_var.get())
+                for page_num, page_data in pages:
+                    yield pdf_path, page_num, page_data.text, page_data.norm_text, page_data.numbers, 0.0
+            except Exception as e:
+                self.write_log(f"⚠️ Erro ao processar {os.path.basename(pdf_path)}: {e}")
+    
     def extract_snippet(self, text, nome, conta, context_chars=150):
         """Extrai trecho do texto ao redor do nome/conta encontrado"""
         text = text or ""
@@ -2120,15 +5705,6 @@ class App:
         nome = conta_info['nome']
         
         # Normalizar para busca
-        def normalize_search_text(s):
-            if not s:
-                return ""
-            nf = unicodedata.normalize('NFKD', str(s))
-            ascii_s = nf.encode('ascii', 'ignore').decode('ascii')
-            cleaned = re.sub(r'[^A-Za-z0-9\s]', ' ', ascii_s)
-            cleaned = re.sub(r'\s+', ' ', cleaned).strip().upper()
-            return cleaned
-        
         conta_norm = normalize_account(conta)
         nome_norm = normalize_search_text(nome)
         nome_parts = [p for p in nome_norm.split() if len(p) >= 3]
@@ -2137,29 +5713,22 @@ class App:
         pdfs_com_nome = []
         pdfs_com_ambos_separados = []
         
-        # Cache de páginas extraídas para evitar reprocessamento
-        if not hasattr(self, '_pdf_cache'):
-            self._pdf_cache = {}
-        
         # Verificar cada PDF
         for pdf_name in pdf_files:
             pdf_path = os.path.join(pdf_folder, pdf_name)
             
             try:
-                # Usar cache se disponível
-                if pdf_path not in self._pdf_cache:
-                    self._pdf_cache[pdf_path] = extract_pdf_pages(pdf_path)
-                
-                pages = self._pdf_cache[pdf_path]
+                # Páginas uma a uma (o PageCache evita extrair o mesmo PDF de novo)
+                pages = iter_pdf_pages(pdf_path, cache=self.page_cache, extrator=self.extrator_var.get())
                 
                 tem_conta_pdf = False
                 tem_nome_pdf = False
                 paginas_com_conta = []
                 paginas_com_nome = []
                 
-                for page_num, page_data in pages.items():
-                    text_norm = page_data['norm_text']
-                    text_numbers = page_data['numbers']
+                for page_num, page_data in pages:
+                    text_norm = page_data.norm_text
+                    text_numbers = page_data.numbers
                     
                     # Verificar conta
                     if conta_norm and conta_norm in text_numbers:
@@ -2506,10 +6075,13 @@ class App:
         if not self.pdf_folder_var.get() or not self.excel_var.get():
             messagebox.showerror("Erro", "Selecione a pasta de PDFs e o Excel!")
             return
+        if self.roster_loading:
+            messagebox.showinfo("Aguarde", "A planilha ainda está sendo carregada.")
+            return
         if self.df is None:
             messagebox.showerror("Erro", "Carregue Excel!")
             return
-        if not self.conta_col or not self.agencia_col or not self.nome_col or not self.ccusto_col:
+        if self.roster is None or not self.conta_col or not self.agencia_col or not self.nome_col or not self.ccusto_col:
             messagebox.showerror("Erro", "Colunas não encontradas no Excel!\nVerifique se existem as colunas: Conta, Agência, Nome e Descrição Ccusto")
             return
         
@@ -2523,10 +6095,6 @@ class App:
         try:
             pdf_folder = normalize_path(self.pdf_folder_var.get())
             out_dir = normalize_path(self.out_var.get())
-            conta_col = self.conta_col
-            agencia_col = self.agencia_col
-            nome_col = self.nome_col
-            ccusto_col = self.ccusto_col
             
             # Verificar se as pastas existem
             if not os.path.exists(pdf_folder) or not os.path.isdir(pdf_folder):
@@ -2534,504 +6102,69 @@ class App:
                 messagebox.showerror("Erro", f"Pasta de PDFs não encontrada")
                 return
             
-            Path(out_dir).mkdir(parents=True, exist_ok=True)
-            
-            self.write_log("\n" + "="*50)
-            self.write_log("🚀 Iniciando processamento...")
-            self.write_log("="*50)
-            
-            # Listar todos os PDFs na pasta usando múltiplos métodos (compatível com OneDrive)
-            pdf_files_set = set()
-            
-            # Método 1: os.listdir
-            try:
-                files_listdir = [f for f in os.listdir(pdf_folder) if f.lower().endswith('.pdf')]
-                pdf_files_set.update(files_listdir)
-                self.write_log(f"ℹ️ Método listdir: {len(files_listdir)} PDFs")
-            except Exception as e:
-                self.write_log(f"⚠️ Erro com listdir: {e}")
-            
-            # Método 2: Path.iterdir (confiável para OneDrive)
-            try:
-                path_obj = Path(pdf_folder)
-                files_iterdir = [f.name for f in path_obj.iterdir() if f.is_file() and f.suffix.lower() == '.pdf']
-                pdf_files_set.update(files_iterdir)
-                self.write_log(f"ℹ️ Método iterdir: {len(files_iterdir)} PDFs")
-            except Exception as e:
-                self.write_log(f"⚠️ Erro com iterdir: {e}")
-            
-            # Método 3: os.scandir (eficiente)
+            force = getattr(self, 'force_reprocess_var', None) and self.force_reprocess_var.get()
             try:
-                with os.scandir(pdf_folder) as entries:
-                    files_scandir = [e.name for e in entries if e.is_file() and e.name.lower().endswith('.pdf')]
-                pdf_files_set.update(files_scandir)
-                self.write_log(f"ℹ️ Método scandir: {len(files_scandir)} PDFs")
-            except Exception as e:
-                self.write_log(f"⚠️ Erro com scandir: {e}")
-            
-            pdf_files = sorted(list(pdf_files_set))
-            
-            if not pdf_files:
-                self.write_log("\n⚠️ Nenhum PDF encontrado na pasta!")
-                self.write_log("   💡 Dica: Se os arquivos estão no OneDrive, tente:")
-                self.write_log("      1. Verificar se os PDFs foram baixados localmente")
-                self.write_log("      2. Clicar com botão direito nos PDFs > 'Sempre manter neste dispositivo'")
-                self.write_log("      3. Ou mover os PDFs para uma pasta local fora do OneDrive")
-                return
+                workers = max(1, int(self.workers_var.get()))
+            except Exception:
+                workers = 1
             
-            self.write_log(f"\n📊 Total de PDFs encontrados: {len(pdf_files)}")
+            pdf_atual = {'texto': ""}
             
-            # Separar PDFs novos e já processados (ou forçar reprocessamento)
-            novos_pdfs = []
-            ja_processados = []
-            force = getattr(self, 'force_reprocess_var', None) and self.force_reprocess_var.get()
-            if force:
-                self.write_log("⚠️ Modo FORÇAR reprocessamento ativo: ignorando histórico e reprocessando todos os PDFs.")
-
-            for pdf_name in pdf_files:
-                pdf_path = os.path.join(pdf_folder, pdf_name)
-                fingerprint = self.get_pdf_fingerprint(pdf_path)
-
-                if (not force) and fingerprint and fingerprint in self.processed_pdfs:
-                    ja_processados.append(pdf_name)
-                else:
-                    novos_pdfs.append((pdf_name, pdf_path, fingerprint))
+            def on_event(evento, **dados):
+                if evento == 'inicio':
+                    self.root.after(0, lambda n=dados['pdfs']: self.status_var.set(f"Processando {n} PDFs..."))
+                elif evento == 'pdf_inicio':
+                    pdf_atual['texto'] = f"PDF {dados['indice']}/{dados['total']}"
+                    self.root.after(0, lambda s=pdf_atual['texto']: self.status_var.set(f"{s}..."))
+                elif evento == 'progresso':
+                    self.root.after(0, self.show_progress, dados, pdf_atual['texto'])
             
-            if ja_processados:
-                self.write_log(f"⏭️ PDFs já processados anteriormente: {len(ja_processados)}")
+            pipeline = ProcessingPipeline(
+                pdf_folder=pdf_folder,
+                out_dir=out_dir,
+                roster=self.roster,
+                history=self.processed_pdfs,
+                page_cache=self.page_cache,
+                workers=workers,
+                force=force,
+                debug=self.debug_mode_var.get(),
+                log=self.write_log,
+                on_event=on_event,
+                extrator=self.extrator_var.get(),
+                layout_templates=LayoutTemplates(self.layout_templates_file),
+                rematch=self.rematch_var.get(),
+                search_index=self.search_index,
+            )
+            resumo = pipeline.run()
+            self.stop_timer()
             
-            if not novos_pdfs:
-                self.write_log("\n✓ Todos os PDFs já foram processados!")
-                elapsed = self.stop_timer()
-                time_str = self.format_time(elapsed)
-                self.write_log(f"⏱️ Tempo total: {time_str}")
+            if resumo['status'] == 'nada_novo':
+                total_pdfs = resumo['pdfs_encontrados']
                 self.root.after(0, lambda: self.status_var.set("Concluído - Nenhum PDF novo"))
                 self.root.after(0, lambda: messagebox.showinfo(
                     "Processamento Concluído", 
-                    f"Todos os {len(pdf_files)} PDFs já foram processados anteriormente!"
+                    f"Todos os {total_pdfs} PDFs já foram processados anteriormente!"
                 ))
                 return
+            if resumo['status'] != 'ok':
+                return
             
-            self.write_log(f"🆕 PDFs novos para processar: {len(novos_pdfs)}")
-            self.root.after(0, lambda: self.status_var.set(f"Processando {len(novos_pdfs)} PDFs..."))
-            
-            # Processamento dos PDFs novos
-            total_ok = 0
-            total_nok = 0
-            total_duplicates = 0
-            
-            # Dicionário para rastrear quais contas foram encontradas
-            contas_encontradas = set()  # Conjunto de contas que foram extraídas com sucesso
-            todas_contas = []  # Lista de todas as contas do Excel para verificar no final
-            
-            # Primeiro, coletar todas as contas do Excel
-            for row_idx, row in self.df.iterrows():
-                conta = row[conta_col]
-                agencia = row[agencia_col]
-                nome = row[nome_col]
-                ccusto = row[ccusto_col]
-                
-                # Campos obrigatórios
-                if pd.isna(nome) or str(nome).strip() == '':
-                    continue
-                if pd.isna(ccusto) or str(ccusto).strip() == '':
-                    continue
-                
-                # Para conta e agência, buscar em TODAS as colunas se estiverem vazias
-                conta_str = str(conta).strip() if not pd.isna(conta) and str(conta).strip() != '' else None
-                agencia_str = str(agencia).strip() if not pd.isna(agencia) and str(agencia).strip() != '' else None
-                
-                # Se conta ou agência estão vazias, procurar em OUTRAS COLUNAS
-                valores_encontrados = []
-                if not conta_str or not agencia_str:
-                    # Percorrer todas as colunas buscando valores numéricos
-                    for col_name in row.index:
-                        if col_name in [nome_col, ccusto_col]:  # Pular colunas de texto
-                            continue
-                        
-                        valor = row[col_name]
-                        if pd.isna(valor):
-                            continue
-                        
-                        valor_str = str(valor).strip()
-                        # Verificar se é um valor numérico válido (pode ter hífen para DV)
-                        if valor_str and re.match(r'^[\d\-\.]+$', valor_str):
-                            valor_norm = normalize_account(valor_str)
-                            if valor_norm and len(valor_norm) >= 3:
-                                valores_encontrados.append(valor_str)
-                    
-                    # Se encontrou valores, usar os primeiros 2
-                    if len(valores_encontrados) >= 2:
-                        if not conta_str:
-                            conta_str = valores_encontrados[0]
-                        if not agencia_str:
-                            agencia_str = valores_encontrados[1] if len(valores_encontrados) > 1 else valores_encontrados[0]
-                    elif len(valores_encontrados) == 1:
-                        # Só tem 1 valor, usar como conta
-                        if not conta_str:
-                            conta_str = valores_encontrados[0]
-                        if not agencia_str:
-                            # Tentar usar o mesmo valor como agência (pode estar duplicado)
-                            agencia_str = valores_encontrados[0]
-                
-                # Se ainda não tem conta E agência, pular este registro
-                if not conta_str or not agencia_str:
-                    continue
-                
-                nome_str = str(nome).strip() if not pd.isna(nome) else 'N/A'
-                ccusto_str = str(ccusto).strip() if not pd.isna(ccusto) else 'N/A'
-                
-                todas_contas.append({
-                    'conta': conta_str,
-                    'agencia': agencia_str,
-                    'nome': nome_str,
-                    'ccusto': ccusto_str
-                })
-            
-            # Rastrear páginas processadas
-            total_paginas_pdfs = 0
-            paginas_com_match = set()  # páginas que tiveram match (PDF + número da página)
-            paginas_ja_extraidas = set()  # Controle de páginas já extraídas (evita duplicatas)
-            
-            for idx, (pdf_name, pdf_path, fingerprint) in enumerate(novos_pdfs, 1):
-                self.write_log(f"\n{'='*50}")
-                self.write_log(f"📄 Processando PDF {idx}/{len(novos_pdfs)}: {pdf_name}")
-                self.write_log(f"{'='*50}")
-                self.root.after(0, lambda i=idx, t=len(novos_pdfs): self.status_var.set(f"PDF {i}/{t}..."))
-                
-                try:
-                    pages = extract_pdf_pages(pdf_path)
-                    total_paginas_pdfs += len(pages)
-                    self.write_log(f"📄 Total de páginas neste PDF: {len(pages)}")
-                    
-                    ok = 0
-                    nok = 0
-                    duplicates = 0
-                    
-                    for row_idx, row in self.df.iterrows():
-                        conta = row[conta_col]
-                        agencia = row[agencia_col]
-                        nome = row[nome_col]
-                        ccusto = row[ccusto_col]
-                        
-                        # Verificar campos obrigatórios (nome e ccusto são essenciais)
-                        if pd.isna(nome) or str(nome).strip() == '':
-                            continue
-                        if pd.isna(ccusto) or str(ccusto).strip() == '':
-                            continue
-                        
-                        # Para conta e agência, buscar em TODAS as colunas se estiverem vazias
-                        conta_str = str(conta).strip() if not pd.isna(conta) and str(conta).strip() != '' else None
-                        agencia_str = str(agencia).strip() if not pd.isna(agencia) and str(agencia).strip() != '' else None
-                        
-                        # Se conta ou agência estão vazias, procurar em OUTRAS COLUNAS
-                        valores_encontrados = []
-                        busca_alternativa = False
-                        if not conta_str or not agencia_str:
-                            busca_alternativa = True
-                            # Percorrer todas as colunas buscando valores numéricos
-                            for col_name in row.index:
-                                if col_name in [nome_col, ccusto_col]:  # Pular colunas de texto
-                                    continue
-                                
-                                valor = row[col_name]
-                                if pd.isna(valor):
-                                    continue
-                                
-                                valor_str = str(valor).strip()
-                                # Verificar se é um valor numérico válido (pode ter hífen para DV)
-                                if valor_str and re.match(r'^[\d\-\.]+$', valor_str):
-                                    valor_norm = normalize_account(valor_str)
-                                    if valor_norm and len(valor_norm) >= 3:
-                                        valores_encontrados.append(valor_str)
-                            
-                            # Se encontrou valores, usar os primeiros 2
-                            if len(valores_encontrados) >= 2:
-                                if not conta_str:
-                                    conta_str = valores_encontrados[0]
-                                if not agencia_str:
-                                    agencia_str = valores_encontrados[1] if len(valores_encontrados) > 1 else valores_encontrados[0]
-                            elif len(valores_encontrados) == 1:
-                                # Só tem 1 valor, usar como conta
-                                if not conta_str:
-                                    conta_str = valores_encontrados[0]
-                                if not agencia_str:
-                                    # Tentar usar o mesmo valor como agência (pode estar duplicado)
-                                    agencia_str = valores_encontrados[0]
-                        
-                        # Se ainda não tem conta E agência, pular
-                        if not conta_str or not agencia_str:
-                            continue
-                        
-                        nome_str = clean_filename(str(nome).strip())
-                        ccusto_str = clean_filename(str(ccusto).strip())
-                        
-                        # Log se usou busca alternativa
-                        if busca_alternativa and valores_encontrados:
-                            if self.debug_mode_var.get():
-                                self.write_log(f"  📌 {nome_str}: Valores encontrados em colunas alternativas (Conta={conta_str}, Ag={agencia_str})")
-                        
-                        paginas, valores_invertidos = find_account_pages(conta_str, agencia_str, pages)
-
-                        if paginas:
-                            # Filtrar apenas páginas que ainda NÃO foram extraídas
-                            paginas_novas = []
-                            for pag in paginas:
-                                chave_pagina = f"{pdf_name}|{pag}"
-                                if chave_pagina not in paginas_ja_extraidas:
-                                    paginas_novas.append(pag)
-                                else:
-                                    continue
-
-                            # Se não há páginas novas, pular
-                            if not paginas_novas:
-                                continue
-
-                            # Criar subpasta para o centro de custo
-                            ccusto_folder = os.path.join(out_dir, ccusto_str)
-                            Path(ccusto_folder).mkdir(parents=True, exist_ok=True)
-
-                            # Salvar PDF na pasta do centro de custo (mantém prefixo de ccusto no nome)
-                            out = os.path.join(ccusto_folder, f"{ccusto_str}_{nome_str}.pdf")
-                            i = 1
-                            while os.path.exists(out):
-                                out = os.path.join(ccusto_folder, f"{ccusto_str}_{nome_str}_{i}.pdf")
-                                i += 1
-
-                            # Tentar criar o PDF com as páginas novas e obter quantas páginas foram gravadas
-                            pages_written = create_pdf(pdf_path, paginas_novas, out)
-                            if pages_written and pages_written > 0:
-                                # Registrar quais páginas tiveram match (apenas após gravação bem-sucedida)
-                                for pag in paginas_novas:
-                                    paginas_com_match.add(f"{pdf_name}|{pag}")
-                                    paginas_ja_extraidas.add(f"{pdf_name}|{pag}")
-
-                                self.write_log(f"✓ {ccusto_str}/{ccusto_str}_{nome_str} (pág {[p+1 for p in paginas_novas]})")
-                                # Incrementar por número de páginas efetivamente escritas
-                                ok += int(pages_written)
-                                # Marcar que esta conta foi encontrada
-                                contas_encontradas.add(conta_str)
-                            else:
-                                nok += 1
-                    
-                    # Registrar PDF como processado
-                    if fingerprint:
-                        self.processed_pdfs[fingerprint] = {
-                            'nome': pdf_name,
-                            'data': time.strftime('%d/%m/%Y %H:%M:%S'),
-                            'extraidos': ok,
-                            'nao_encontrados': nok,
-                        }
-                        self.save_processed_pdfs()
-                    
-                    total_ok += ok
-                    total_nok += nok
-                    total_duplicates += duplicates
-                    
-                    self.write_log(f"✓ Comprovantes extraídos deste PDF: {ok}")
-                    
-                except Exception as e:
-                    self.write_log(f"❌ Erro ao processar {pdf_name}: {e}")
-            
-            # Calcular quantas páginas dos PDFs ficaram SEM match com a planilha
-            paginas_sem_match = total_paginas_pdfs - len(paginas_com_match)
-            
-            # Parar timer e calcular tempo total
-            elapsed = self.stop_timer()
-            time_str = self.format_time(elapsed)
-            
-            # Comprovantes nos PDFs que NÃO têm funcionário correspondente na planilha
-            nao_encontrados = []
-            
-            # Criar índice de contas+agência do Excel para busca rápida
-            # Chave: "conta_agencia" normalizada
-            # Também criar índice INVERTIDO para detectar inversões
-            contas_excel_set = set()
-            contas_excel_invertido_set = set()  # Para detectar inversões
-            contas_excel_conta_set = set()  # Índice apenas de contas (conta isolada)
-            for conta_info in todas_contas:
-                conta_norm = normalize_account(conta_info['conta'])
-                agencia_norm = normalize_account(conta_info['agencia'])
-                # Indexar conta isolada para permitir match apenas por conta
-                if conta_norm:
-                    contas_excel_conta_set.add(conta_norm)
-                if conta_norm and agencia_norm:
-                    # Usar combinação conta+agência como chave única
-                    contas_excel_set.add(f"{conta_norm}_{agencia_norm}")
-                    # Também adicionar versão invertida para detectar inversões na planilha
-                    contas_excel_invertido_set.add(f"{agencia_norm}_{conta_norm}")
-            
-            self.write_log(f"\n🔍 Analisando páginas sem match para identificar contas não cadastradas...")
-            
-            # Percorrer todos os PDFs e analisar CADA PÁGINA que não teve match
-            for pdf_name in pdf_files:
-                pdf_path = os.path.join(pdf_folder, pdf_name)
-                try:
-                    pages = extract_pdf_pages(pdf_path)
-                    
-                    for page_num, page_data in pages.items():
-                        # Verificar se esta página teve match
-                        pagina_id = f"{pdf_name}|{page_num}"
-                        if pagina_id in paginas_com_match:
-                            continue  # Já foi extraída, pular
-                        
-                        # BUSCAR APENAS NA SEÇÃO "DADOS DA CONTA CREDITADA"
-                        credited_section = page_data.get('credited_section', '')
-                        
-                        # Se não encontrou a seção, pular esta página
-                        if not credited_section or len(credited_section) < 20:
-                            continue
-                        
-                        # Buscar especificamente o campo "Conta corrente:" seguido do número
-                        # Padrões possíveis: "Conta corrente: 94894 - 2", "Conta: 12345-6", "C/C: 12345-6"
-                        conta_patterns = [
-                            r'[Cc]onta\s*[Cc]orrente[:\s]+(\d{4,7}[\s\-]*\d?)',  # Conta corrente: 94894 - 2
-                            r'[Cc]/[Cc][:\s]+(\d{4,7}[\s\-]*\d?)',               # C/C: 12345-6
-                            r'[Cc]onta[:\s]+(\d{4,7}[\s\-]*\d?)',                # Conta: 12345-6
-                        ]
-                        
-                        # Buscar agência também
-                        agencia_patterns = [
-                            r'[Aa]g[eê]ncia[:\s]+(\d{3,5})',  # Agência: 6677
-                            r'[Aa]g[:\s]+(\d{3,5})',          # Ag: 6677
-                        ]
-                        
-                        melhor_conta = None
-                        for pattern in conta_patterns:
-                            match = re.search(pattern, credited_section)
-                            if match:
-                                melhor_conta = match.group(1).strip()
-                                break
-                        
-                        melhor_agencia = None
-                        for pattern in agencia_patterns:
-                            match = re.search(pattern, credited_section)
-                            if match:
-                                melhor_agencia = match.group(1).strip()
-                                break
-                        
-                        # Se não encontrou conta ou agência, pular
-                        if not melhor_conta or not melhor_agencia:
-                            continue
-                        
-                        # Normalizar conta e agência encontradas
-                        conta_norm = normalize_account(melhor_conta)
-                        agencia_norm = normalize_account(melhor_agencia)
-                        
-                        # Filtrar contas válidas (5-7 dígitos após normalização - contas geralmente têm 5+ dígitos)
-                        if not conta_norm or len(conta_norm) < 5 or len(conta_norm) > 7:
-                            continue
-                        
-                        # Filtrar agências válidas (3-5 dígitos)
-                        if not agencia_norm or len(agencia_norm) < 3 or len(agencia_norm) > 5:
-                            continue
-                        
-                        # Criar chave combinada conta+agência
-                        chave_pdf = f"{conta_norm}_{agencia_norm}"
-                        # Também criar chave invertida (caso na planilha esteja conta<->agência trocados)
-                        chave_pdf_invertida = f"{agencia_norm}_{conta_norm}"
-                        
-                        # Verificar se a combinação conta+agência está na planilha
-                        # Considera: combinação normal, combinação invertida, ou conta isolada
-                        esta_cadastrado = (
-                            chave_pdf in contas_excel_set or 
-                            chave_pdf_invertida in contas_excel_invertido_set or
-                            conta_norm in contas_excel_conta_set
-                        )
-                        
-                        if not esta_cadastrado:
-                            # Extrair um trecho do texto ao redor DA SEÇÃO CREDITADA
-                            pos = credited_section.find(melhor_conta)
-                            if pos != -1:
-                                start = max(0, pos - 80)
-                                end = min(len(credited_section), pos + 150)
-                                snippet = credited_section[start:end].replace('\n', ' ')
-                                snippet = ' '.join(snippet.split())
-                                if len(snippet) > 200:
-                                    snippet = snippet[:200] + "..."
-                            else:
-                                snippet = ' '.join(credited_section.split())[:200] + "..."
-                            
-                            nao_encontrados.append({
-                                'pdf': pdf_name,
-                                'pagina': page_num + 1,
-                                'conta': melhor_conta,
-                                'agencia': melhor_agencia,
-                                'conta_normalizada': conta_norm,
-                                'agencia_normalizada': agencia_norm,
-                                'trecho': snippet
-                            })
-                
-                except Exception as e:
-                    self.write_log(f"⚠️ Erro ao analisar {pdf_name}: {e}")
-                    continue
-
-            # Gerar arquivo TXT com comprovantes que NÃO têm funcionário na planilha
-            if nao_encontrados:
-                try:
-                    txt_path = os.path.join(out_dir, f"comprovantes_sem_funcionario_{time.strftime('%Y%m%d_%H%M%S')}.txt")
-                    with open(txt_path, 'w', encoding='utf-8') as f:
-                        f.write("="*80 + "\n")
-                        f.write("RELATÓRIO DE COMPROVANTES SEM FUNCIONÁRIO NA PLANILHA\n")
-                        f.write("="*80 + "\n")
-                        f.write(f"Data/Hora: {time.strftime('%d/%m/%Y %H:%M:%S')}\n")
-                        f.write(f"PDFs processados: {len(pdf_files)}\n")
-                        f.write(f"Comprovantes extraídos com sucesso: {total_ok}\n")
-                        f.write(f"Comprovantes SEM funcionário na planilha: {len(nao_encontrados)}\n")
-                        f.write("="*80 + "\n\n")
-                        f.write("ESTES SÃO COMPROVANTES QUE EXISTEM NOS PDFs MAS NÃO TÊM\n")
-                        f.write("FUNCIONÁRIO CORRESPONDENTE CADASTRADO NA PLANILHA:\n")
-                        f.write("-"*80 + "\n\n")
-
-                        for idx, item in enumerate(nao_encontrados, 1):
-                            f.write(f"{idx}. PDF: {item['pdf']}\n")
-                            f.write(f"   Página: {item['pagina']}\n")
-                            f.write(f"   Conta encontrada: {item['conta']}\n")
-                            f.write(f"   Agência encontrada: {item.get('agencia', 'N/A')}\n")
-                            f.write(f"   Status: Conta ou Agência NÃO cadastrada na planilha\n")
-                            f.write("-"*80 + "\n\n")
-                        
-                        f.write("\n" + "="*80 + "\n")
-                        f.write("O QUE FAZER:\n")
-                        f.write("="*80 + "\n")
-                        f.write("1. Verifique se estas contas deveriam estar cadastradas na planilha\n")
-                        f.write("2. Adicione os funcionários faltantes na planilha se necessário\n")
-                        f.write("3. Ou ignore se forem contas inválidas/irrelevantes\n")
-                        f.write("4. Reprocesse após atualizar a planilha\n")
-                        f.write("="*80 + "\n")
-
-                    self.write_log(f"📄 Relatório salvo: {os.path.basename(txt_path)}")
-                except Exception as e:
-                    self.write_log(f"⚠️ Erro ao gerar relatório: {e}")
-            
-            self.write_log("\n" + "="*50)
-            self.write_log("📊 RESUMO DO PROCESSAMENTO")
-            self.write_log("="*50)
-            self.write_log(f"📂 PDFs processados: {len(novos_pdfs)}")
-            self.write_log(f"📄 Total de páginas/comprovantes: {total_paginas_pdfs}")
-            self.write_log(f"")
-            self.write_log(f"✓ Comprovantes extraídos (com match): {total_ok} páginas")
-            self.write_log(f"✗ Comprovantes SEM cadastro: {len(nao_encontrados)} páginas")
-            self.write_log(f"❓ Outras páginas: {total_paginas_pdfs - total_ok - len(nao_encontrados)}")
-            self.write_log(f"")
-            if nao_encontrados:
-                self.write_log(f"📝 Relatório de páginas sem funcionário salvo em TXT")
-            if total_duplicates > 0:
-                self.write_log(f"⚠️ Comprovantes em múltiplas páginas: {total_duplicates}")
-            self.write_log(f"⏱️ Tempo total: {time_str}")
-            self.write_log("="*50)
+            total_ok = resumo['extraidos']
+            total_paginas_pdfs = resumo['paginas']
+            sem_funcionario = resumo['sem_funcionario']
+            time_str = format_time(resumo['tempos']['total'])
             
             # Mensagem de conclusão
-            outras = total_paginas_pdfs - total_ok - len(nao_encontrados)
+            outras = resumo['outras']
 
             # Garantir que a variável esteja inicializada antes de concatenar
             msg_resultado = ""
             msg_resultado += f"📄 Total de páginas: {total_paginas_pdfs}\n"
             msg_resultado += f"✓ Extraídos: {total_ok}\n"
-            msg_resultado += f"✗ Sem funcionário: {len(nao_encontrados)}\n"
+            msg_resultado += f"✗ Sem funcionário: {sem_funcionario}\n"
             if outras > 0:
                 msg_resultado += f"❓ Outras: {outras}\n"
-            if nao_encontrados:
+            if sem_funcionario:
                 msg_resultado += f"📄 Ver relatório TXT\n"
             msg_resultado += f"⏱️ {time_str}"
 
@@ -3061,14 +6194,30 @@ class App:
             err_msg = str(e)
             self.root.after(0, lambda m=err_msg: messagebox.showerror("Erro", m))
         finally:
-            # Limpar cache de PDFs para liberar memória
-            if hasattr(self, '_pdf_cache'):
-                self._pdf_cache.clear()
-            
             self.root.after(0, self.finish)
     
+    def show_progress(self, dados, pdf_texto):
+        """Mostra um evento 'progresso' na barra (determinada) e na linha de status"""
+        if str(self.prog['mode']) != 'determinate':
+            self.prog.stop()
+            self.prog.config(mode='determinate', maximum=100)
+        self.prog['value'] = dados['fracao'] * 100
+        if dados['etapa'] == 'analise':
+            self.status_var.set("Analisando páginas sem match...")
+            return
+        if dados['etapa'] != 'extracao':
+            return
+        total = dados['paginas_total']
+        paginas = f"{dados['paginas']}/{total} pág" if total else f"{dados['paginas']} pág"
+        partes = [p for p in (pdf_texto, paginas, f"{dados['paginas_por_segundo']} pág/s") if p]
+        if dados['eta_segundos'] is not None:
+            partes.append(f"restam ~{format_time(dados['eta_segundos'])[:8]}")
+        self.status_var.set(" · ".join(partes))
+    
     def finish(self):
         self.prog.stop()
+        self.prog.config(mode='indeterminate')
+        self.prog['value'] = 0
         self.btn.config(state='normal')
         self.status_var.set("Pronto")
         
@@ -3088,6 +6237,13 @@ class App:
 
 
 if __name__ == "__main__":
+    # Necessário para o pool de processos no executável do PyInstaller (Windows)
+    multiprocessing.freeze_support()
+    if HEADLESS:
+        sys.exit(run_cli())
+    if tk is None:
+        print("Erro: tkinter não instalado")
+        sys.exit(1)
     root = tk.Tk()
     App(root)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,43 @@
+"""Fixtures compartilhadas: cenários sintéticos pequenos (benchmark.generate_scenario) e o pipeline"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark  # noqa: E402
+import get_proof  # noqa: E402
+
+
+@pytest.fixture
+def cenario(tmp_path):
+    """Dois PDFs com 40 páginas de comprovantes e a planilha correspondente"""
+    return benchmark.generate_scenario(str(tmp_path / "cenario"), 40, paginas_por_pdf=20, seed=7)
+
+
+@pytest.fixture
+def roster(cenario):
+    """Planilha do cenário já compilada (RosterTable)"""
+    df, colunas = get_proof.load_roster(cenario['planilha'], log=lambda *a: None)
+    return get_proof.compile_roster(df, colunas)
+
+
+@pytest.fixture
+def run_pipeline(tmp_path, roster):
+    """Executa o ProcessingPipeline em uma pasta de PDFs; retorna (resumo, pipeline)"""
+    def run(pdf_folder, out_dir=None, history=None, **opcoes):
+        history = history or get_proof.ProcessedHistory(str(tmp_path / "historico.sqlite"))
+        pipeline = get_proof.ProcessingPipeline(
+            pdf_folder=pdf_folder,
+            out_dir=out_dir or str(tmp_path / "saida"),
+            roster=roster,
+            history=history,
+            log=lambda *a: None,
+            **opcoes,
+        )
+        try:
+            return pipeline.run(), pipeline
+        finally:
+            history.close()
+    return run
@@ -0,0 +1,53 @@
+"""Impressões digitais por conteúdo e cópias dentro do mesmo lote (ProcessedHistory / pipeline)"""
+import os
+import shutil
+
+import get_proof
+
+
+def test_copia_identica_no_lote_e_ignorada(cenario, run_pipeline):
+    pasta = cenario['pasta_pdfs']
+    shutil.copy(os.path.join(pasta, "lote_000.pdf"), os.path.join(pasta, "lote_000_copia.pdf"))
+    
+    resumo, _ = run_pipeline(pasta)
+    
+    assert resumo['pdfs_duplicados'] == 1
+    assert resumo['pdfs_processados'] == 2
+
+
+def test_pdfs_sem_hash_nunca_sao_tratados_como_copias(cenario, run_pipeline, monkeypatch):
+    # Arquivo ilegível/bloqueado: sample_hash e content_fingerprint devolvem None
+    monkeypatch.setattr(get_proof.ProcessedHistory, 'sample_hash', lambda self, path: None)
+    monkeypatch.setattr(get_proof.ProcessedHistory, 'content_fingerprint', lambda self, path: None)
+    
+    resumo, _ = run_pipeline(cenario['pasta_pdfs'])
+    
+    assert resumo['pdfs_duplicados'] == 0
+    assert resumo['pdfs_processados'] == 2
+
+
+def test_hash_completo_memorizado_por_arquivo(tmp_path, cenario):
+    history = get_proof.ProcessedHistory(str(tmp_path / "historico.sqlite"))
+    pdf = os.path.join(cenario['pasta_pdfs'], "lote_000.pdf")
+    try:
+        primeiro = history.content_fingerprint(pdf)
+        assert primeiro == "sha256:" + get_proof.full_pdf_hash(pdf)
+        assert history.content_fingerprint(pdf) == primeiro
+    finally:
+        history.close()
+
+
+def test_historico_e_cache_de_paginas_leem_o_pdf_uma_vez(tmp_path, cenario, monkeypatch):
+    monkeypatch.setattr(get_proof, '_full_hash_memo', {})
+    leituras = []
+    original = get_proof.full_pdf_hash
+    monkeypatch.setattr(get_proof, 'full_pdf_hash', lambda path: leituras.append(path) or original(path))
+    history = get_proof.ProcessedHistory(str(tmp_path / "historico.sqlite"))
+    cache = get_proof.PageCache(str(tmp_path / "cache.sqlite"))
+    pdf = os.path.join(cenario['pasta_pdfs'], "lote_000.pdf")
+    try:
+        assert history.content_fingerprint(pdf) == "sha256:" + cache.content_hash(pdf)
+    finally:
+        history.close()
+    
+    assert leituras == [pdf]
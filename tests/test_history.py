@@ -0,0 +1,87 @@
+"""Histórico de PDFs processados: migração do pdfs_processados.json antigo para o SQLite"""
+import json
+import os
+
+import get_proof
+
+
+def test_historico_json_migrado_para_sqlite(tmp_path, cenario):
+    pdf = os.path.join(cenario['pasta_pdfs'], "lote_000.pdf")
+    legado = get_proof.get_pdf_fingerprint(pdf)
+    antigos = {
+        legado: {'nome': "lote_000.pdf", 'data': "01/02/2024 10:00:00", 'extraidos': 18, 'nao_encontrados': 2},
+        "antigo.pdf_100_1700000000.0": {'nome': "antigo.pdf", 'data': "01/01/2024 09:00:00",
+                                        'extraidos': 5, 'nao_encontrados': 0},
+    }
+    json_path = str(tmp_path / "pdfs_processados.json")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(antigos, f)
+    
+    history = get_proof.open_processed_history(json_path)
+    try:
+        assert history.db_path == str(tmp_path / "pdfs_processados.sqlite")
+        assert history.enabled
+        assert len(history) == 2
+        assert history.get(legado)['extraidos'] == 18
+        # O identificador antigo reconhece o PDF, que passa a ser registrado pelo conteúdo
+        conteudo = history.content_fingerprint(pdf)
+        assert history.find_processed(pdf) == conteudo
+        assert history.get(legado) is None
+        assert history.get(conteudo)['extraidos'] == 18
+        assert history.find_processed(pdf) == conteudo
+        outro = os.path.join(cenario['pasta_pdfs'], "lote_001.pdf")
+        assert history.find_processed(outro) is None
+    finally:
+        history.close()
+    
+    assert not os.path.exists(json_path)
+    assert os.path.exists(json_path + ".migrado")
+    
+    # Reabrir não importa de novo e mantém o que foi migrado
+    history = get_proof.open_processed_history(json_path)
+    try:
+        assert len(history) == 2
+        assert history.get("antigo.pdf_100_1700000000.0")['nome'] == "antigo.pdf"
+        assert history.find_processed(pdf) == conteudo
+    finally:
+        history.close()
+
+
+def test_json_corrompido_nao_e_renomeado(tmp_path):
+    json_path = str(tmp_path / "pdfs_processados.json")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        f.write("{ quebrado")
+    
+    history = get_proof.open_processed_history(json_path)
+    try:
+        assert len(history) == 0
+    finally:
+        history.close()
+    assert os.path.exists(json_path)
+
+
+def test_pdf_migrado_editado_com_mesma_data_e_reprocessado(tmp_path, cenario):
+    pdf = os.path.join(cenario['pasta_pdfs'], "lote_000.pdf")
+    json_path = str(tmp_path / "pdfs_processados.json")
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({get_proof.get_pdf_fingerprint(pdf): {'nome': "lote_000.pdf"}}, f)
+    
+    history = get_proof.open_processed_history(json_path)
+    try:
+        assert history.find_processed(pdf) is not None
+        
+        # Arquivo editado e salvo de novo mantendo tamanho e data de modificação
+        # (o identificador antigo não muda)
+        stat = os.stat(pdf)
+        legado = get_proof.get_pdf_fingerprint(pdf)
+        with open(pdf, 'rb') as f:
+            dados = f.read()
+        with open(pdf + ".tmp", 'wb') as f:
+            f.write(dados.replace(b"%PDF-1.", b"%PDF-2.", 1))
+        os.replace(pdf + ".tmp", pdf)
+        os.utime(pdf, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert get_proof.get_pdf_fingerprint(pdf) == legado
+        
+        assert history.find_processed(pdf) is None
+    finally:
+        history.close()
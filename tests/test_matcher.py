@@ -0,0 +1,125 @@
+"""Motor de match (AccountMatcher) comparado com a busca por regex linha x página que ele substituiu"""
+import random
+import re
+
+import get_proof
+
+
+def _find_exact_number(number, text):
+    if not number or not text:
+        return False
+    pattern = r'(?<!\d)' + r'[\s\-\.]*'.join(number) + r'(?:[\s\-\.]*\d)?(?!\d)'
+    return re.search(pattern, text) is not None
+
+
+def regex_account_pages(conta, agencia, pages):
+    """Busca antiga (find_account_pages): conta, depois invertida, depois conta OU agência"""
+    conta_norm = get_proof.normalize_account(conta)
+    agencia_norm = get_proof.normalize_account(agencia)
+    if len(conta_norm) < 3 or len(agencia_norm) < 3:
+        return [], False
+    
+    def tem(numero, secao):
+        if _find_exact_number(numero, secao):
+            return True
+        return len(numero) > 4 and len(numero[:-1]) >= 4 and _find_exact_number(numero[:-1], secao)
+    
+    def secoes():
+        for num, secao in pages.items():
+            if secao and len(secao) >= 20:
+                yield num, secao
+    
+    found = [num for num, secao in secoes() if tem(conta_norm, secao)]
+    if found:
+        return found, False
+    if conta_norm != agencia_norm:
+        found = [num for num, secao in secoes() if tem(agencia_norm, secao)]
+        if found:
+            return found, True
+    return [num for num, secao in secoes() if tem(conta_norm, secao) or tem(agencia_norm, secao)], False
+
+
+def formatar(numero, rnd):
+    """Número como aparece no comprovante: DV separado por hífen/espaço, às vezes com pontos"""
+    corpo, dv = numero[:-1], numero[-1]
+    if rnd.random() < 0.3 and len(corpo) > 3:
+        corpo = corpo[:-3] + "." + corpo[-3:]
+    return corpo + rnd.choice(["-", " - ", " ", ""]) + dv
+
+
+def cenario_match(seed=11, linhas=150, paginas=80):
+    rnd = random.Random(seed)
+    contas = [(f"{rnd.randint(1, 9999):04d}", str(rnd.randint(10000, 9999999))) for _ in range(linhas)]
+    pages = {}
+    for num in range(paginas):
+        agencia, conta = rnd.choice(contas)
+        pages[num] = (f"Dados da conta creditada Nome: FULANO {num} Agencia: {agencia} "
+                      f"Conta corrente: {formatar(conta, rnd)} Valor: R$ 10,00")
+    pages[paginas] = "Pagina sem secao"
+    
+    entries = []
+    for agencia, conta in contas:
+        sorteio = rnd.random()
+        if sorteio < 0.2:
+            entries.append((agencia, conta))          # invertida na planilha
+        elif sorteio < 0.4:
+            entries.append((conta[:-1], agencia))     # conta sem dígito verificador
+        elif sorteio < 0.5:
+            entries.append((str(rnd.randint(10000, 9999999)), agencia))  # conta sem comprovante
+        else:
+            entries.append((conta, agencia))
+    return entries, pages
+
+
+def test_matcher_igual_a_busca_por_regex():
+    entries, secoes = cenario_match()
+    pages = {num: get_proof.PageRecord(None, credited_section=secao, texto_completo=False)
+             for num, secao in secoes.items()}
+    
+    resultado = get_proof.AccountMatcher(entries).match(pages)
+    
+    for idx, (conta, agencia) in enumerate(entries):
+        paginas, invertido = regex_account_pages(conta, agencia, secoes)
+        if paginas:
+            assert resultado[idx] == (sorted(paginas), invertido), (conta, agencia)
+        else:
+            assert idx not in resultado, (conta, agencia)
+
+
+def test_cenario_tem_invertidas_e_sem_dv():
+    entries, secoes = cenario_match()
+    pages = {num: get_proof.PageRecord(None, credited_section=secao, texto_completo=False)
+             for num, secao in secoes.items()}
+    resultado = get_proof.AccountMatcher(entries).match(pages)
+    
+    assert any(invertido for _, invertido in resultado.values())
+    assert len(resultado) < len(entries)
+
+
+def test_atribuicao_antecipada_confere_com_finish():
+    entries, secoes = cenario_match(seed=5)
+    # linhas repetidas/invertidas disputam as mesmas páginas
+    entries += [(agencia, conta) for conta, agencia in entries[:30]] + entries[30:50]
+    matcher = get_proof.AccountMatcher(entries)
+    assigner = get_proof.PageAssigner(matcher)
+    
+    antecipadas = {}
+    for num, secao in secoes.items():
+        dono = assigner.add_page(num, get_proof.PageRecord(None, credited_section=secao, texto_completo=False))
+        if dono is not None:
+            antecipadas[num] = dono
+    final = assigner.finish()
+    
+    dono_final = {p: idx for idx, paginas in final.items() for p in paginas}
+    assert antecipadas
+    assert len(antecipadas) < len(dono_final)
+    for num, dono in antecipadas.items():
+        assert dono_final[num] == dono
+    
+    # mesma atribuição do PDF inteiro: cada página fica com a primeira linha que a encontra
+    esperado = {}
+    for idx, (paginas, _) in sorted(matcher.match(
+            {n: get_proof.PageRecord(None, credited_section=s, texto_completo=False) for n, s in secoes.items()}).items()):
+        for p in paginas:
+            esperado.setdefault(p, idx)
+    assert dono_final == esperado
@@ -0,0 +1,75 @@
+"""Manifesto da pasta de saída (OutputManifest): reprocessar não regrava comprovantes iguais"""
+import os
+
+import get_proof
+
+
+def arquivos_pdf(pasta):
+    saida = {}
+    for raiz, _, nomes in os.walk(pasta):
+        for nome in nomes:
+            if nome.lower().endswith('.pdf'):
+                caminho = os.path.join(raiz, nome)
+                saida[os.path.relpath(caminho, pasta)] = os.stat(caminho).st_mtime_ns
+    return saida
+
+
+def test_reprocessar_nao_regrava_comprovantes_iguais(tmp_path, cenario, run_pipeline):
+    saida = str(tmp_path / "saida")
+    
+    primeiro, _ = run_pipeline(cenario['pasta_pdfs'], out_dir=saida)
+    gravados = arquivos_pdf(saida)
+    assert primeiro['extraidos'] > 0
+    assert primeiro['inalterados'] == 0
+    assert os.path.exists(os.path.join(saida, get_proof.OUTPUT_MANIFEST_NAME))
+    
+    segundo, _ = run_pipeline(cenario['pasta_pdfs'], out_dir=saida, force=True)
+    
+    assert segundo['inalterados'] == len(gravados)
+    # Nenhum _1/_2 novo e nenhum arquivo reescrito
+    assert arquivos_pdf(saida) == gravados
+
+
+def test_comprovante_alterado_na_pasta_e_regravado(tmp_path, cenario, run_pipeline):
+    saida = str(tmp_path / "saida")
+    run_pipeline(cenario['pasta_pdfs'], out_dir=saida)
+    gravados = arquivos_pdf(saida)
+    alterado = sorted(gravados)[0]
+    with open(os.path.join(saida, alterado), 'ab') as f:
+        f.write(b"\n% editado\n")
+    
+    segundo, _ = run_pipeline(cenario['pasta_pdfs'], out_dir=saida, force=True)
+    
+    assert segundo['inalterados'] == len(gravados) - 1
+    assert arquivos_pdf(saida).keys() == gravados.keys()
+    with open(os.path.join(saida, alterado), 'rb') as f:
+        assert not f.read().endswith(b"% editado\n")
+
+
+def test_linha_retirada_da_planilha_mantem_o_comprovante(tmp_path, cenario, roster):
+    saida = str(tmp_path / "saida")
+    
+    def processar(tabela, **opcoes):
+        history = get_proof.ProcessedHistory(str(tmp_path / "historico.sqlite"))
+        try:
+            return get_proof.ProcessingPipeline(cenario['pasta_pdfs'], saida, tabela, history,
+                                                log=lambda *a: None, **opcoes).run()
+        finally:
+            history.close()
+    
+    processar(roster)
+    gravados = arquivos_pdf(saida)
+    manifesto = get_proof.OutputManifest(saida)
+    entrada = next(iter(manifesto._entradas.values()))
+    retirada = entrada['nome']
+    
+    df, colunas = get_proof.load_roster(cenario['planilha'], log=lambda *a: None)
+    sem_linha = get_proof.compile_roster(df, colunas)
+    sem_linha = get_proof.RosterTable([e for e in sem_linha if e.nome_saida.lower() != retirada],
+                                      sem_linha.search_items)
+    processar(sem_linha, force=True)
+    
+    # O arquivo continua na pasta; só o manifesto deixa de apontar para ele
+    assert arquivos_pdf(saida) == gravados
+    assert os.path.exists(os.path.join(saida, entrada['arquivo']))
+    assert retirada not in {e['nome'] for e in get_proof.OutputManifest(saida)._entradas.values()}
@@ -0,0 +1,62 @@
+"""PageRecord: campos derivados calculados sob demanda, cache/pickle e modo só seção"""
+import pickle
+
+import get_proof
+
+
+TEXTO = ("Comprovante de transferencia\nPagador: EMPRESA EXEMPLO LTDA CNPJ 12.345.678/0001-90\n"
+         "Dados da conta creditada\nNome: JOÃO DA SILVA\nAgência: 0123\nConta corrente: 45.678 - 9\n"
+         "Valor: R$ 1.234,56\nAutenticação 998877")
+SEM_SECAO = "Extrato consolidado\nSaldo anterior 1.000,00\nConta 1234-5"
+
+
+def campos_antigos(text):
+    """Dicionário montado por extract_pdf_pages antes do PageRecord (tudo calculado na extração)"""
+    secao = get_proof.extract_credited_account_section(text)
+    return {
+        'text': text,
+        'numbers': get_proof.normalize_account(text),
+        'norm_text': get_proof.normalize_search_text(text),
+        'credited_section': secao,
+        'credited_numbers': get_proof.normalize_account(secao),
+        'credited_norm_text': get_proof.normalize_search_text(secao),
+    }
+
+
+def campos(page):
+    return {nome: getattr(page, nome) for nome in
+            ('text', 'numbers', 'norm_text', 'credited_section', 'credited_numbers', 'credited_norm_text')}
+
+
+def test_campos_calculados_no_primeiro_acesso():
+    page = get_proof.build_page_record(TEXTO, 'rapido')
+    assert page._numbers is None and page._norm_text is None
+    assert page._credited_numbers is None and page._credited_norm_text is None
+    
+    assert page.credited_numbers == "0123456789"
+    assert page._credited_numbers is not None
+    assert page._norm_text is None
+    
+    assert campos(page) == campos_antigos(TEXTO)
+    assert page.extrator == 'rapido'
+
+
+def test_cache_e_pickle_preservam_a_pagina():
+    for page in (get_proof.build_page_record(TEXTO, 'pdfplumber'),
+                 get_proof.build_page_record(TEXTO, texto_completo=False),
+                 get_proof.build_page_record(SEM_SECAO, texto_completo=False)):
+        for copia in (get_proof.PageRecord.from_cache(page.to_cache()), pickle.loads(pickle.dumps(page))):
+            assert campos(copia) == campos(page)
+            assert copia.extrator == page.extrator
+
+
+def test_modo_so_secao():
+    page = get_proof.build_page_record(TEXTO, texto_completo=False)
+    assert page.text is None
+    assert page.numbers == "" and page.norm_text == ""
+    assert page.credited_section == get_proof.extract_credited_account_section(TEXTO)
+    assert page.credited_numbers == campos_antigos(TEXTO)['credited_numbers']
+    
+    # Sem seção utilizável o texto inteiro fica (busca assistida)
+    sem_secao = get_proof.build_page_record(SEM_SECAO, texto_completo=False)
+    assert campos(sem_secao) == campos_antigos(SEM_SECAO)
@@ -0,0 +1,85 @@
+"""Divisão dos PDFs em faixas de páginas e fluxo de páginas (plan_page_chunks / iter_page_stream)"""
+import os
+
+import benchmark
+import get_proof
+
+
+def test_faixas_cobrem_cada_pagina_uma_vez():
+    docs = [(0, 35), (1, 1), (2, 1000), (3, 0)]
+    
+    chunks = get_proof.plan_page_chunks(docs, workers=4)
+    
+    for doc_id, total in docs:
+        paginas = [p for d, inicio, fim in chunks if d == doc_id for p in range(inicio, fim)]
+        assert paginas == list(range(total))
+    assert all(fim - inicio <= get_proof.MAX_PAGE_CHUNK for _, inicio, fim in chunks)
+
+
+def test_fluxo_paralelo_igual_ao_sequencial(cenario):
+    pdfs = [os.path.join(cenario['pasta_pdfs'], nome) for nome in sorted(os.listdir(cenario['pasta_pdfs']))]
+    
+    def paginas(workers):
+        return [(item[0], item[1], item[2], item[3].credited_section if item[0] == 'pagina' else item[3])
+                for item in get_proof.iter_page_stream(pdfs, workers=workers, extrator='rapido')]
+    
+    assert paginas(2) == paginas(1)
+
+
+def test_maiores_documentos_saem_na_frente():
+    docs = [(0, 20), (1, 20), (2, 600)]
+    chunks = get_proof.plan_page_chunks(docs, workers=2)
+    
+    adiantadas = get_proof.head_start_chunks(docs, chunks, limit=2)
+    
+    assert [d for d, _, _ in adiantadas] == [2, 2]
+    assert adiantadas == [c for c in chunks if c[0] == 2][:2]
+
+
+def test_fluxo_com_pdf_grande_no_fim(tmp_path, cenario):
+    grande = benchmark.generate_scenario(str(tmp_path / "grande"), 120, paginas_por_pdf=120, seed=3)
+    pdfs = [os.path.join(cenario['pasta_pdfs'], nome) for nome in sorted(os.listdir(cenario['pasta_pdfs']))]
+    pdfs.append(os.path.join(grande['pasta_pdfs'], "lote_000.pdf"))
+    
+    def paginas(workers):
+        return [(item[0], item[1], item[2]) for item in get_proof.iter_page_stream(pdfs, workers=workers,
+                                                                                   extrator='rapido')]
+    
+    assert paginas(3) == paginas(1)
+
+
+def test_refinamento_na_extracao_igual_ao_sequencial(cenario, roster):
+    pdfs = [os.path.join(cenario['pasta_pdfs'], nome) for nome in sorted(os.listdir(cenario['pasta_pdfs']))]
+    
+    def paginas(workers):
+        return [(item[1], item[2], item[3].extrator, item[3].credited_section)
+                for item in get_proof.iter_page_stream(pdfs, workers=workers, extrator='auto',
+                                                       matcher=roster.matcher()) if item[0] == 'pagina']
+    
+    sequencial = paginas(1)
+    assert any(extrator == 'pdfplumber' for _, _, extrator, _ in sequencial)
+    assert paginas(2) == sequencial
+
+
+def test_paginas_refeitas_ficam_no_cache(tmp_path, cenario, roster, monkeypatch):
+    pdf = os.path.join(cenario['pasta_pdfs'], "lote_000.pdf")
+    cache = get_proof.PageCache(str(tmp_path / "cache.sqlite"))
+    matcher = roster.matcher()
+    
+    primeira = dict(get_proof.iter_pdf_pages(pdf, cache=cache, extrator='auto', matcher=matcher))
+    refeitas = {n for n, page in primeira.items() if page.extrator == 'pdfplumber'}
+    assert refeitas
+    
+    # Segunda execução: só a leitura do cache, sem análise de layout
+    def nao_abrir(*args, **kwargs):
+        raise AssertionError("pdfplumber aberto com as páginas no cache")
+    monkeypatch.setattr(get_proof, 'PdfplumberDocument', nao_abrir)
+    segunda = dict(get_proof.iter_pdf_pages(pdf, cache=cache, extrator='auto', matcher=matcher))
+    assert {n for n, page in segunda.items() if page.extrator == 'pdfplumber'} == refeitas
+    
+    # Planilha diferente: só as páginas que ela deixa sem match são refeitas
+    monkeypatch.undo()
+    outra = get_proof.AccountMatcher([("1", "2")])
+    terceira = dict(get_proof.iter_pdf_pages(pdf, cache=cache, extrator='auto', matcher=outra))
+    assert all(page.extrator == 'pdfplumber' for page in terceira.values())
+    assert all(page.extrator == 'pdfplumber' for page in cache.get(pdf, 'auto').values())
@@ -0,0 +1,51 @@
+"""Reaplicar planilha (rematch): só os PDFs e comprovantes afetados pela planilha nova mudam"""
+import os
+
+import get_proof
+from test_output_manifest import arquivos_pdf
+
+
+def test_reaplicar_so_grava_o_pdf_afetado(tmp_path, cenario, roster):
+    saida = str(tmp_path / "saida")
+    cache = get_proof.PageCache(str(tmp_path / "cache_paginas.sqlite"))
+    mensagens = []
+    
+    def processar(tabela, **opcoes):
+        history = get_proof.ProcessedHistory(str(tmp_path / "historico.sqlite"))
+        try:
+            return get_proof.ProcessingPipeline(cenario['pasta_pdfs'], saida, tabela, history, page_cache=cache,
+                                                log=mensagens.append, **opcoes).run()
+        finally:
+            history.close()
+    
+    # Primeira execução sem uma linha da planilha; depois a linha volta e a planilha é reaplicada
+    primeiro = processar(roster)
+    manifesto = get_proof.OutputManifest(saida)
+    entrada = next(iter(manifesto._entradas.values()))
+    os.remove(os.path.join(saida, entrada['arquivo']))
+    os.remove(manifesto.path)
+    sem_linha = get_proof.RosterTable([e for e in roster if e.nome_saida.lower() != entrada['nome']],
+                                      roster.search_items)
+    processar(sem_linha, force=True)
+    gravados = arquivos_pdf(saida)
+    
+    mensagens.clear()
+    resumo = processar(roster, rematch=True)
+    
+    assert resumo['pdfs_reaplicados'] == primeiro['pdfs_processados'] == 2
+    assert resumo['pdfs_reextraidos'] == 0
+    assert resumo['pdfs_inalterados'] == 1
+    # Só o comprovante da linha de volta foi gravado; os demais arquivos não foram tocados
+    novos = arquivos_pdf(saida)
+    assert set(novos) - set(gravados) == {entrada['arquivo']}
+    assert {k: v for k, v in novos.items() if k in gravados} == gravados
+    afetado = next(p for p in resumo['pdfs'] if not p.get('inalterado'))
+    assert afetado['extraidos'] > 0
+    
+    # Sem o cache de páginas os PDFs são lidos de novo, com aviso
+    cache = get_proof.PageCache(str(tmp_path / "cache_vazio.sqlite"))
+    mensagens.clear()
+    resumo = processar(roster, rematch=True)
+    assert resumo['pdfs_reextraidos'] == 2
+    assert resumo['pdfs_inalterados'] == 2
+    assert sum("será extraído de novo" in m for m in mensagens) == 2
@@ -0,0 +1,97 @@
+"""compile_roster comparado com a leitura linha a linha (iterrows) que ele substituiu"""
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import get_proof
+
+
+COLUNAS = {'conta': 'Conta', 'agencia': 'Agencia', 'nome': 'Nome', 'ccusto': 'CCusto'}
+
+
+def linhas_por_iterrows(df, colunas):
+    """Leitura antiga da planilha em process(): uma linha de cada vez"""
+    conta_col, agencia_col = colunas['conta'], colunas['agencia']
+    nome_col, ccusto_col = colunas['nome'], colunas['ccusto']
+    todas = []
+    for row_idx, row in df.iterrows():
+        conta, agencia, nome, ccusto = row[conta_col], row[agencia_col], row[nome_col], row[ccusto_col]
+        if pd.isna(nome) or str(nome).strip() == '':
+            continue
+        if pd.isna(ccusto) or str(ccusto).strip() == '':
+            continue
+        conta_str = str(conta).strip() if not pd.isna(conta) and str(conta).strip() != '' else None
+        agencia_str = str(agencia).strip() if not pd.isna(agencia) and str(agencia).strip() != '' else None
+        if not conta_str or not agencia_str:
+            valores = []
+            for col_name in row.index:
+                if col_name in [nome_col, ccusto_col]:
+                    continue
+                valor = row[col_name]
+                if pd.isna(valor):
+                    continue
+                valor_str = str(valor).strip()
+                if valor_str and re.match(r'^[\d\-\.]+$', valor_str):
+                    if len(get_proof.normalize_account(valor_str)) >= 3:
+                        valores.append(valor_str)
+            if valores:
+                if not conta_str:
+                    conta_str = valores[0]
+                if not agencia_str:
+                    agencia_str = valores[1] if len(valores) > 1 else valores[0]
+        if not conta_str or not agencia_str:
+            continue
+        todas.append((row_idx, conta_str, agencia_str, str(nome).strip(), str(ccusto).strip()))
+    return todas
+
+
+def planilha_baguncada():
+    return pd.DataFrame({
+        'Nome': ['ANA', 'BRUNO', '  ', 'DANI', 'EDU', np.nan, 'GABI', 'HUGO', 'IVO', 'JU'],
+        'CCusto': ['ADM', 'TI', 'RH', np.nan, 'ADM', 'TI', 'RH', 'TI', 'ADM', 'RH'],
+        'Conta': ['12345-6', np.nan, '999', '4321', '', '777', ' 55.123-0 ', np.nan, 'abc', '1'],
+        'Agencia': ['0001', '0002', '0003', '0004', '0005', np.nan, '0007', np.nan, '0009', np.nan],
+        'Obs': ['x', '88888-1', '1', '2', '3-4.5', '6', '7', 'texto', '12', '45'],
+        'Extra': [np.nan, '0102', np.nan, '777', '66666', '1234', np.nan, np.nan, '9', '1-2-3'],
+    })
+
+
+def test_compile_roster_igual_a_iterrows():
+    df = planilha_baguncada()
+    roster = get_proof.compile_roster(df, COLUNAS)
+    
+    compiladas = [(e.linha, e.conta, e.agencia, e.nome, e.ccusto) for e in roster]
+    assert compiladas == linhas_por_iterrows(df, COLUNAS)
+    assert any(e.busca_alternativa for e in roster)
+    for e in roster:
+        assert e.conta_norm == get_proof.normalize_account(e.conta)
+        assert e.agencia_norm == get_proof.normalize_account(e.agencia)
+        assert e.nome_saida == f"{get_proof.clean_filename(e.ccusto)}_{get_proof.clean_filename(e.nome)}"
+
+
+def test_compile_roster_planilha_do_cenario(cenario):
+    df, colunas = get_proof.load_roster(cenario['planilha'], log=lambda *a: None)
+    roster = get_proof.compile_roster(df, colunas)
+    
+    compiladas = [(e.linha, e.conta, e.agencia, e.nome, e.ccusto) for e in roster]
+    assert compiladas == linhas_por_iterrows(df, colunas)
+
+
+def test_cache_da_planilha_guarda_uma_entrada_por_arquivo(tmp_path, cenario):
+    cache = get_proof.RosterCache(str(tmp_path / "cache_planilhas"))
+    (tmp_path / "cache_planilhas").mkdir()
+    (tmp_path / "cache_planilhas" / ("0" * 40 + ".pkl")).write_bytes(b"formato antigo")
+    planilha = cenario['planilha']
+    df, colunas = get_proof.load_roster(planilha, log=lambda *a: None)
+    
+    for _ in range(3):
+        cache.put(planilha, df, colunas)
+        assert cache.get(planilha) is not None
+        # Planilha salva de novo: a entrada anterior deixa de valer e é substituída
+        os.utime(planilha, ns=(os.stat(planilha).st_atime_ns, os.stat(planilha).st_mtime_ns + 10**9))
+        assert cache.get(planilha) is None
+    
+    assert len(os.listdir(tmp_path / "cache_planilhas")) == 1
+
@@ -0,0 +1,168 @@
+"""Índice da busca assistida (SearchIndex): atualização incremental e nomes aproximados"""
+import os
+
+import benchmark
+import get_proof
+
+
+def comprovante(nome, conta="12345-6"):
+    return benchmark.layout_padrao({'nome': nome, 'agencia': "0001", 'conta': conta, 'valor': "100,00",
+                                    'autenticacao': "0" * 32})
+
+
+def termos(index):
+    with index._connect() as conn:
+        return {termo for (termo,) in conn.execute("SELECT termo FROM termos")}
+
+
+def test_termos_orfaos_saem_do_indice(tmp_path):
+    pasta = tmp_path / "pdfs"
+    pasta.mkdir()
+    a, b = str(pasta / "a.pdf"), str(pasta / "b.pdf")
+    benchmark.write_pdf(a, [comprovante("ANA BEATRIZ SILVA")])
+    benchmark.write_pdf(b, [comprovante("CARLOS EDUARDO SILVA")])
+    index = get_proof.SearchIndex(str(tmp_path / "indice.sqlite"))
+    
+    assert index.update([a, b]) == 2
+    assert {"BEATRIZ", "EDUARDO", "SILVA"} <= termos(index)
+    
+    # PDF alterado: os termos que só ele tinha somem do índice de trigramas
+    benchmark.write_pdf(b, [comprovante("CARLOS ROBERTO SILVA")])
+    os.utime(b, ns=(1, 1))
+    assert index.update([a, b]) == 1
+    assert "EDUARDO" not in termos(index)
+    assert "ROBERTO" in termos(index)
+    
+    # PDF removido da pasta
+    os.remove(b)
+    assert index.prune(str(pasta), [a]) == 1
+    assert "ROBERTO" not in termos(index) and "CARLOS" not in termos(index)
+    assert {"BEATRIZ", "SILVA"} <= termos(index)
+    with index._connect() as conn:
+        orfaos = conn.execute("SELECT COUNT(*) FROM termo_trigramas WHERE termo_id NOT IN "
+                              "(SELECT id FROM termos)").fetchone()[0]
+    assert orfaos == 0
+
+
+def test_pdf_sem_alteracao_nao_e_reindexado(tmp_path):
+    pdf = str(tmp_path / "a.pdf")
+    benchmark.write_pdf(pdf, [comprovante("ANA BEATRIZ SILVA")])
+    index = get_proof.SearchIndex(str(tmp_path / "indice.sqlite"))
+    
+    assert index.update([pdf]) == 1
+    assert index.update([pdf]) == 0
+    os.utime(pdf, ns=(1, 1))  # só a data mudou: o hash do conteúdo confirma
+    assert index.update([pdf]) == 0
+
+
+def test_nome_com_erro_de_digitacao(tmp_path):
+    pdf = str(tmp_path / "a.pdf")
+    benchmark.write_pdf(pdf, [comprovante("JOAO DA SILVA"), comprovante("MARIA SOUZA", conta="777")])
+    index = get_proof.SearchIndex(str(tmp_path / "indice.sqlite"))
+    index.update([pdf])
+    
+    resultado = index.search([pdf], "", "JOAO SYLVA", ["JOAO", "SYLVA"])
+    
+    paginas = {pagina: nota for _, pagina, _, _, _, nota in resultado}
+    assert 0.75 <= paginas[0] < 1.0
+    assert paginas.get(1, 0.0) == 0.0
+
+
+class _Var:
+    def __init__(self, valor):
+        self.valor = valor
+    
+    def get(self):
+        return self.valor
+
+
+def busca_assistida(tmp_path, pasta, index):
+    """Objeto mínimo com o que App.flexible_search usa (sem abrir a janela)"""
+    app = get_proof.App.__new__(get_proof.App)
+    app.pdf_folder_var = _Var(str(pasta))
+    app.extrator_var = _Var('auto')
+    app.page_cache = get_proof.PageCache(str(tmp_path / "cache.sqlite"))
+    app.search_index = index
+    app.write_log = lambda *a: None
+    return app
+
+
+def test_busca_sem_fts5_percorre_os_pdfs(tmp_path):
+    pasta = tmp_path / "pdfs"
+    pasta.mkdir()
+    benchmark.write_pdf(str(pasta / "a.pdf"), [comprovante("JOAO DA SILVA", "52938-2"), comprovante("MARIA SOUZA")])
+    com_indice = busca_assistida(tmp_path, pasta, get_proof.SearchIndex(str(tmp_path / "indice.sqlite")))
+    sem_indice = busca_assistida(tmp_path, pasta, get_proof.SearchIndex(str(tmp_path / "indice.sqlite")))
+    sem_indice.search_index.enabled = False
+    
+    esperado = com_indice.flexible_search("52938-2", "JOAO DA SILVA", "CC")
+    resultado = sem_indice.flexible_search("52938-2", "JOAO DA SILVA", "CC")
+    
+    assert esperado and resultado == esperado
+    assert resultado[0]['page'] == 0 and "Conta exata" in resultado[0]['criteria']
+
+
+def test_termos_curtos_nao_percorrem_outras_pastas(tmp_path):
+    pasta, outra = tmp_path / "pdfs", tmp_path / "outra"
+    pasta.mkdir()
+    outra.mkdir()
+    pdf, fora = str(pasta / "a.pdf"), str(outra / "b.pdf")
+    benchmark.write_pdf(pdf, [comprovante("LI WU", "12")])
+    benchmark.write_pdf(fora, [comprovante("LI WU", "12")])
+    index = get_proof.SearchIndex(str(tmp_path / "indice.sqlite"))
+    index.update([pdf, fora])
+    
+    # Só termos curtos: todas as páginas dos PDFs pedidos, e só deles
+    assert [(c, p) for c, p, *_ in index.search([pdf], "12", "LI WU", [])] == [(os.path.abspath(pdf), 0)]
+    # Termo curto ("DA") junto de termos longos: as candidatas vêm só dos termos longos
+    resultado = index.search([pdf, fora], "12", "LI DA SILVA", ["SILVA"])
+    assert resultado == []
+
+
+def test_pipeline_alimenta_o_indice(tmp_path, cenario, run_pipeline, roster, monkeypatch):
+    index = get_proof.SearchIndex(str(tmp_path / "indice.sqlite"))
+    resumo, _ = run_pipeline(cenario['pasta_pdfs'], search_index=index)
+    assert resumo['pdfs_processados'] == 2
+    
+    # A busca assistida não extrai de novo os PDFs que o processamento já indexou
+    def nao_extrair(*args, **kwargs):
+        raise AssertionError("PDF extraído de novo")
+    monkeypatch.setattr(get_proof, 'iter_pdf_pages', nao_extrair)
+    pdfs = [os.path.join(cenario['pasta_pdfs'], nome) for nome in sorted(os.listdir(cenario['pasta_pdfs']))]
+    assert index.update(pdfs) == 0
+    
+    funcionario = roster.search_items[0]
+    nome = get_proof.normalize_search_text(funcionario['nome'])
+    resultado = index.search(pdfs, get_proof.normalize_account(funcionario['conta']), nome, nome.split())
+    assert any(nome in texto_norm for _, _, _, texto_norm, _, _ in resultado)
+
+
+def busca_fora_da_secao(index, pdfs):
+    # O pagador só aparece fora da seção creditada
+    return index.search(pdfs, "", "EMPRESA EXEMPLO", ["EMPRESA", "EXEMPLO"])
+
+
+def test_pipeline_indexa_a_pagina_inteira(tmp_path, cenario, run_pipeline):
+    index = get_proof.SearchIndex(str(tmp_path / "indice.sqlite"))
+    run_pipeline(cenario['pasta_pdfs'], search_index=index)
+    pdfs = [os.path.join(cenario['pasta_pdfs'], nome) for nome in sorted(os.listdir(cenario['pasta_pdfs']))]
+    
+    # Mesmo resultado de um índice montado pela janela de busca (update)
+    pela_janela = get_proof.SearchIndex(str(tmp_path / "indice_janela.sqlite"))
+    pela_janela.update(pdfs)
+    resultado = busca_fora_da_secao(index, pdfs)
+    assert len(resultado) >= cenario['paginas'] - 2
+    assert resultado == busca_fora_da_secao(pela_janela, pdfs)
+
+
+def test_pdf_indexado_com_paginas_recortadas_e_completado(tmp_path, cenario, run_pipeline):
+    index = get_proof.SearchIndex(str(tmp_path / "indice.sqlite"))
+    run_pipeline(cenario['pasta_pdfs'], search_index=index, extrator='pdfplumber',
+                 layout_templates=get_proof.LayoutTemplates())
+    pdfs = [os.path.join(cenario['pasta_pdfs'], nome) for nome in sorted(os.listdir(cenario['pasta_pdfs']))]
+    
+    # Páginas recortadas pelos modelos só têm a seção: a janela indexa de novo a página inteira
+    assert all(index.needs_update(pdf, 'pdfplumber') for pdf in pdfs)
+    assert not any(index.needs_update(pdf, 'pdfplumber', completo=False) for pdf in pdfs)
+    assert index.update(pdfs, extrator='pdfplumber') == 2
+    assert len(busca_fora_da_secao(index, pdfs)) >= cenario['paginas'] - 2
@@ -0,0 +1,57 @@
+"""Comprovantes sem funcionário na planilha, analisados no mesmo passo da extração"""
+import glob
+import os
+
+import benchmark
+import get_proof
+
+
+def segundo_passo(pasta, roster, contas):
+    """Análise antiga: reabre cada PDF e confere as páginas que não casaram com a planilha"""
+    esperado = []
+    for pdf_path in sorted(glob.glob(os.path.join(pasta, "*.pdf"))):
+        pages = get_proof.extract_pdf_pages(pdf_path)
+        com_match = {p for paginas, _ in roster.matcher().match(pages).values() for p in paginas}
+        for page_num, page_data in sorted(pages.items()):
+            if page_num in com_match:
+                continue
+            item = get_proof.ProcessingPipeline.check_unmatched_page(
+                None, contas, os.path.basename(pdf_path), page_num, page_data)
+            if item:
+                esperado.append(item)
+    return esperado
+
+
+def terceiro(nome, agencia, conta):
+    return {'nome': nome, 'agencia': agencia, 'conta': conta, 'valor': "100,00", 'autenticacao': "AB" * 16}
+
+
+def test_candidatos_iguais_ao_segundo_passo(cenario, roster, run_pipeline):
+    # Comprovantes de quem não está na planilha, misturados com os do cenário
+    benchmark.write_pdf(os.path.join(cenario['pasta_pdfs'], "terceiros.pdf"), [
+        benchmark.layout_padrao(terceiro("FULANO DE TAL", "0456", "45678-9")),
+        benchmark.layout_sem_secao(terceiro("", "", "")),
+        benchmark.layout_rodape(terceiro("BELTRANO", "7788", "123456-0")),
+        benchmark.layout_padrao(terceiro("CONTA LONGA", "0456", "12345678-9")),
+    ])
+    
+    resumo, _ = run_pipeline(cenario['pasta_pdfs'])
+    
+    esperado = segundo_passo(cenario['pasta_pdfs'], roster, roster.account_sets())
+    chave = lambda c: (c['pdf'], c['pagina'])
+    assert {chave(c) for c in esperado} >= {("terceiros.pdf", 1), ("terceiros.pdf", 3)}
+    assert sorted(resumo['nao_encontrados'], key=chave) == sorted(esperado, key=chave)
+    assert resumo['sem_funcionario'] == len(esperado)
+
+
+def test_pdfs_ja_processados_nao_sao_reabertos(tmp_path, cenario, run_pipeline, monkeypatch):
+    historico = str(tmp_path / "historico.sqlite")
+    run_pipeline(cenario['pasta_pdfs'], history=get_proof.ProcessedHistory(historico))
+    
+    def nao_extrair(*args, **kwargs):
+        raise AssertionError("PDF já processado foi reaberto")
+    monkeypatch.setattr(get_proof, 'extract_page_range', nao_extrair)
+    monkeypatch.setattr(get_proof, 'iter_pdf_pages', nao_extrair)
+    
+    resumo, _ = run_pipeline(cenario['pasta_pdfs'], history=get_proof.ProcessedHistory(historico))
+    assert resumo.get('nao_encontrados', []) == []
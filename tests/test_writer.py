@@ -0,0 +1,34 @@
+"""Estágio de gravação: um comprovante de várias páginas não é regravado a cada página"""
+import os
+from collections import Counter
+
+import PyPDF2
+
+import get_proof
+
+
+def test_comprovante_de_varias_paginas_gravado_uma_vez(tmp_path, cenario, run_pipeline, monkeypatch):
+    pasta = tmp_path / "pdfs"
+    pasta.mkdir()
+    origem = PyPDF2.PdfReader(os.path.join(cenario['pasta_pdfs'], sorted(os.listdir(cenario['pasta_pdfs']))[0]))
+    writer = PyPDF2.PdfWriter()
+    for num in [0, 0, 0, 0, 1, 2, 2]:
+        writer.add_page(origem.pages[num])
+    with open(pasta / "varias_paginas.pdf", 'wb') as f:
+        writer.write(f)
+    
+    gravacoes = Counter()
+    write_output = get_proof.SplitSession.write_output
+    
+    def contar(self, page_numbers, output_path, *args, **kwargs):
+        gravacoes[os.path.basename(output_path)] += 1
+        return write_output(self, page_numbers, output_path, *args, **kwargs)
+    
+    monkeypatch.setattr(get_proof.SplitSession, 'write_output', contar)
+    resumo, _ = run_pipeline(str(pasta))
+    
+    assert resumo['extraidos'] == 7
+    assert sorted(gravacoes.values()) == [1, 1, 1]
+    paginas = sorted(len(PyPDF2.PdfReader(os.path.join(raiz, nome)).pages)
+                     for raiz, _, nomes in os.walk(tmp_path / "saida") for nome in nomes if nome.endswith('.pdf'))
+    assert paginas == [1, 2, 4]